@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse
+from PIL import Image, UnidentifiedImageError
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+
+from auth_system import AuthSystem
+from caption_pipeline import CaptionPipeline
+from rate_limits import RateLimitExceeded, RateLimiter
+from session_tokens import SessionManager
+
+
+# Bounded inference: API_WORKERS threads (default: the tuned concurrency), and at most
+# API_MAX_PENDING requests waiting for one before new requests get 503
+API_WORKERS = int(os.environ.get("API_WORKERS", 0)) or None
+API_MAX_PENDING = int(os.environ.get("API_MAX_PENDING", 32))
+API_MAX_UPLOAD_MB = float(os.environ.get("API_MAX_UPLOAD_MB", 20))
+API_MAX_BATCH = int(os.environ.get("API_MAX_BATCH", 16))
+# Room for multipart boundaries and part headers on top of the image bytes
+MULTIPART_OVERHEAD = 64 * 1024
+
+LENGTHS = ("short", "medium", "long")
+STYLES = ("descriptive", "creative", "poetic", "humorous", "professional")
+TONES = ("neutral", "casual", "formal", "enthusiastic", "mysterious")
+
+
+class InferenceExecutor:
+    """Runs blocking pipeline calls on a fixed thread pool with a bounded wait queue.
+
+    Requests beyond workers + max_pending are rejected immediately with 503 so a burst
+    cannot pile up unbounded work (and memory) behind the models. Admission is separate
+    from running so callers can be refused before they spend anything else, such as
+    rate-limit tokens.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-inference")
+        # Only touched from the event loop thread, so a plain counter is enough
+        self._in_flight = 0
+
+    @contextmanager
+    def admitted(self, count=1):
+        """Hold count slots for the block, or raise 503 if that would exceed workers + max_pending"""
+        if self._in_flight + count > self.workers + self.max_pending:
+            raise HTTPException(503, "Server busy, retry shortly", headers={"Retry-After": "2"})
+        self._in_flight += count
+        try:
+            yield
+        finally:
+            self._in_flight -= count
+
+    async def call(self, fn, *args, **kwargs):
+        """Run fn on the pool; the caller holds a slot from admitted()"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, lambda: fn(*args, **kwargs))
+
+    async def run(self, fn, *args, **kwargs):
+        with self.admitted():
+            return await self.call(fn, *args, **kwargs)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    auth = AuthSystem()
+    app.state.auth = auth
+    app.state.sessions = SessionManager(auth, ttl=8 * 3600)
+    app.state.pipeline = CaptionPipeline()
+    app.state.limiter = RateLimiter()
+    workers = API_WORKERS or app.state.pipeline.tuner.profile["concurrency"]
+    app.state.executor = InferenceExecutor(workers, API_MAX_PENDING)
+    try:
+        yield
+    finally:
+        app.state.executor.shutdown()
+        app.state.pipeline.models.stop()
+        app.state.limiter.close()
+        auth.close()
+
+
+app = FastAPI(title="Image Caption AI", version="1", lifespan=lifespan)
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limited(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        {"detail": str(exc), "action": exc.action, "reason": exc.reason, "retry_after": exc.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def current_user(request: Request):
+    """Username from an X-API-Key header or an "Authorization: Bearer <session token>" header"""
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        username = request.app.state.auth.verify_api_key(api_key)
+    else:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        username = request.app.state.sessions.username_for(token) if scheme.lower() == "bearer" else None
+    if not username:
+        raise HTTPException(401, "Invalid or missing credentials", headers={"WWW-Authenticate": "Bearer"})
+    return username
+
+
+async def run_limited(request, username, action, fn, *args, cost=1, **kwargs):
+    """Take cost requests from the user's bucket for action, then run fn on the inference
+    executor with its time charged to the user's daily quota.
+
+    The executor admits the request first, so a 503 never costs the user a token.
+    """
+    limiter = request.app.state.limiter
+    executor = request.app.state.executor
+
+    def measured():
+        with limiter.measure(username, action):
+            return fn(*args, **kwargs)
+
+    with executor.admitted():
+        await asyncio.to_thread(limiter.acquire, username, action, cost)
+        return await executor.call(measured)
+
+
+def _too_large(max_bytes):
+    return HTTPException(413, f"Upload larger than {max_bytes / (1024 * 1024):.0f} MB")
+
+
+def _open_image(data):
+    if not data:
+        raise HTTPException(400, "Empty upload")
+    if len(data) > API_MAX_UPLOAD_MB * 1024 * 1024:
+        raise HTTPException(413, f"Image larger than {API_MAX_UPLOAD_MB:g} MB")
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(415, "Unsupported or corrupt image")
+    return image.convert("RGB")
+
+
+async def read_body(request, max_bytes):
+    """The request body, refused with 413 from its Content-Length or as soon as more
+    than max_bytes have arrived, without buffering the rest"""
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise _too_large(max_bytes)
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise _too_large(max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def read_images(request, field="file", max_files=1):
+    """Images from a multipart upload (every part named field) or from the raw request body"""
+    max_image = int(API_MAX_UPLOAD_MB * 1024 * 1024)
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        body = await read_body(request, max_files * max_image + MULTIPART_OVERHEAD)
+
+        async def replay():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        form = await Request(request.scope, replay).form()
+        uploads = form.getlist(field)
+        if not uploads:
+            raise HTTPException(400, f"Multipart upload needs a '{field}' part")
+        if not all(isinstance(upload, UploadFile) for upload in uploads):
+            raise HTTPException(400, f"'{field}' must be a file upload, not a text field")
+        if len(uploads) > max_files:
+            raise HTTPException(413, f"At most {max_files} images per request")
+        return [_open_image(await upload.read()) for upload in uploads]
+    return [_open_image(await read_body(request, max_image))]
+
+
+def caption_preferences(length: str = "medium", style: str = "descriptive", tone: str = "neutral",
+                        emojis: bool = True, hashtags: bool = False):
+    """Caption preferences from query parameters, with the same options as the UI"""
+    for name, value, allowed in (("length", length, LENGTHS), ("style", style, STYLES), ("tone", tone, TONES)):
+        if value.lower() not in allowed:
+            raise HTTPException(422, f"{name} must be one of: {', '.join(allowed)}")
+    return {
+        'length': length.lower(),
+        'style': style.lower(),
+        'tone': tone.lower(),
+        'emojis': emojis,
+        'hashtags': hashtags
+    }
+
+
+def _caption_response(result):
+    return {
+        "caption": result["caption"],
+        "text_content": result["text_content"],
+        "candidates": result["base_captions"],
+        "cached": result["cached"],
+        "timings": result["timings"],
+    }
+
+
+class TokenRequest(BaseModel):
+    username: str
+    password: str
+
+
+class TranslateRequest(BaseModel):
+    text: str
+    target_lang: str
+
+
+class SpeechRequest(BaseModel):
+    text: str
+    lang: str = "en"
+    slow: bool = False
+
+
+@app.get("/healthz")
+async def healthz(request: Request):
+    return {"status": "ok", "models": request.app.state.pipeline.models.status()}
+
+
+@app.get("/v1/usage")
+async def usage(request: Request, day: str = None, username: str = Depends(current_user)):
+    """Per-user request counts, throttling and compute seconds for a day (admins see every user)"""
+    limiter = request.app.state.limiter
+    day = day or limiter.today()
+    rows = await asyncio.to_thread(limiter.usage, day, None if username in limiter.admins else username)
+    return {"day": day, "usage": rows, "limits": limiter.limits}
+
+
+@app.post("/v1/token")
+async def issue_token(body: TokenRequest, request: Request):
+    """Exchange a username and password for a session token (sent back as a Bearer token)"""
+    auth = request.app.state.auth
+    # Password hashing is deliberately slow; the KDF runs on the hasher pool while we await it
+    success, message = await asyncio.wrap_future(auth.login_user_async(body.username, body.password))
+    if not success:
+        raise HTTPException(401, message)
+    username = body.username.strip().lower()
+    sessions = request.app.state.sessions
+    return {"token": sessions.issue(username), "token_type": "bearer", "expires_in": sessions.ttl}
+
+
+@app.post("/v1/caption")
+async def caption(request: Request, candidates: bool = False, username: str = Depends(current_user),
+                  preferences: dict = Depends(caption_preferences)):
+    """Caption one image (multipart 'file' part or raw image bytes)"""
+    image = (await read_images(request))[0]
+    try:
+        result = await run_limited(
+            request, username, "caption", request.app.state.pipeline.caption, image, preferences,
+            candidates=candidates, owner=username
+        )
+    except (HTTPException, RateLimitExceeded):
+        raise
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Error generating caption: {e}")
+    return _caption_response(result)
+
+
+@app.post("/v1/caption/batch")
+async def caption_batch(request: Request, candidates: bool = False, username: str = Depends(current_user),
+                        preferences: dict = Depends(caption_preferences)):
+    """Caption several images uploaded as multipart 'files' parts; results keep upload order"""
+    images = await read_images(request, field="files", max_files=API_MAX_BATCH)
+    executor = request.app.state.executor
+    pipeline = request.app.state.pipeline
+    limiter = request.app.state.limiter
+    def measured(image):
+        with limiter.measure(username, "caption"):
+            return pipeline.caption(image, preferences, candidates=candidates, owner=username)
+
+    # The whole batch is admitted or refused at once, one executor slot and one token per
+    # image, with executor admission first so a 503 takes no tokens; a batch larger than
+    # the caption bucket could never be admitted, so it is refused outright
+    with executor.admitted(len(images)):
+        try:
+            await asyncio.to_thread(limiter.acquire, username, "caption", len(images))
+        except ValueError:
+            capacity = limiter.limits["caption"]["capacity"]
+            raise HTTPException(413, f"At most {capacity:g} images per batch under the caption rate limit")
+        results = await asyncio.gather(*(executor.call(measured, image) for image in images),
+                                       return_exceptions=True)
+    items = []
+    for result in results:
+        if isinstance(result, HTTPException):
+            items.append({"error": result.detail, "status": result.status_code})
+        elif isinstance(result, Exception):
+            items.append({"error": f"Error generating caption: {result}", "status": 500})
+        else:
+            items.append(_caption_response(result))
+    return {"results": items}
+
+
+@app.post("/v1/ocr")
+async def ocr(request: Request, username: str = Depends(current_user)):
+    """Text found in one image (multipart 'file' part or raw image bytes)"""
+    image = (await read_images(request))[0]
+    text = await run_limited(request, username, "ocr", request.app.state.pipeline.extract_text, image)
+    return {"text": text}
+
+
+@app.post("/v1/translate")
+async def translate(body: TranslateRequest, request: Request, username: str = Depends(current_user)):
+    """Translate English text into target_lang"""
+    try:
+        text = await run_limited(request, username, "translate", request.app.state.pipeline.translate,
+                                 body.text, body.target_lang)
+    except (HTTPException, RateLimitExceeded):
+        raise
+    except Exception as e:
+        raise HTTPException(502, f"Translation failed: {e}")
+    return {"text": text, "target_lang": body.target_lang}
+
+
+@app.post("/v1/tts")
+async def tts(body: SpeechRequest, request: Request, username: str = Depends(current_user)):
+    """Speak text; responds with the audio file (MP3 from gTTS, WAV from the offline engines)"""
+    try:
+        path = await run_limited(request, username, "tts", request.app.state.pipeline.synthesize,
+                                 body.text, body.lang, body.slow)
+    except (HTTPException, RateLimitExceeded):
+        raise
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    except Exception as e:
+        raise HTTPException(502, f"Error generating speech in '{body.lang}': {e}")
+    media_type = "audio/wav" if str(path).endswith(".wav") else "audio/mpeg"
+    return FileResponse(path, media_type=media_type, background=BackgroundTask(os.unlink, path))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the captioning pipeline over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--create-key", metavar="USERNAME", help="print a new API key for USERNAME and exit")
+    parser.add_argument("--revoke-key", metavar="USERNAME", help="disable USERNAME's API key and exit")
+    args = parser.parse_args()
+    if args.create_key or args.revoke_key:
+        auth = AuthSystem()
+        if args.create_key:
+            success, message = auth.create_api_key(args.create_key)
+        else:
+            success, message = auth.revoke_api_key(args.revoke_key)
+        auth.close()
+        print(message)
+        raise SystemExit(0 if success else 1)
+    # One worker process: models, OCR readers and caches are per process
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -1,50 +1,66 @@
-import json
 import hashlib
+import hmac
 import os
-from pathlib import Path
+import secrets
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 
+from password_hashing import PasswordHasher
+from user_store import BatchedUpdateWriter, create_user_store
+
 class AuthSystem:
     """Authentication system for user login and registration"""
     
-    def __init__(self):
-        self.users_file = Path("users.json")
+    def __init__(self, store=None, batch_login_writes=True, hasher=None, hash_profile_path=None):
+        # Pluggable backend: SQLite by default, legacy users.json via USER_STORE_BACKEND=json
+        self.store = store if store is not None else create_user_store()
+        # Salted scrypt/PBKDF2 with cost parameters calibrated for this deployment
+        self.hasher = hasher if hasher is not None else PasswordHasher(profile_path=hash_profile_path)
+        # last_login bumps are buffered and written in batches off the request path
+        self.login_writer = BatchedUpdateWriter(self.store) if batch_login_writes else None
+        self._change_listeners = []
         self.initialize_users()
     
+    def add_change_listener(self, callback):
+        """Register callback(username) to run whenever a user's profile changes"""
+        self._change_listeners.append(callback)
+    
+    def _notify_change(self, username):
+        for callback in self._change_listeners:
+            try:
+                callback(username)
+            except Exception as e:
+                print(f"Error in user change listener: {e}")
+    
     def initialize_users(self):
-        """Initialize users file with default admin account"""
-        if not self.users_file.exists():
-            default_users = {
-                "admin": {
-                    "password": self.hash_password("12345"),
-                    "created_at": datetime.now().isoformat(),
-                    "last_login": None
-                }
-            }
-            self.save_users(default_users)
+        """Initialize user store with default admin account"""
+        if self.store.count() == 0:
+            self.store.add("admin", {
+                "password": self.hash_password("12345"),
+                "created_at": datetime.now().isoformat(),
+                "last_login": None
+            })
     
     def hash_password(self, password):
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with a per-user salt using the calibrated KDF"""
+        return self.hasher.hash(password)
     
-    def load_users(self):
-        """Load users from JSON file"""
-        try:
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading users: {e}")
-            return {}
-    
-    def save_users(self, users):
-        """Save users to JSON file"""
-        try:
-            with open(self.users_file, 'w') as f:
-                json.dump(users, f, indent=2)
-            return True
-        except Exception as e:
-            print(f"Error saving users: {e}")
+    def verify_password(self, username, user, password):
+        """Check a password, upgrading legacy or outdated hashes on success"""
+        if not self.hasher.verify(password, user["password"]):
             return False
+        self._rehash_if_needed(username, user, password)
+        return True
+    
+    def _rehash_if_needed(self, username, user, password):
+        if self.hasher.needs_rehash(user["password"]):
+            self.store.update(username, {"password": self.hash_password(password)})
+    
+    def load_users(self):
+        """Load all users from the store"""
+        return self.store.all_users()
     
     def register_user(self, username, password):
         """Register a new user"""
@@ -59,60 +75,86 @@ class AuthSystem:
         username = username.strip().lower()
         
         # Check if username already exists
-        users = self.load_users()
-        if username in users:
+        if self.store.exists(username):
             return False, "Username already exists"
         
         # Add new user
-        users[username] = {
+        saved = self.store.add(username, {
             "password": self.hash_password(password),
             "created_at": datetime.now().isoformat(),
             "last_login": None
-        }
+        })
         
-        if self.save_users(users):
+        if saved:
+            self._notify_change(username)
             return True, "Registration successful! You can now login."
+        elif self.store.exists(username):
+            return False, "Username already exists"
         else:
             return False, "Error saving user data"
     
     def login_user(self, username, password):
         """Authenticate user login"""
+        return self.login_user_async(username, password).result()
+    
+    def login_user_async(self, username, password):
+        """Future resolving to login_user()'s (success, message).
+        
+        The password check runs on the hasher's pool, so an event loop can await it
+        with asyncio.wrap_future() instead of holding a thread for the KDF.
+        """
+        result = Future()
         if not username or not password:
-            return False, "Please enter both username and password"
+            result.set_result((False, "Please enter both username and password"))
+            return result
         
         username = username.strip().lower()
-        users = self.load_users()
+        user = self.store.get(username)
         
         # Check if user exists
-        if username not in users:
-            return False, "Invalid username or password"
-        
-        # Verify password
-        if users[username]["password"] != self.hash_password(password):
-            return False, "Invalid username or password"
+        if user is None:
+            result.set_result((False, "Invalid username or password"))
+            return result
         
-        # Update last login
-        users[username]["last_login"] = datetime.now().isoformat()
-        self.save_users(users)
+        def finish(verified):
+            try:
+                if not verified.result():
+                    result.set_result((False, "Invalid username or password"))
+                    return
+                self._rehash_if_needed(username, user, password)
+                
+                # Update last login
+                login_update = {"last_login": datetime.now().isoformat()}
+                if self.login_writer is not None:
+                    self.login_writer.submit(username, login_update)
+                else:
+                    self.store.update(username, login_update)
+                result.set_result((True, f"Welcome back, {username}!"))
+            except Exception as e:
+                result.set_exception(e)
         
-        return True, f"Welcome back, {username}!"
+        # Verify password
+        self.hasher.verify_async(password, user["password"]).add_done_callback(finish)
+        return result
     
     def get_user_info(self, username):
         """Get user information"""
-        users = self.load_users()
-        if username in users:
-            user_data = users[username].copy()
+        user_data = self.store.get(username)
+        if user_data is not None:
+            if self.login_writer is not None:
+                user_data.update(self.login_writer.pending(username))
             user_data.pop('password', None)  # Don't return password
+            user_data.pop('api_key_sha256', None)
             return user_data
         return None
     
     def change_password(self, username, old_password, new_password):
         """Change user password"""
         username = username.strip().lower()
-        users = self.load_users()
+        user = self.store.get(username)
         
         # Verify old password
-        if username not in users or users[username]["password"] != self.hash_password(old_password):
+        if user is None or not self.hasher.verify(old_password, user["password"]):
             return False, "Current password is incorrect"
         
         # Validate new password
@@ -120,14 +162,112 @@ class AuthSystem:
             return False, "New password must be at least 4 characters long"
         
         # Update password
-        users[username]["password"] = self.hash_password(new_password)
-        
-        if self.save_users(users):
+        if self.store.update(username, {"password": self.hash_password(new_password)}):
+            self._notify_change(username)
             return True, "Password changed successfully!"
         else:
             return False, "Error updating password"
     
+    def create_api_key(self, username):
+        """Issue a new API key for programmatic access, replacing any previous one.
+        
+        The key is "<username>.<secret>"; only a SHA-256 of the secret is stored, so the
+        key is shown once and cannot be recovered later.
+        """
+        username = username.strip().lower()
+        if not self.store.exists(username):
+            return False, "User not found"
+        secret = secrets.token_urlsafe(32)
+        digest = hashlib.sha256(secret.encode()).hexdigest()
+        if self.store.update(username, {"api_key_sha256": digest}):
+            self._notify_change(username)
+            return True, f"{username}.{secret}"
+        return False, "Error saving API key"
+    
+    def verify_api_key(self, api_key):
+        """Username owning the API key, or None"""
+        try:
+            username, secret = api_key.rsplit(".", 1)
+        except (AttributeError, ValueError):
+            return None
+        user = self.store.get(username)
+        stored = user.get("api_key_sha256") if user else None
+        if not stored:
+            return None
+        if not hmac.compare_digest(stored, hashlib.sha256(secret.encode()).hexdigest()):
+            return None
+        return username
+    
+    def revoke_api_key(self, username):
+        """Disable the user's API key"""
+        username = username.strip().lower()
+        if self.store.update(username, {"api_key_sha256": None}):
+            self._notify_change(username)
+            return True, "API key revoked"
+        return False, "User not found"
+    
     def get_all_users(self):
         """Get list of all usernames (for admin purposes)"""
-        users = self.load_users()
-        return list(users.keys())
+        return self.store.usernames()
+    
+    def close(self):
+        """Flush buffered login metadata and release the store"""
+        if self.login_writer is not None:
+            self.login_writer.close()
+        self.store.close()
+
+
+def benchmark_logins(store, num_users=200, num_logins=20000, num_threads=8):
+    """Measure login throughput through the batched writer and check no last_login update is lost"""
+    # Cheap KDF settings so the benchmark measures the store path, not password hashing
+    cheap_hasher = PasswordHasher({"algorithm": "pbkdf2_sha256", "params": {"iterations": 1000}})
+    auth = AuthSystem(store=store, hasher=cheap_hasher)
+    usernames = [f"bench_user_{i}" for i in range(num_users)]
+    for name in usernames:
+        auth.register_user(name, "bench-pass")
+    
+    latest = {}
+    latest_lock = threading.Lock()
+    
+    def worker(offset):
+        for i in range(offset, num_logins, num_threads):
+            name = usernames[i % num_users]
+            success, message = auth.login_user(name, "bench-pass")
+            if not success:
+                raise RuntimeError(message)
+            with latest_lock:
+                latest[name] = auth.login_writer.pending(name).get("last_login", latest.get(name))
+    
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(num_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    auth.login_writer.close()
+    
+    stored = auth.store.all_users()
+    lost = [name for name in usernames if stored[name]["last_login"] is None]
+    stale = [name for name in usernames if latest.get(name) and stored[name]["last_login"] < latest[name]]
+    return {
+        "logins": num_logins,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(num_logins / elapsed),
+        "batches_written": auth.login_writer.batches_written,
+        "lost_updates": len(lost) + len(stale),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from user_store import JsonUserStore, SQLiteUserStore
+    
+    backend = sys.argv[1] if len(sys.argv) > 1 else "sqlite"
+    with tempfile.TemporaryDirectory() as tmp:
+        if backend == "json":
+            bench_store = JsonUserStore(os.path.join(tmp, "users.json"))
+        else:
+            bench_store = SQLiteUserStore(os.path.join(tmp, "users.db"))
+        print(benchmark_logins(bench_store))
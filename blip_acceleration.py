@@ -0,0 +1,208 @@
+import argparse
+import os
+import statistics
+import time
+
+
+BATCH_BUCKETS = (1, 2, 4, 8)
+
+# Same decoding settings as the app's caption path
+GENERATE_KWARGS = dict(
+    max_length=100,
+    min_length=10,
+    num_beams=8,
+    length_penalty=0.8,
+    early_stopping=True,
+    no_repeat_ngram_size=3,
+    num_return_sequences=1,
+)
+
+
+def bucket_for(batch_size, buckets=BATCH_BUCKETS):
+    """Smallest static batch size that fits, so the compiled encoder never sees a new shape"""
+    for bucket in buckets:
+        if batch_size <= bucket:
+            return bucket
+    return batch_size
+
+
+class AcceleratedBlip:
+    """Optional compiled execution for BLIP captioning with a safe eager fallback.
+
+    mode (or CAPTION_ACCELERATION):
+      "compile" - torch.compile (inductor on CPU) of the vision encoder with static
+                  shapes and of the text decoder step with dynamic shapes, so the
+                  growing KV cache of each decode step reuses one graph;
+      "trace"   - TorchScript trace of the vision encoder only (decode stays eager);
+      "off"     - plain eager PyTorch.
+    The processor always resizes to the same resolution, so image inputs only vary
+    by batch size; compiled/traced batches are padded up to one of `buckets` (the app only needs 1,
+    batch callers pass BATCH_BUCKETS) and each bucket is compiled once in warm_up(). Any failure during setup restores the eager forwards.
+    """
+
+    def __init__(self, processor, model, mode=None, buckets=(1,)):
+        self.processor = processor
+        self.model = model
+        self.mode = mode or os.environ.get("CAPTION_ACCELERATION", "off")
+        self.buckets = tuple(buckets)
+        self.active_mode = "off"
+        self.fallback_reason = None
+        self.warm_up_seconds = 0.0
+        self._originals = {}
+
+    def _image_size(self):
+        size = getattr(self.processor.image_processor, "size", None) or {}
+        return size.get("height", 384), size.get("width", 384)
+
+    def _dummy_pixels(self, batch_size):
+        import torch
+        height, width = self._image_size()
+        return torch.zeros(batch_size, 3, height, width)
+
+    def _patch(self, module, forward):
+        self._originals[module] = module.forward
+        module.forward = forward
+
+    def _restore(self):
+        for module, forward in self._originals.items():
+            module.forward = forward
+        self._originals.clear()
+
+    def _apply_compile(self):
+        import torch
+        if not hasattr(torch, "compile"):
+            raise RuntimeError("torch.compile requires torch >= 2.0")
+        vision, decoder = self.model.vision_model, self.model.text_decoder
+        self._patch(vision, torch.compile(vision.forward, backend="inductor", dynamic=False))
+        # Sequence length and KV-cache length change every step; dynamic=True keeps one graph
+        self._patch(decoder, torch.compile(decoder.forward, backend="inductor", dynamic=True))
+
+    def _apply_trace(self):
+        import torch
+        from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+        vision = self.model.vision_model
+
+        class _VisionTuple(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, pixel_values):
+                out = self.inner(pixel_values=pixel_values, return_dict=True)
+                return out.last_hidden_state, out.pooler_output
+
+        traced = {}
+        for bucket in self.buckets:
+            traced[bucket] = torch.jit.trace(_VisionTuple(vision).eval(), self._dummy_pixels(bucket), check_trace=False)
+
+        def forward(pixel_values=None, **kwargs):
+            # A trace is specialised to its example shape; unknown batch sizes run eager
+            runner = traced.get(pixel_values.shape[0])
+            if runner is None:
+                return self._originals[vision](pixel_values=pixel_values, **kwargs)
+            last_hidden_state, pooler_output = runner(pixel_values)
+            return BaseModelOutputWithPooling(last_hidden_state=last_hidden_state, pooler_output=pooler_output)
+
+        self._patch(vision, forward)
+
+    def warm_up(self):
+        """Compile/trace once and run one generate per bucket; falls back to eager on any error"""
+        import torch
+
+        self.model.eval()
+        if self.mode == "off":
+            return self
+        start = time.perf_counter()
+        try:
+            with torch.no_grad():
+                if self.mode == "compile":
+                    self._apply_compile()
+                elif self.mode == "trace":
+                    self._apply_trace()
+                else:
+                    raise ValueError(f"Unknown acceleration mode '{self.mode}'")
+                for bucket in self.buckets:
+                    self.model.generate(pixel_values=self._dummy_pixels(bucket), **GENERATE_KWARGS)
+            self.active_mode = self.mode
+        except Exception as e:
+            self._restore()
+            self.active_mode = "off"
+            self.fallback_reason = f"{type(e).__name__}: {e}"
+            print(f"BLIP {self.mode} unavailable, using eager mode ({self.fallback_reason})")
+        self.warm_up_seconds = time.perf_counter() - start
+        return self
+
+    def generate(self, images, **overrides):
+        """Captions for a list of RGB PIL images; compiled/traced paths pad the batch to a warmed-up bucket"""
+        import torch
+
+        kwargs = dict(GENERATE_KWARGS, **overrides)
+        inputs = self.processor(images=list(images), return_tensors="pt")
+        pixel_values = inputs["pixel_values"]
+        count = pixel_values.shape[0]
+        bucket = bucket_for(count, self.buckets)
+        # Eager forwards take any batch size, so padding would only add wasted work
+        if bucket > count and self.active_mode != "off":
+            padding = pixel_values[-1:].expand(bucket - count, *pixel_values.shape[1:])
+            pixel_values = torch.cat([pixel_values, padding])
+        with torch.no_grad():
+            out = self.model.generate(pixel_values=pixel_values, **kwargs)
+        per_image = kwargs.get("num_return_sequences", 1)
+        return self.processor.batch_decode(out[: count * per_image], skip_special_tokens=True)
+
+
+def benchmark(sample_dir="sample_images", mode="compile", runs=3, limit=4):
+    """Per-caption latency on CPU, eager vs the accelerated path, for the sample images"""
+    from pathlib import Path
+    from PIL import Image
+    from model_artifacts import ArtifactStore, load_blip
+
+    store = ArtifactStore()
+    if store.has("blip"):
+        processor, model = load_blip(store)
+    else:
+        from transformers import BlipForConditionalGeneration, BlipProcessor
+        model_id = "Salesforce/blip-image-captioning-base"
+        processor = BlipProcessor.from_pretrained(model_id)
+        model = BlipForConditionalGeneration.from_pretrained(model_id)
+    images = [
+        Image.open(p).convert("RGB")
+        for p in sorted(Path(sample_dir).iterdir())
+        if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp")
+    ][:limit]
+
+    def measure(runner):
+        runner.generate(images[:1])
+        latencies = []
+        for _ in range(runs):
+            for image in images:
+                start = time.perf_counter()
+                runner.generate([image])
+                latencies.append(time.perf_counter() - start)
+        return statistics.median(latencies), runner.generate(images[:1])[0]
+
+    eager = AcceleratedBlip(processor, model, mode="off").warm_up()
+    eager_latency, eager_caption = measure(eager)
+    accelerated = AcceleratedBlip(processor, model, mode=mode).warm_up()
+    fast_latency, fast_caption = measure(accelerated)
+    return {
+        "mode": accelerated.active_mode,
+        "fallback_reason": accelerated.fallback_reason,
+        "warm_up_seconds": round(accelerated.warm_up_seconds, 2),
+        "eager_p50_seconds": round(eager_latency, 3),
+        "accelerated_p50_seconds": round(fast_latency, 3),
+        "speedup": round(eager_latency / fast_latency, 2),
+        "same_caption": eager_caption == fast_caption,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark compiled vs eager BLIP captioning on CPU")
+    parser.add_argument("--mode", choices=["compile", "trace"], default="compile")
+    parser.add_argument("--samples", default="sample_images")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=4)
+    args = parser.parse_args()
+    for key, value in benchmark(args.samples, args.mode, args.runs, args.limit).items():
+        print(f"{key:26s} {value}")
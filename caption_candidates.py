@@ -0,0 +1,93 @@
+import re
+
+
+NUM_CANDIDATES = 4
+
+# Diverse (group) beam search: 8 beams in 4 groups, one returned sequence per group
+DIVERSE_GENERATE_KWARGS = dict(
+    max_length=100,
+    min_length=10,
+    num_beams=8,
+    num_beam_groups=NUM_CANDIDATES,
+    diversity_penalty=0.8,
+    num_return_sequences=NUM_CANDIDATES,
+    length_penalty=0.8,
+    early_stopping=True,
+    no_repeat_ngram_size=3,
+)
+
+# BLIP artefacts that read badly whatever the preferences
+_ARTEFACTS = re.compile(r"\b(arafed|araffe|arafe|there is|there are)\b")
+_WORD = re.compile(r"[a-z']+")
+
+# Preferred word counts for each length setting
+_LENGTH_TARGETS = {"short": 7, "medium": 12, "long": 18}
+_VIVID_WORDS = frozenset(
+    "colorful bright vibrant beautiful golden sunny dark large small old young red blue green yellow "
+    "white black orange purple pink smiling standing sitting walking running flying".split()
+)
+
+
+def generate_candidates(model, inputs, num_candidates=NUM_CANDIDATES):
+    """Several different base captions from one generate call.
+
+    Uses group beam search; transformers versions that no longer ship it (or reject the
+    arguments) fall back to ordinary beam search returning the top beams, which are
+    less diverse but still come from the same single decode.
+    """
+    import torch
+
+    kwargs = dict(DIVERSE_GENERATE_KWARGS, num_beam_groups=num_candidates, num_return_sequences=num_candidates)
+    with torch.no_grad():
+        try:
+            return model.generate(**inputs, **kwargs)
+        except (ValueError, TypeError, NotImplementedError) as e:
+            print(f"Diverse beam search unavailable, using plain beam search: {e}")
+            kwargs.pop("num_beam_groups")
+            kwargs.pop("diversity_penalty")
+            return model.generate(**inputs, **kwargs)
+
+
+def unique_captions(captions):
+    """Drop empty and case/punctuation duplicates, keeping decode order"""
+    seen = set()
+    result = []
+    for caption in captions:
+        key = " ".join(_WORD.findall(caption.lower()))
+        if key and key not in seen:
+            seen.add(key)
+            result.append(caption.strip())
+    return result
+
+
+def score(caption, preferences, rank=0):
+    """Cheap fit of a base caption to the selected length/style/tone (higher is better).
+
+    rank is the candidate's position in the decode, a weak prior for model confidence.
+    """
+    words = _WORD.findall(caption.lower())
+    if not words:
+        return float("-inf")
+    preferences = preferences or {}
+    target = _LENGTH_TARGETS.get(preferences.get("length", "medium"), 12)
+    total = -abs(len(words) - target) / target
+    total -= 0.5 * len(_ARTEFACTS.findall(caption.lower()))
+    # Repeated words make every style read worse
+    total -= 0.3 * (len(words) - len(set(words))) / len(words)
+    vivid = sum(word in _VIVID_WORDS for word in words) / len(words)
+    style = preferences.get("style", "descriptive")
+    tone = preferences.get("tone", "neutral")
+    if style in ("creative", "poetic") or tone == "enthusiastic":
+        total += 1.5 * vivid
+    elif style == "professional" or tone == "formal":
+        total -= 1.0 * vivid
+    if style == "descriptive":
+        # More distinct content words = more detail
+        total += 0.02 * len({word for word in words if len(word) > 3})
+    return total - 0.05 * rank
+
+
+def rerank(candidates, preferences):
+    """Candidates sorted best-first for the preferences"""
+    order = sorted(range(len(candidates)), key=lambda i: score(candidates[i], preferences, i), reverse=True)
+    return [candidates[i] for i in order]
@@ -0,0 +1,517 @@
+import contextlib
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from transformers import BlipForConditionalGeneration, BlipProcessor
+
+from blip_acceleration import AcceleratedBlip
+from caption_candidates import generate_candidates, rerank, unique_captions
+from image_dedup import PerceptualImageIndex, content_hash
+from image_enhance import enhance_for_caption
+from language_engines import SpeechRouter, TranslationRouter
+from model_artifacts import ArtifactStore, load_blip as load_pinned_blip
+from model_lifecycle import ModelManager, from_pretrained_mmap
+from ocr_pool import OCRReaderPool
+from ocr_voting import read_text_detect_once
+from runtime_tuning import RuntimeTuner
+from text_processing import OCR_SINGLE_CHARS, capitalize_sentences, clean_text_for_speech, compose_caption, normalize_ocr_key, tidy_ocr_text
+
+
+def load_blip_model():
+    """BLIP processor and model: pinned local artifacts when present, otherwise the hub"""
+    store = ArtifactStore()
+    if store.has("blip"):
+        # Pinned, checksum-verified copy; works offline and shares mapped weights across processes
+        processor, model = load_pinned_blip(store)
+    else:
+        # Use the base model which is lighter and faster for deployment
+        # The large model (1.9GB) often causes memory issues on free cloud tiers
+        model_id = "Salesforce/blip-image-captioning-base"
+        processor = BlipProcessor.from_pretrained(model_id)
+        model = from_pretrained_mmap(BlipForConditionalGeneration, model_id)
+    # CAPTION_ACCELERATION=compile|trace compiles once here; falls back to eager on failure
+    AcceleratedBlip(processor, model).warm_up()
+    return processor, model
+
+def preprocess_image_for_ocr(image):
+    """Advanced image preprocessing for better OCR accuracy with multiple strategies"""
+    try:
+        # Convert PIL to OpenCV format
+        img_array = np.array(image)
+        
+        # Convert to grayscale
+        if len(img_array.shape) == 3:
+            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        else:
+            gray = img_array
+        
+        # Apply multiple preprocessing techniques for best results
+        processed_images = []
+        
+        # 1. Original grayscale with slight denoising
+        denoised_gray = cv2.fastNlMeansDenoising(gray, None, h=5, templateWindowSize=7, searchWindowSize=21)
+        processed_images.append(denoised_gray)
+        
+        # 2. Adaptive thresholding - excellent for varying lighting
+        adaptive_thresh = cv2.adaptiveThreshold(
+            denoised_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        )
+        processed_images.append(adaptive_thresh)
+        
+        # 3. OTSU thresholding - great for bimodal images
+        _, otsu_thresh = cv2.threshold(denoised_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        processed_images.append(otsu_thresh)
+        
+        # 4. Morphological operations for text clarity
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+        morph = cv2.morphologyEx(otsu_thresh, cv2.MORPH_CLOSE, kernel)
+        processed_images.append(morph)
+        
+        # 5. CLAHE for contrast enhancement
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        enhanced = clahe.apply(denoised_gray)
+        processed_images.append(enhanced)
+        
+        # 6. Bilateral filter for edge-preserving smoothing
+        bilateral = cv2.bilateralFilter(gray, 9, 75, 75)
+        processed_images.append(bilateral)
+        
+        # 7. Sharpening for better text edges
+        kernel_sharpen = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+        sharpened = cv2.filter2D(enhanced, -1, kernel_sharpen)
+        processed_images.append(sharpened)
+        
+        return processed_images
+    except Exception as e:
+        # Return original if preprocessing fails
+        return [np.array(image)]
+
+# Index of the CLAHE-enhanced variant in preprocess_image_for_ocr: faint text gives the strongest detector response there
+OCR_DETECT_VARIANT = 4
+
+def extract_text_from_image(image, reader, slot=contextlib.nullcontext):
+    """Enhanced text extraction with multiple preprocessing strategies and intelligent filtering - Completely FREE
+    
+    slot is a context-manager factory held around the OCR passes (e.g. RuntimeTuner.inference_slot).
+    """
+    try:
+        if reader is None:
+            return ""
+        
+        # Get multiple preprocessed versions
+        processed_images = preprocess_image_for_ocr(image)
+        
+        if os.environ.get("OCR_MODE", "detect_once") == "detect_once" and len(processed_images) > OCR_DETECT_VARIANT:
+            try:
+                # Detect on the CLAHE variant, recognize the crops of every variant, vote per region
+                with slot():
+                    items = read_text_detect_once(reader, processed_images[OCR_DETECT_VARIANT], processed_images)
+                return tidy_ocr_text(' '.join(text for _, text, _ in items))
+            except Exception as detect_once_error:
+                print(f"Detect-once OCR failed, running full OCR per variant: {detect_once_error}")
+        
+        all_texts = []
+        confidence_scores = []
+        bboxes = []
+        
+        # Try OCR on each preprocessed version (one inference slot for all passes)
+        with slot():
+            for proc_img in processed_images:
+                try:
+                    results = reader.readtext(proc_img, detail=1, paragraph=False)  # Get confidence scores
+                
+                    for (bbox, text, confidence) in results:
+                        # Only keep high-confidence detections (>0.25 threshold for better recall)
+                        cleaned_text = text.strip()
+                        if confidence > 0.25 and len(cleaned_text) > 0:
+                            # Filter out single characters unless they're common letters/numbers
+                            if len(cleaned_text) == 1 and cleaned_text.lower() not in OCR_SINGLE_CHARS:
+                                continue
+                            all_texts.append(cleaned_text)
+                            confidence_scores.append(confidence)
+                            bboxes.append(bbox)
+                except Exception as ocr_error:
+                    continue
+        
+        if not all_texts:
+            return ""
+        
+        # Advanced deduplication: Remove duplicates while preserving highest confidence
+        seen = {}
+        for text, conf, bbox in zip(all_texts, confidence_scores, bboxes):
+            # Normalize text for comparison (case-insensitive, remove special chars)
+            normalized = normalize_ocr_key(text)
+            if not normalized:
+                continue
+            
+            # Keep the version with highest confidence
+            if normalized not in seen or seen[normalized]['confidence'] < conf:
+                seen[normalized] = {
+                    'text': text,
+                    'confidence': conf,
+                    'bbox': bbox
+                }
+        
+        # Sort by confidence and spatial position (top-to-bottom, left-to-right)
+        unique_items = sorted(seen.values(), key=lambda x: x['confidence'], reverse=True)
+        
+        # Extract top results
+        unique_texts = [item['text'] for item in unique_items[:15]]  # Top 15 most confident
+        
+        # Combine texts, clean spacing and fix common OCR errors
+        return tidy_ocr_text(' '.join(unique_texts))
+    except Exception as e:
+        return ""
+
+def enhance_caption(base_caption, preferences):
+    """Enhance the base caption based on user preferences"""
+    caption = base_caption.strip()
+    
+    # Adjust length
+    if preferences['length'] == 'short':
+        # Keep it concise
+        words = caption.split()
+        caption = ' '.join(words[:8])
+    elif preferences['length'] == 'long':
+        # Add more descriptive elements
+        descriptors = [
+            "This image captures",
+            "Here we see",
+            "The photograph shows",
+            "This scene depicts",
+            "We observe"
+        ]
+        caption = f"{random.choice(descriptors)} {caption}"
+    
+    # Adjust style
+    if preferences['style'] == 'creative':
+        creative_starts = ["Behold,", "Witness,", "Imagine,", "Picture this:"]
+        caption = f"{random.choice(creative_starts)} {caption}"
+    elif preferences['style'] == 'poetic':
+        caption = f"In this moment, {caption.lower()}, creating a scene of pure beauty"
+    elif preferences['style'] == 'humorous':
+        humorous_additions = [
+            " - and yes, it's as cool as it looks!",
+            " - living its best life!",
+            " - absolutely vibing!",
+            " - main character energy!"
+        ]
+        caption = f"{caption}{random.choice(humorous_additions)}"
+    elif preferences['style'] == 'professional':
+        caption = f"Professional documentation: {caption}"
+    
+    # Adjust tone
+    if preferences['tone'] == 'enthusiastic':
+        caption = caption + "!"
+    elif preferences['tone'] == 'mysterious':
+        caption = caption + "..."
+    
+    # Add emojis if requested
+    if preferences['emojis']:
+        emoji_sets = {
+            'default': ['✨', '🌟', '💫', '⭐', '🎨', '📸', '🖼️'],
+            'nature': ['🌿', '🌸', '🌺', '🌻', '🍃', '🌲'],
+            'happy': ['😊', '😄', '🥰', '💖', '❤️'],
+            'cool': ['😎', '🔥', '💯', '👌', '✌️']
+        }
+        selected_emojis = random.sample(emoji_sets['default'], 2)
+        caption = f"{selected_emojis[0]} {caption} {selected_emojis[1]}"
+    
+    # Add hashtags if requested
+    if preferences['hashtags']:
+        words = caption.lower().split()
+        hashtags = ['#' + word.strip('.,!?:;') for word in words if len(word) > 4][:3]
+        if hashtags:
+            caption = f"{caption}\n\n{' '.join(hashtags)} #AI #ImageCaption"
+    
+    return caption
+
+def stream_base_caption(inputs, processor, model, on_token):
+    """Greedy decode with a token streamer (streamers do not support beam search)"""
+    from transformers import TextIteratorStreamer
+    
+    streamer = TextIteratorStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    outputs = {}
+    
+    def run():
+        try:
+            # no_grad is thread-local, so it has to be entered in the generating thread
+            with torch.no_grad():
+                outputs['ids'] = model.generate(
+                    **inputs,
+                    max_length=100,
+                    min_length=10,
+                    num_beams=1,
+                    no_repeat_ngram_size=3,
+                    streamer=streamer
+                )
+        except Exception as e:
+            outputs['error'] = e
+            streamer.end()
+    
+    worker = threading.Thread(target=run, name="blip-token-stream", daemon=True)
+    worker.start()
+    partial = ""
+    for piece in streamer:
+        partial += piece
+        on_token(partial)
+    worker.join()
+    if 'error' in outputs:
+        raise outputs['error']
+    return processor.decode(outputs['ids'][0], skip_special_tokens=True)
+
+def caption_inputs(image, processor):
+    """Enhanced and preprocessed BLIP inputs for an RGB image"""
+    # Enhanced image preprocessing for better caption generation: brightness, sharpness,
+    # contrast and colour in one pass on the image already downscaled to the model input
+    # size (CAPTION_ENHANCE=pil restores the four full-resolution ImageEnhance passes)
+    try:
+        size = processor.image_processor.size
+        enhanced_image = enhance_for_caption(image, (size["width"], size["height"]))
+    except Exception as enhance_error:
+        enhanced_image = image
+    
+    # Process image for caption with enhanced version
+    return processor(enhanced_image, return_tensors="pt")
+
+def generate_base_caption(image, processor, model, on_token=None, slot=contextlib.nullcontext):
+    """Run BLIP on an RGB image (with light enhancement) and return the raw caption.
+    
+    With on_token, decoding is greedy and the partial caption is passed to on_token as it grows.
+    """
+    inputs = caption_inputs(image, processor)
+    
+    if on_token is not None:
+        with slot():
+            return stream_base_caption(inputs, processor, model, on_token)
+    
+    # Generate base caption with optimized parameters for maximum quality
+    with slot(), torch.no_grad():  # Reduce memory usage
+        out = model.generate(
+            **inputs, 
+            max_length=100,  # Increased for more detailed captions
+            min_length=10,   # Ensure minimum detail
+            num_beams=8,     # Higher beam search for better quality
+            length_penalty=0.8,  # Slightly prefer longer captions
+            early_stopping=True,
+            no_repeat_ngram_size=3,  # Avoid repetition more strictly
+            num_return_sequences=1,
+            temperature=0.7  # Add some creativity
+        )
+    
+    return processor.decode(out[0], skip_special_tokens=True)
+
+def generate_caption_candidates(image, processor, model, slot=contextlib.nullcontext):
+    """Several distinct base captions from a single diverse beam-search decode"""
+    inputs = caption_inputs(image, processor)
+    with slot():
+        out = generate_candidates(model, inputs)
+    return unique_captions(processor.batch_decode(out, skip_special_tokens=True))
+
+def caption_for_preferences(base_captions, extracted_text, preferences):
+    """(caption, text_content) from the base caption that best fits the preferences"""
+    best = rerank(base_captions, preferences)[0]
+    base_caption, text_content = compose_caption(best, extracted_text)
+    caption = enhance_caption(base_caption, preferences) if preferences else base_caption
+    return caption, text_content
+
+class CaptionPipeline:
+    """The captioning, OCR, translation and speech stack without any UI.
+    
+    One instance per process holds the model manager, thread budget, near-duplicate
+    index and language engines; the Streamlit app and the HTTP API both call into it.
+    """
+    
+    def __init__(self, tuner=None, image_index=None):
+        self.tuner = tuner or RuntimeTuner().apply()
+        self.models = ModelManager()
+        self.models.register("blip", load_blip_model)
+        # EasyOCR readers per script group (OCR_SCRIPTS): loaded lazily by the pool, which
+        # evicts recognizers under its own OCR_POOL_MEMORY_MB budget; the manager's reaper
+        # unloads idle readers (and the detector) after the same MODEL_IDLE_TTL as BLIP
+        self.ocr_pool = OCRReaderPool(idle_ttl=self.models.idle_ttl)
+        self.models.add_idle_hook(self.ocr_pool.unload_idle)
+        self.image_index = image_index or PerceptualImageIndex()
+        # Runs OCR alongside BLIP decoding so the caption does not wait for the OCR passes
+        self.ocr_executor = ThreadPoolExecutor(max_workers=self.tuner.profile["concurrency"], thread_name_prefix="ocr")
+        self._routers_lock = threading.Lock()
+        self._translation_router = None
+        self._speech_router = None
+    
+    @property
+    def translation_router(self):
+        """Translation engines (Google online, MarianMT offline); local models stay warm once loaded"""
+        with self._routers_lock:
+            if self._translation_router is None:
+                self._translation_router = TranslationRouter()
+            return self._translation_router
+    
+    @property
+    def speech_router(self):
+        """Speech engines (gTTS online, espeak-ng/pyttsx3 offline) with per-language fallback"""
+        with self._routers_lock:
+            if self._speech_router is None:
+                self._speech_router = SpeechRouter()
+                if os.environ.get("CAPTION_AI_OFFLINE") == "1":
+                    self._speech_router.warm_up("en")
+            return self._speech_router
+    
+    def load_model(self):
+        """(processor, model), loading BLIP on demand"""
+        return self.models.get("blip")
+    
+    def load_ocr_reader(self, image=None):
+        """EasyOCR reader; for the script detected in image when several OCR_SCRIPTS are configured"""
+        pool = self.ocr_pool
+        if image is not None:
+            return pool.reader_for(image)
+        return pool.get_script(pool.scripts[0])
+    
+    def extract_text(self, image, reader=None):
+        """OCR text of an image ("" when there is none)"""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        reader = reader or self.load_ocr_reader(image)
+        return extract_text_from_image(image, reader, self.tuner.inference_slot)
+    
+    def caption(self, image, preferences=None, candidates=False, on_progress=None, stream_tokens=False,
+                ocr_wait=contextlib.nullcontext, owner=None):
+        """Caption an image with BLIP + OCR, reusing owner's stored results for near-duplicates.
+        
+        Returns a dict with caption, base_captions, extracted_text, text_content,
+        fingerprint, cached and timings (time_to_first_caption, total_seconds).
+        on_progress(text) receives the base caption as soon as it is decoded (and the
+        partial caption per token with stream_tokens); ocr_wait() is entered while
+        waiting for the background OCR to finish. Without an owner the index is not used.
+        """
+        start = time.perf_counter()
+        timings = {'time_to_first_caption': None, 'total_seconds': None, 'streamed_tokens': bool(stream_tokens)}
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        
+        # Near-duplicates of this user's earlier images reuse the stored caption; the OCR
+        # text only when the pixels are identical
+        fingerprint = self.image_index.fingerprint(image)
+        digest = content_hash(image) if owner else None
+        known = self.image_index.lookup(fingerprint=fingerprint, owner=owner, digest=digest)
+        
+        if known:
+            base_caption = known['base_caption']
+            base_captions = known.get('candidates') or [base_caption]
+            timings['time_to_first_caption'] = time.perf_counter() - start
+            if known['exact']:
+                extracted_text = known['extracted_text']
+            else:
+                if on_progress and base_caption:
+                    on_progress(capitalize_sentences(base_caption))
+                with ocr_wait():
+                    try:
+                        extracted_text = self.extract_text(image)
+                    except Exception as e:
+                        print(f"OCR initialization warning: {e}")
+                        extracted_text = ""
+                self.image_index.add(
+                    base_caption=base_caption,
+                    extracted_text=extracted_text,
+                    fingerprint=fingerprint,
+                    candidates=known.get('candidates'),
+                    owner=owner,
+                    digest=digest
+                )
+        else:
+            processor, model = self.load_model()
+            try:
+                ocr_reader = self.load_ocr_reader(image)
+            except Exception as e:
+                # A missing OCR model should not cost the caption
+                print(f"OCR initialization warning: {e}")
+                ocr_reader = None
+            
+            def report_partial(partial):
+                if 'time_to_first_token' not in timings:
+                    timings['time_to_first_token'] = time.perf_counter() - start
+                on_progress(capitalize_sentences(partial))
+            
+            on_token = report_partial if stream_tokens and on_progress else None
+            
+            # BLIP takes its inference slot before OCR is queued: with a single slot (hosts
+            # under 4 CPUs) OCR runs after the caption instead of delaying it, and with more
+            # slots the two overlap
+            with self.tuner.inference_slot():
+                ocr_future = self.ocr_executor.submit(extract_text_from_image, image, ocr_reader, self.tuner.inference_slot)
+                if candidates and on_token is None:
+                    base_captions = generate_caption_candidates(image, processor, model)
+                    base_caption = rerank(base_captions, preferences)[0] if base_captions else ""
+                else:
+                    base_caption = generate_base_caption(image, processor, model, on_token)
+                    base_captions = [base_caption]
+            timings['time_to_first_caption'] = time.perf_counter() - start
+            if on_progress and base_caption:
+                on_progress(capitalize_sentences(base_caption))
+            
+            with ocr_wait():
+                extracted_text = ocr_future.result()
+            
+            if base_caption:
+                self.image_index.add(
+                    base_caption=base_caption,
+                    extracted_text=extracted_text,
+                    fingerprint=fingerprint,
+                    candidates=base_captions if len(base_captions) > 1 else None,
+                    owner=owner,
+                    digest=digest
+                )
+        
+        if candidates and base_captions:
+            caption, text_content = caption_for_preferences(base_captions, extracted_text, preferences)
+        else:
+            # Capitalize and intelligently combine caption with extracted text if available
+            base_caption, text_content = compose_caption(base_caption, extracted_text)
+            caption = enhance_caption(base_caption, preferences) if preferences else base_caption
+        
+        timings['total_seconds'] = time.perf_counter() - start
+        return {
+            'caption': caption,
+            'base_captions': base_captions,
+            'extracted_text': extracted_text,
+            'text_content': text_content,
+            'fingerprint': fingerprint,
+            'cached': bool(known),
+            'timings': timings,
+        }
+    
+    def translate(self, text, target_lang):
+        """Translate English text (returned unchanged for English targets)"""
+        if target_lang.startswith('en'):
+            return text
+        return self.translation_router.translate(text, target_lang)
+    
+    def synthesize(self, text, lang='en', slow=False):
+        """Speak text with the first available engine; returns the audio file path"""
+        clean_text = clean_text_for_speech(text).strip()
+        if not clean_text:
+            raise ValueError("No valid text to convert to speech")
+        
+        # Use timestamp to ensure ALWAYS fresh generation (the engine adds .mp3 or .wav)
+        temp_dir = tempfile.gettempdir()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        temp_stem = os.path.join(temp_dir, f"tts_{lang}_{timestamp}")
+        
+        # Clean up old audio files to save space
+        try:
+            for old_file in Path(temp_dir).glob("tts_*.*"):
+                if old_file.suffix in ('.mp3', '.wav') and old_file.stat().st_mtime < (datetime.now().timestamp() - 3600):  # Older than 1 hour
+                    old_file.unlink()
+        except OSError:
+            pass
+        
+        return self.speech_router.synthesize(clean_text, lang, slow, temp_stem)
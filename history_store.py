@@ -0,0 +1,268 @@
+import atexit
+import io
+import json
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+THUMBNAIL_SIZE = (200, 200)
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    """Small JPEG of a PIL image for the history list"""
+    thumb = image.copy()
+    thumb.thumbnail(size)
+    if thumb.mode != "RGB":
+        thumb = thumb.convert("RGB")
+    buffer = io.BytesIO()
+    thumb.save(buffer, format="JPEG", quality=75)
+    return buffer.getvalue()
+
+
+class CaptionHistoryStore:
+    """Per-user caption history in SQLite with background writes, keyset paging and full-text search.
+
+    Entries get their row id when queued, so a not-yet-written entry pages like any
+    other; ids are reserved in-process, so each database file has one store.
+    """
+
+    def __init__(self, path="caption_history.db", flush_interval=0.25):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stopped = False
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS history (
+                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       username TEXT NOT NULL,
+                       created_at REAL NOT NULL,
+                       caption TEXT NOT NULL,
+                       extracted_text TEXT,
+                       preferences TEXT,
+                       thumbnail BLOB
+                   )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_history_user_time ON history (username, created_at DESC, id DESC)"
+            )
+            self.fts_enabled = self._create_fts()
+            self._conn.commit()
+            self._next_id = self._last_id() + 1
+        self._thread = threading.Thread(target=self._run, name="caption-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _last_id(self):
+        """Highest id ever handed out, including rows deleted since (AUTOINCREMENT never reuses them)"""
+        last = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM history").fetchone()[0]
+        seq = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'history'").fetchone()
+        return max(last, seq[0] if seq else 0)
+
+    def _create_fts(self):
+        """External-content FTS5 index over captions and OCR text, kept in sync by triggers"""
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                "caption, extracted_text, content='history', content_rowid='id')"
+            )
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE
+            return False
+        self._conn.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                INSERT INTO history_fts(rowid, caption, extracted_text)
+                VALUES (new.id, new.caption, new.extracted_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                INSERT INTO history_fts(history_fts, rowid, caption, extracted_text)
+                VALUES ('delete', old.id, old.caption, old.extracted_text);
+            END;
+            """
+        )
+        return True
+
+    def add(self, username, caption, preferences=None, image=None, extracted_text=None):
+        """Queue a history entry; returns immediately (thumbnailing and the insert happen in the background)"""
+        entry = {
+            "username": username,
+            "created_at": time.time(),
+            "caption": caption,
+            "extracted_text": extracted_text,
+            "preferences": preferences or {},
+            "image": image.copy() if image is not None else None,
+        }
+        with self._pending_lock:
+            entry["id"] = self._next_id
+            self._next_id += 1
+            self._pending.append(entry)
+        self._queue.put(entry)
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            # Coalesce whatever else arrived meanwhile into the same transaction
+            deadline = time.time() + self.flush_interval
+            while time.time() < deadline:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        rows = []
+        for entry in batch:
+            thumbnail = None
+            if entry["image"] is not None:
+                try:
+                    thumbnail = make_thumbnail(entry["image"])
+                except Exception as e:
+                    print(f"Error creating history thumbnail: {e}")
+            rows.append((
+                entry["id"], entry["username"], entry["created_at"], entry["caption"], entry["extracted_text"],
+                json.dumps(entry["preferences"]), thumbnail,
+            ))
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO history (id, username, created_at, caption, extracted_text, preferences, thumbnail) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except Exception as e:
+                print(f"Error saving caption history: {e}")
+            finally:
+                # Leave the pending buffer under the same lock as the commit, so readers
+                # holding it see each entry either pending or in the table, never both
+                with self._pending_lock:
+                    written = set(id(entry) for entry in batch)
+                    self._pending = [e for e in self._pending if id(e) not in written]
+
+    def _pending_for(self, username, cursor=None):
+        """Queued entries of a user older than cursor; call with self._lock held"""
+        with self._pending_lock:
+            return [
+                {
+                    "id": e["id"],
+                    "username": e["username"],
+                    "created_at": e["created_at"],
+                    "caption": e["caption"],
+                    "extracted_text": e["extracted_text"],
+                    "preferences": e["preferences"],
+                    "image": e["image"],
+                    "thumbnail": None,
+                }
+                for e in reversed(self._pending)
+                if e["username"] == username and (cursor is None or (e["created_at"], e["id"]) < tuple(cursor))
+            ]
+
+    @staticmethod
+    def _row_to_item(row):
+        return {
+            "id": row["id"],
+            "username": row["username"],
+            "created_at": row["created_at"],
+            "caption": row["caption"],
+            "extracted_text": row["extracted_text"],
+            "preferences": json.loads(row["preferences"] or "{}"),
+            "image": None,
+            "thumbnail": row["thumbnail"],
+        }
+
+    def page(self, username, limit=5, cursor=None):
+        """Newest-first page of a user's history.
+
+        cursor is the (created_at, id) of the last item on the previous page; returns
+        (items, next_cursor) where next_cursor is None on the last page.
+        """
+        with self._lock:
+            items = self._pending_for(username, cursor)
+            if cursor is None:
+                rows = self._conn.execute(
+                    "SELECT * FROM history WHERE username = ? "
+                    "ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (username, limit + 1),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM history WHERE username = ? AND (created_at, id) < (?, ?) "
+                    "ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (username, cursor[0], cursor[1], limit + 1),
+                ).fetchall()
+        items.extend(self._row_to_item(row) for row in rows)
+        items.sort(key=lambda item: (item["created_at"], item["id"]), reverse=True)
+        if len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        last = items[-1]
+        return items, (last["created_at"], last["id"])
+
+    def count(self, username):
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM history WHERE username = ?", (username,)
+            ).fetchone()[0]
+            return total + len(self._pending_for(username))
+
+    def search(self, username, query, limit=5, offset=0):
+        """Full-text search over a user's captions and OCR text, best matches first"""
+        query = (query or "").strip()
+        if not query:
+            return []
+        with self._lock:
+            if self.fts_enabled:
+                # Quote each term so user input cannot inject FTS5 query syntax
+                terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                rows = self._conn.execute(
+                    "SELECT h.* FROM history_fts f JOIN history h ON h.id = f.rowid "
+                    "WHERE history_fts MATCH ? AND h.username = ? "
+                    "ORDER BY bm25(history_fts), h.created_at DESC LIMIT ? OFFSET ?",
+                    (terms, username, limit, offset),
+                ).fetchall()
+            else:
+                pattern = f"%{query}%"
+                rows = self._conn.execute(
+                    "SELECT * FROM history WHERE username = ? AND (caption LIKE ? OR extracted_text LIKE ?) "
+                    "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                    (username, pattern, pattern, limit, offset),
+                ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def flush(self, timeout=5):
+        """Wait until queued entries have been written"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._pending_lock:
+                if not self._pending:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+
+HASH_BITS = 64
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so a 2-D DCT is two matrix products"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+_BIT_WEIGHTS = (1 << np.arange(HASH_BITS, dtype=np.uint64)[::-1]).astype(np.uint64)
+
+
+def _bits_to_int(bits):
+    return int(np.bitwise_or.reduce(_BIT_WEIGHTS[bits.ravel()])) if bits.any() else 0
+
+
+def _grayscale(image, size):
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    return np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def dhash(image):
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail"""
+    pixels = _grayscale(image, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image):
+    """64-bit perceptual hash: low-frequency 8x8 DCT block of a 32x32 thumbnail vs its median"""
+    pixels = _grayscale(image, (32, 32))
+    coefficients = _DCT_32 @ pixels @ _DCT_32.T
+    low = coefficients[:8, :8]
+    # Median without the DC term, which only encodes overall brightness
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def content_hash(image):
+    """sha256 of the decoded pixels (mode, size and bytes), so re-saved files of the same picture match"""
+    digest = hashlib.sha256(f"{image.mode}|{image.size[0]}x{image.size[1]}|".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """Multi-index hashing over 64-bit hashes for Hamming-radius queries.
+
+    The hash is split into `chunks` 16-bit substrings, each with its own exact-match
+    table. If two hashes differ in at most r bits, at least one substring differs in
+    at most r // chunks bits (pigeonhole), so probing each table with every variant
+    of the query substring within that radius finds every match while only touching
+    a small bucket per probe, independent of the total number of entries.
+    """
+
+    def __init__(self, max_distance, chunks=4):
+        self.max_distance = max_distance
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        self._tables = [{} for _ in range(chunks)]
+        self._keys = {}  # value -> hash
+        self._probe_masks = self._flip_masks(max_distance // chunks)
+        self.size = 0
+
+    def _flip_masks(self, radius):
+        """XOR masks for every chunk variant within `radius` flipped bits"""
+        masks = [0]
+        frontier = [(0, -1)]
+        for _ in range(radius):
+            next_frontier = []
+            for mask, last_bit in frontier:
+                for bit in range(last_bit + 1, self.chunk_bits):
+                    flipped = mask | (1 << bit)
+                    masks.append(flipped)
+                    next_frontier.append((flipped, bit))
+            frontier = next_frontier
+        return masks
+
+    def _substrings(self, key):
+        return [(key >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def add(self, key, value):
+        for table, chunk in zip(self._tables, self._substrings(key)):
+            table.setdefault(chunk, []).append(value)
+        self._keys[value] = key
+        self.size += 1
+
+    def search(self, key, max_distance=None):
+        """All (distance, value) within max_distance (<= the indexed radius), nearest first"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        seen = set()
+        results = []
+        for table, chunk in zip(self._tables, self._substrings(key)):
+            for flip in self._probe_masks:
+                for value in table.get(chunk ^ flip, ()):
+                    if value in seen:
+                        continue
+                    seen.add(value)
+                    distance = hamming(key, self._keys[value])
+                    if distance <= max_distance:
+                        results.append((distance, value))
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+def _to_signed(value):
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class PerceptualImageIndex:
+    """Remembers captions/OCR text of processed images and finds near-duplicates by pHash + dHash.
+
+    Entries belong to the user who uploaded the image and are only served back to that
+    user; without an owner nothing is stored or looked up. A near-duplicate shares its
+    base caption, but OCR text is only reused for an exact pixel match (content_hash),
+    since documents with the same layout and different text hash within a few bits.
+    """
+
+    def __init__(self, path="image_index.db", max_phash_distance=3, max_dhash_distance=5):
+        self.path = Path(path)
+        self.max_phash_distance = max_phash_distance
+        self.max_dhash_distance = max_dhash_distance
+        self._lock = threading.Lock()
+        self._index = MultiIndexHash(max_phash_distance)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._last_id = 0
+        self._data_version = None
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS images (
+                       id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       phash INTEGER NOT NULL,
+                       dhash INTEGER NOT NULL,
+                       base_caption TEXT NOT NULL,
+                       extracted_text TEXT,
+                       created_at REAL NOT NULL,
+                       candidates TEXT,
+                       owner TEXT,
+                       content_sha256 TEXT
+                   )"""
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(images)")]
+            for column in ("candidates", "owner", "content_sha256"):
+                if column not in columns:
+                    # Rows from before owners were recorded keep owner NULL and are never served
+                    self._conn.execute(f"ALTER TABLE images ADD COLUMN {column} TEXT")
+            self._conn.commit()
+            self._load_new_rows()
+
+    def _load_new_rows(self):
+        """Index rows added since the last load (including those written by other processes)"""
+        rows = self._conn.execute(
+            "SELECT id, phash, dhash, owner FROM images WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        for row_id, p, d, owner in rows:
+            if owner:
+                self._index.add(_to_unsigned(p), (row_id, _to_unsigned(d), owner))
+            self._last_id = row_id
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def __len__(self):
+        return self._index.size
+
+    @staticmethod
+    def fingerprint(image):
+        """(phash, dhash) for a PIL image"""
+        return phash(image), dhash(image)
+
+    def lookup(self, image=None, fingerprint=None, owner=None, digest=None):
+        """Stored result for owner's closest near-duplicate, or None.
+
+        exact is True when the stored image has the same content hash (digest); otherwise
+        extracted_text is None and the caller has to run OCR on the new image.
+        """
+        if not owner:
+            return None
+        p, d = fingerprint or self.fingerprint(image)
+        if digest is None and image is not None:
+            digest = content_hash(image)
+        with self._lock:
+            if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self._load_new_rows()
+            candidates = self._index.search(p)
+        nearest = None
+        for distance, (row_id, stored_d, stored_owner) in candidates:
+            # dHash catches pHash collisions between images that only share coarse structure
+            if stored_owner != owner or hamming(d, stored_d) > self.max_dhash_distance:
+                continue
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT base_caption, extracted_text, candidates, content_sha256 FROM images WHERE id = ?",
+                    (row_id,)
+                ).fetchone()
+            if not row:
+                continue
+            exact = digest is not None and row[3] == digest
+            found = {
+                "base_caption": row[0],
+                "extracted_text": row[1] if exact else None,
+                "candidates": json.loads(row[2]) if row[2] else None,
+                "distance": distance,
+                "exact": exact,
+            }
+            if exact:
+                return found
+            nearest = nearest or found
+        return nearest
+
+    def add(self, image=None, base_caption="", extracted_text=None, fingerprint=None, candidates=None,
+            owner=None, digest=None):
+        """Record owner's pipeline result (and optional alternative base captions) for an image"""
+        if not owner:
+            return
+        p, d = fingerprint or self.fingerprint(image)
+        if digest is None and image is not None:
+            digest = content_hash(image)
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO images (phash, dhash, base_caption, extracted_text, created_at, candidates, "
+                    "owner, content_sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (_to_signed(p), _to_signed(d), base_caption, extracted_text, time.time(),
+                     json.dumps(candidates) if candidates else None, owner, digest),
+                )
+            self._index.add(p, (cursor.lastrowid, d, owner))
+            self._last_id = max(self._last_id, cursor.lastrowid)
@@ -0,0 +1,343 @@
+"""Pluggable speech and translation engines with per-language selection and fallback.
+
+Online engines (gTTS, Google Translate) are used by default. Offline engines
+(espeak-ng, pyttsx3, MarianMT) are optional and loaded lazily on first use:
+
+    CAPTION_AI_OFFLINE=1             only use offline engines
+    TTS_ENGINES=espeak-ng,gtts       default speech engine order
+    TTS_ENGINES_HI=gtts,espeak-ng    order for one language (code upper-cased, '-' -> '_')
+    TRANSLATION_ENGINES=marian,google
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+
+
+class EngineUnavailable(Exception):
+    """Raised when an engine cannot serve a request (missing dependency, language or network)"""
+
+
+# Service-side errors of the optional online libraries, matched by name so they need not be imported
+# (gtts.tts.gTTSError, deep_translator.exceptions.RequestError / TooManyRequests / ServerException)
+SERVICE_ERRORS = {"gTTSError", "RequestError", "TooManyRequests", "ServerException"}
+
+
+def is_engine_failure(error):
+    """True for errors that say the engine itself is unusable (dependency, process, network),
+    False for errors caused by the input, which should not take the engine out of rotation"""
+    if isinstance(error, (EngineUnavailable, ImportError, OSError, subprocess.SubprocessError)):
+        return True
+    return type(error).__name__ in SERVICE_ERRORS
+
+
+class GTTSEngine:
+    """Google Text-to-Speech (needs network access)"""
+
+    name = "gtts"
+    offline = False
+    audio_format = "mp3"
+
+    def supports(self, lang):
+        return True
+
+    def load(self, lang=None):
+        from gtts import gTTS  # noqa: F401
+
+    def synthesize(self, text, lang, slow, out_path):
+        from gtts import gTTS
+        gTTS(text=text, lang=lang, slow=slow).save(out_path)
+
+
+class EspeakNGEngine:
+    """Local espeak-ng command line synthesizer (apt install espeak-ng)"""
+
+    name = "espeak-ng"
+    offline = True
+    audio_format = "wav"
+
+    # gTTS accent codes that espeak-ng does not know map onto its closest voice
+    VOICES = {"en": "en-us", "en-gb": "en", "en-au": "en", "en-in": "en"}
+
+    def __init__(self):
+        self._binary = None
+
+    def load(self, lang=None):
+        if self._binary is None:
+            self._binary = shutil.which("espeak-ng") or shutil.which("espeak")
+            if self._binary is None:
+                raise EngineUnavailable("espeak-ng is not installed")
+        return self._binary
+
+    def supports(self, lang):
+        return True
+
+    def synthesize(self, text, lang, slow, out_path):
+        binary = self.load()
+        voice = self.VOICES.get(lang, lang)
+        speed = "120" if slow else "170"
+        result = subprocess.run(
+            [binary, "-v", voice, "-s", speed, "-w", out_path, text],
+            capture_output=True, timeout=60
+        )
+        if result.returncode != 0:
+            raise EngineUnavailable(result.stderr.decode(errors="ignore").strip() or "espeak-ng failed")
+
+
+class Pyttsx3Engine:
+    """Local pyttsx3 synthesizer (SAPI5 / NSSpeechSynthesizer / espeak drivers)"""
+
+    name = "pyttsx3"
+    offline = True
+    audio_format = "wav"
+
+    def __init__(self):
+        self._engine = None
+        self._voices = {}
+        # Set when pyttsx3 cannot be imported or initialized; not retried for this process
+        self._load_error = None
+        # pyttsx3 drivers are not thread-safe
+        self._lock = threading.Lock()
+
+    def load(self, lang=None):
+        if self._load_error is not None:
+            raise EngineUnavailable(self._load_error)
+        if self._engine is None:
+            try:
+                import pyttsx3
+                self._engine = pyttsx3.init()
+            except ImportError:
+                self._load_error = "pyttsx3 is not installed"
+                raise EngineUnavailable(self._load_error)
+            except Exception as e:
+                self._load_error = f"pyttsx3 could not start: {e}"
+                raise EngineUnavailable(self._load_error)
+            for voice in self._engine.getProperty("voices"):
+                for code in getattr(voice, "languages", []) or []:
+                    if isinstance(code, bytes):
+                        code = code.decode(errors="ignore").lstrip("\x05")
+                    self._voices.setdefault(code.lower().replace("_", "-"), voice.id)
+        return self._engine
+
+    def _voice_for(self, lang):
+        lang = lang.lower()
+        if lang in self._voices:
+            return self._voices[lang]
+        base = lang.split("-")[0]
+        for code, voice_id in self._voices.items():
+            if code.split("-")[0] == base:
+                return voice_id
+        return None
+
+    def supports(self, lang):
+        try:
+            self.load()
+        except Exception:
+            return False
+        return self._voice_for(lang) is not None
+
+    def synthesize(self, text, lang, slow, out_path):
+        with self._lock:
+            engine = self.load()
+            voice_id = self._voice_for(lang)
+            if voice_id is None:
+                raise EngineUnavailable(f"No pyttsx3 voice for '{lang}'")
+            engine.setProperty("voice", voice_id)
+            engine.setProperty("rate", 120 if slow else 175)
+            engine.save_to_file(text, out_path)
+            engine.runAndWait()
+
+
+class GoogleTranslateEngine:
+    """deep-translator's GoogleTranslator (needs network access)"""
+
+    name = "google"
+    offline = False
+
+    def supports(self, target_lang):
+        return True
+
+    def load(self, lang=None):
+        from deep_translator import GoogleTranslator  # noqa: F401
+
+    def translate(self, text, target_lang):
+        from deep_translator import GoogleTranslator
+        return GoogleTranslator(source='auto', target=target_lang).translate(text)
+
+
+class MarianTranslateEngine:
+    """Local Helsinki-NLP MarianMT models (English source), one per target language"""
+
+    name = "marian"
+    offline = True
+
+    MODELS = {
+        "hi": "Helsinki-NLP/opus-mt-en-hi",
+        "es": "Helsinki-NLP/opus-mt-en-es",
+        "fr": "Helsinki-NLP/opus-mt-en-fr",
+        "de": "Helsinki-NLP/opus-mt-en-de",
+        "it": "Helsinki-NLP/opus-mt-en-it",
+    }
+
+    def __init__(self, model_dir=None):
+        # Optional local directory holding pre-fetched models, e.g. models/opus-mt-en-hi
+        self.model_dir = model_dir or os.environ.get("MARIAN_MODEL_DIR")
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def supports(self, target_lang):
+        return target_lang.split("-")[0] in self.MODELS
+
+    def _model_source(self, model_id):
+        if self.model_dir:
+            local = os.path.join(self.model_dir, model_id.split("/")[-1])
+            if os.path.isdir(local):
+                return local
+        return model_id
+
+    def load(self, lang=None):
+        """Load (once) and keep the model for a target language warm"""
+        target_lang = lang or "hi"
+        target = target_lang.split("-")[0]
+        if target not in self.MODELS:
+            raise EngineUnavailable(f"No MarianMT model for '{target_lang}'")
+        with self._lock:
+            if target not in self._models:
+                try:
+                    from transformers import MarianMTModel, MarianTokenizer
+                except ImportError:
+                    raise EngineUnavailable("transformers is not installed")
+                source = self._model_source(self.MODELS[target])
+                local_only = os.environ.get("CAPTION_AI_OFFLINE") == "1"
+                tokenizer = MarianTokenizer.from_pretrained(source, local_files_only=local_only)
+                model = MarianMTModel.from_pretrained(source, local_files_only=local_only)
+                model.eval()
+                self._models[target] = (tokenizer, model)
+            return self._models[target]
+
+    def translate(self, text, target_lang):
+        import torch
+        from tts_streaming import split_sentences
+
+        tokenizer, model = self.load(target_lang)
+        # Translate sentence by sentence in one batch to stay inside the model's length limit
+        sentences = split_sentences(text, max_chars=400, first_chunk_chars=400) or [text]
+        batch = tokenizer(sentences, return_tensors="pt", padding=True, truncation=True)
+        with torch.no_grad():
+            out = model.generate(**batch, max_new_tokens=512)
+        return " ".join(tokenizer.batch_decode(out, skip_special_tokens=True))
+
+
+SPEECH_ENGINES = {"gtts": GTTSEngine, "espeak-ng": EspeakNGEngine, "pyttsx3": Pyttsx3Engine}
+TRANSLATION_ENGINES = {"google": GoogleTranslateEngine, "marian": MarianTranslateEngine}
+
+DEFAULT_SPEECH_ORDER = "gtts,espeak-ng,pyttsx3"
+DEFAULT_TRANSLATION_ORDER = "google,marian"
+
+
+class EngineRouter:
+    """Picks engines per language from an ordered list and falls back on failure.
+
+    An engine that fails with an engine error (see is_engine_failure) is skipped for
+    `cooldown` seconds so an unreachable network service does not add a timeout to
+    every request; errors caused by the input only fall through to the next engine.
+    """
+
+    def __init__(self, registry, default_order, env_prefix, cooldown=60):
+        self.registry = registry
+        self.default_order = default_order
+        self.env_prefix = env_prefix
+        self.cooldown = cooldown
+        self._instances = {}
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def _instance(self, name):
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self.registry[name]()
+            return self._instances[name]
+
+    def order_for(self, lang):
+        """Engine names to try for a language, in order"""
+        lang_key = lang.upper().replace("-", "_")
+        raw = (os.environ.get(f"{self.env_prefix}_{lang_key}")
+               or os.environ.get(self.env_prefix)
+               or self.default_order)
+        names = [n.strip() for n in raw.split(",") if n.strip() in self.registry]
+        if os.environ.get("CAPTION_AI_OFFLINE") == "1":
+            names = [n for n in names if self.registry[n].offline]
+        return names
+
+    def candidates(self, lang):
+        """Healthy engines that support the language, in preference order"""
+        now = time.time()
+        engines = []
+        for name in self.order_for(lang):
+            if self._down_until.get(name, 0) > now:
+                continue
+            engine = self._instance(name)
+            if engine.supports(lang):
+                engines.append(engine)
+        return engines
+
+    def mark_failed(self, engine, error=None):
+        if error is not None and not is_engine_failure(error):
+            return
+        self._down_until[engine.name] = time.time() + self.cooldown
+
+    def warm_up(self, lang="en"):
+        """Load offline engines for a language ahead of the first request"""
+        for engine in self.candidates(lang):
+            if engine.offline:
+                try:
+                    engine.load(lang)
+                except Exception as e:
+                    print(f"Could not warm up {engine.name}: {e}")
+
+    def run(self, lang, action):
+        """Call action(engine) on each candidate until one succeeds; returns (engine, result)"""
+        errors = []
+        for engine in self.candidates(lang):
+            try:
+                return engine, action(engine)
+            except Exception as e:
+                self.mark_failed(engine, e)
+                errors.append(f"{engine.name}: {e}")
+        raise EngineUnavailable("; ".join(errors) or f"No engine available for '{lang}'")
+
+
+class SpeechRouter(EngineRouter):
+    def __init__(self, cooldown=60):
+        super().__init__(SPEECH_ENGINES, DEFAULT_SPEECH_ORDER, "TTS_ENGINES", cooldown)
+
+    def synthesize(self, text, lang, slow, out_stem):
+        """Write speech to out_stem + engine extension; returns the file path"""
+        def action(engine):
+            out_path = f"{out_stem}.{engine.audio_format}"
+            engine.synthesize(text, lang, slow, out_path)
+            if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+                raise EngineUnavailable("no audio was written")
+            return out_path
+        return self.run(lang, action)[1]
+
+
+class TranslationRouter(EngineRouter):
+    def __init__(self, cooldown=60):
+        super().__init__(TRANSLATION_ENGINES, DEFAULT_TRANSLATION_ORDER, "TRANSLATION_ENGINES", cooldown)
+
+    def translate(self, text, target_lang):
+        return self.run(target_lang, lambda engine: engine.translate(text, target_lang))[1]
+
+
+def concatenate_wav(paths, out_path):
+    """Join WAV files that share the same format into one file"""
+    with wave.open(out_path, "wb") as out:
+        for index, path in enumerate(paths):
+            with wave.open(str(path), "rb") as part:
+                if index == 0:
+                    out.setparams(part.getparams())
+                out.writeframes(part.readframes(part.getnframes()))
+    return out_path
@@ -0,0 +1,426 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from model_lifecycle import current_rss_mb
+
+
+STAGES = ("login", "caption", "caption_cached", "translate", "tts")
+
+# Voice languages offered by the UI
+LANGUAGES = ["en", "en-gb", "en-au", "en-in", "hi", "kn", "es", "fr", "de", "it"]
+LENGTHS = ["short", "medium", "long"]
+STYLES = ["descriptive", "creative", "poetic", "humorous", "professional"]
+TONES = ["neutral", "casual", "formal", "enthusiastic", "mysterious"]
+
+SAMPLE_WORDS = "SALE OPEN FLOOD ALERT SOLAR MAP LOANS CAFE EXIT TRAIN".split()
+
+
+class StubTranslateEngine:
+    """Stands in for Google Translate: fixed latency, no network"""
+
+    name = "stub"
+    offline = True
+    latency = 0.15
+
+    def supports(self, target_lang):
+        return True
+
+    def load(self, lang=None):
+        pass
+
+    def translate(self, text, target_lang):
+        time.sleep(self.latency)
+        return f"[{target_lang}] {text}"
+
+
+class StubSpeechEngine:
+    """Stands in for gTTS: latency plus a short silent WAV per request, no network"""
+
+    name = "stub"
+    offline = True
+    audio_format = "wav"
+    latency = 0.3
+
+    def supports(self, lang):
+        return True
+
+    def load(self, lang=None):
+        pass
+
+    def synthesize(self, text, lang, slow, out_path):
+        time.sleep(self.latency)
+        with wave.open(out_path, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(8000)
+            out.writeframes(b"\0\0" * 800)
+
+
+def stub_network(pipeline, translate_latency=0.15, tts_latency=0.3):
+    """Route the pipeline's translation and speech through the stub engines"""
+    StubTranslateEngine.latency = translate_latency
+    StubSpeechEngine.latency = tts_latency
+    for router, engine in ((pipeline.translation_router, StubTranslateEngine),
+                           (pipeline.speech_router, StubSpeechEngine)):
+        router.registry = {"stub": engine}
+        router.default_order = "stub"
+        # Engine-order variables of the real deployment must not re-enable real engines
+        router.env_prefix = "LOAD_TEST_ENGINES"
+
+
+def synthetic_image(rng, size=(640, 480)):
+    """Random shapes and a word of text, so OCR has something to read and no two images match"""
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randint(20, 200), y0 + rng.randint(20, 200)
+        draw.rectangle([x0, y0, x1, y1], fill=tuple(rng.randrange(256) for _ in range(3)))
+    draw.text((rng.randint(10, size[0] // 2), rng.randint(10, size[1] - 30)), rng.choice(SAMPLE_WORDS), fill=(0, 0, 0))
+    return image
+
+
+def load_samples(sample_dir="sample_images"):
+    return [
+        Image.open(path).convert("RGB")
+        for path in sorted(Path(sample_dir).iterdir())
+        if path.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp")
+    ] if Path(sample_dir).is_dir() else []
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class ResourceSampler:
+    """Samples process CPU (% of one core) and RSS every interval seconds in the background"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-test-sampler", daemon=True)
+
+    def _run(self):
+        start = last_wall = time.perf_counter()
+        times = os.times()
+        last_cpu = times.user + times.system
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            times = os.times()
+            cpu = times.user + times.system
+            self.samples.append({
+                "t": round(now - start, 2),
+                "cpu_percent": round(100 * (cpu - last_cpu) / (now - last_wall), 1),
+                "rss_mb": round(current_rss_mb(), 1),
+            })
+            last_wall, last_cpu = now, cpu
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+class LoadTest:
+    """Simulated users against one in-process CaptionPipeline.
+
+    Each session logs in through AuthSystem, then loops: pick a sample or synthetic
+    image, caption it with random preferences, translate the caption to a random
+    language and synthesize speech. Translation and speech use stub engines, so the
+    measurements cover this replica's own work. Rate limits are not applied.
+
+    Captions run without an owner, so the near-duplicate index is bypassed and every
+    caption is real inference. With dedup, sessions caption as their user and index
+    hits are recorded as a separate caption_cached stage.
+    """
+
+    def __init__(self, pipeline, auth, users, images="mixed", think_time=0.0, seed=0, dedup=False):
+        self.pipeline = pipeline
+        self.auth = auth
+        self.users = users  # [(username, password)]
+        self.images = images
+        self.samples = load_samples() if images != "synthetic" else []
+        if images == "samples" and not self.samples:
+            raise ValueError("No sample images found in sample_images/")
+        self.think_time = think_time
+        self.seed = seed
+        self.dedup = dedup
+        self.records = []  # (finished_at, stage, seconds, error or None)
+        self._records_lock = threading.Lock()
+        self._start = None
+
+    def _record(self, stage, seconds, error=None):
+        with self._records_lock:
+            self.records.append((time.perf_counter() - self._start, stage, seconds, error))
+
+    def _timed(self, stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record(stage, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            return None
+        self._record(stage, time.perf_counter() - start)
+        return result
+
+    def _pick_image(self, rng):
+        if self.samples and (self.images == "samples" or rng.random() < 0.5):
+            return rng.choice(self.samples)
+        return synthetic_image(rng)
+
+    def _caption(self, image, preferences, username):
+        start = time.perf_counter()
+        try:
+            result = self.pipeline.caption(image, preferences, owner=username if self.dedup else None)
+        except Exception as e:
+            self._record("caption", time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            return None
+        self._record("caption_cached" if result["cached"] else "caption", time.perf_counter() - start)
+        return result
+
+    def _login(self, username, password):
+        success, message = self.auth.login_user(username, password)
+        if not success:
+            raise RuntimeError(message)
+        return username
+
+    def session(self, index, stop):
+        rng = random.Random(self.seed * 100003 + index)
+        username, password = self.users[index % len(self.users)]
+        if self._timed("login", self._login, username, password) is None:
+            return
+        while not stop.is_set():
+            preferences = {
+                "length": rng.choice(LENGTHS),
+                "style": rng.choice(STYLES),
+                "tone": rng.choice(TONES),
+                "emojis": rng.random() < 0.5,
+                "hashtags": rng.random() < 0.3,
+            }
+            result = self._caption(self._pick_image(rng), preferences, username)
+            if result is not None:
+                lang = rng.choice(LANGUAGES)
+                text = self._timed("translate", self.pipeline.translate, result["caption"], lang)
+                path = self._timed("tts", self.pipeline.synthesize, text or result["caption"], lang)
+                if path:
+                    os.unlink(path)
+            if self.think_time:
+                stop.wait(rng.expovariate(1 / self.think_time))
+
+    def run(self, profile, sample_interval=1.0):
+        """Run a ramp profile [(sessions, seconds), ...]; returns (records, resource samples, step windows).
+
+        Sessions are added or stopped at each step boundary so the given number is active
+        for the step's duration; stopped sessions finish their current request first.
+        """
+        self.records = []
+        self._start = time.perf_counter()
+        sampler = ResourceSampler(sample_interval).start()
+        active = []  # (thread, stop event)
+        stopped = []
+        steps = []
+        next_index = 0
+        try:
+            for sessions, seconds in profile:
+                while len(active) > sessions:
+                    thread, stop = active.pop()
+                    stop.set()
+                    stopped.append(thread)
+                while len(active) < sessions:
+                    stop = threading.Event()
+                    thread = threading.Thread(target=self.session, args=(next_index, stop), daemon=True)
+                    thread.start()
+                    active.append((thread, stop))
+                    next_index += 1
+                begin = time.perf_counter() - self._start
+                time.sleep(seconds)
+                steps.append({"sessions": sessions, "start": begin, "end": time.perf_counter() - self._start})
+        finally:
+            for thread, stop in active:
+                stop.set()
+            for thread in stopped + [thread for thread, _ in active]:
+                thread.join()
+        return list(self.records), sampler.stop(), steps
+
+
+def summarize(records, start=0.0, end=None):
+    """Throughput, per-stage latency percentiles and error rates for records finished in [start, end)"""
+    window = [r for r in records if r[0] >= start and (end is None or r[0] < end)]
+    duration = (end if end is not None else max((r[0] for r in window), default=start)) - start
+    report = {"seconds": round(duration, 1), "stages": {}}
+    for stage in STAGES:
+        rows = [r for r in window if r[1] == stage]
+        latencies = [r[2] for r in rows if r[3] is None]
+        errors = [r[3] for r in rows if r[3] is not None]
+        if not rows:
+            continue
+        report["stages"][stage] = {
+            "count": len(rows),
+            "error_rate": round(len(errors) / len(rows), 4),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "errors": sorted(set(errors))[:3],
+        }
+    completed = sum(1 for r in window if r[1] == "tts" and r[3] is None)
+    report["sessions_per_second"] = round(completed / duration, 3) if duration > 0 else 0.0
+    captions = sum(1 for r in window if r[1] == "caption" and r[3] is None)
+    report["captions_per_second"] = round(captions / duration, 3) if duration > 0 else 0.0
+    return report
+
+
+def summarize_resources(samples, start=0.0, end=None):
+    window = [s for s in samples if s["t"] >= start and (end is None or s["t"] < end)]
+    if not window:
+        return {}
+    return {
+        "cpu_percent_mean": round(statistics.mean(s["cpu_percent"] for s in window), 1),
+        "cpu_percent_max": max(s["cpu_percent"] for s in window),
+        "rss_mb_max": max(s["rss_mb"] for s in window),
+    }
+
+
+def find_saturation(test, levels, step_seconds, latency_factor=2.0, min_gain=0.1):
+    """Step through session counts and return (saturation level, per-level reports).
+
+    A level saturates the replica when throughput grows by less than min_gain over the
+    previous level, or caption p95 exceeds latency_factor x the single-level baseline.
+    The saturation point is the last level before that happens; levels are run one at
+    a time, and stepping stops there.
+    """
+    reports = []
+    saturation = levels[-1]
+    baseline_p95 = None
+    previous = None
+    for level in levels:
+        records, samples, steps = test.run([(level, step_seconds)])
+        step = steps[0]
+        # The first seconds of each step carry logins and requests that started cold
+        settle = min(step_seconds / 4, 5.0)
+        report = summarize(records, step["start"] + settle, step["end"])
+        report.update(summarize_resources(samples, step["start"] + settle, step["end"]))
+        report["sessions"] = step["sessions"]
+        reports.append(report)
+        p95 = report["stages"].get("caption", {}).get("p95")
+        if baseline_p95 is None:
+            baseline_p95 = p95
+        throughput = report["captions_per_second"]
+        saturated = (
+            (previous is not None and throughput < previous["captions_per_second"] * (1 + min_gain))
+            or (p95 is not None and baseline_p95 and p95 > baseline_p95 * latency_factor)
+        )
+        if saturated and previous is not None:
+            saturation = previous["sessions"]
+            break
+        previous = report
+    return saturation, reports
+
+
+def parse_profile(text):
+    """"1:30,4:30,8:60" -> [(1, 30.0), (4, 30.0), (8, 60.0)] (sessions:seconds)"""
+    profile = []
+    for part in text.split(","):
+        sessions, seconds = part.split(":")
+        profile.append((int(sessions), float(seconds)))
+    return profile
+
+
+def _format_report(report):
+    lines = [f"  {report['captions_per_second']:.2f} captions/s, {report['sessions_per_second']:.2f} full sessions/s"
+             + (f", CPU {report['cpu_percent_mean']:.0f}% (max {report['cpu_percent_max']:.0f}%), "
+                f"RSS max {report['rss_mb_max']:.0f} MB" if "cpu_percent_mean" in report else "")]
+    for stage, stats in report["stages"].items():
+        if stats["p50"] is None:
+            lines.append(f"  {stage:<9} n={stats['count']:<5} all failed: {stats['errors']}")
+            continue
+        lines.append(f"  {stage:<9} n={stats['count']:<5} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  "
+                     f"p99 {stats['p99']:.3f}s  errors {100 * stats['error_rate']:.1f}%")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from auth_system import AuthSystem
+    from caption_pipeline import CaptionPipeline
+    from image_dedup import PerceptualImageIndex
+    from password_hashing import PasswordHasher
+    from user_store import SQLiteUserStore
+
+    parser = argparse.ArgumentParser(description="Simulate concurrent users against one replica")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions (without --ramp)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds (without --ramp)")
+    parser.add_argument("--ramp", default=None, help='profile "sessions:seconds,..." e.g. "1:30,4:30,8:60"')
+    parser.add_argument("--find-saturation", action="store_true", help="step 1,2,4,... up to --max-sessions")
+    parser.add_argument("--max-sessions", type=int, default=16)
+    parser.add_argument("--step-seconds", type=float, default=30)
+    parser.add_argument("--images", choices=["samples", "synthetic", "mixed"], default="mixed")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a session's requests")
+    parser.add_argument("--translate-latency", type=float, default=0.15)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--dedup", action="store_true",
+                        help="let repeated images hit the per-user near-duplicate index (reported as caption_cached)")
+    parser.add_argument("--fast-hash", action="store_true", help="cheap password KDF so logins do not dominate")
+    parser.add_argument("--json", default=None, help="also write the full report to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hasher = PasswordHasher({"algorithm": "pbkdf2_sha256", "params": {"iterations": 1000}}) if args.fast_hash else None
+        auth = AuthSystem(store=SQLiteUserStore(os.path.join(tmp, "users.db")), hasher=hasher)
+        user_count = max(args.sessions, args.max_sessions if args.find_saturation else 0,
+                         max((s for s, _ in parse_profile(args.ramp)), default=0) if args.ramp else 0)
+        users = [(f"load_user_{i}", "load-test-pass") for i in range(user_count)]
+        for username, password in users:
+            auth.register_user(username, password)
+
+        # With --dedup, a private near-duplicate index so earlier runs (or the app's index) do not add cache hits
+        pipeline = CaptionPipeline(image_index=PerceptualImageIndex(os.path.join(tmp, "image_index.db")))
+        stub_network(pipeline, args.translate_latency, args.tts_latency)
+        print("Loading models...")
+        pipeline.load_model()
+        test = LoadTest(pipeline, auth, users, images=args.images, think_time=args.think_time, seed=args.seed,
+                        dedup=args.dedup)
+
+        output = {}
+        if args.find_saturation:
+            levels = [1]
+            while levels[-1] * 2 <= args.max_sessions:
+                levels.append(levels[-1] * 2)
+            saturation, reports = find_saturation(test, levels, args.step_seconds)
+            for report in reports:
+                print(f"{report['sessions']} sessions:\n{_format_report(report)}")
+            print(f"Saturation point: {saturation} concurrent sessions")
+            output = {"saturation_sessions": saturation, "levels": reports}
+        else:
+            profile = parse_profile(args.ramp) if args.ramp else [(args.sessions, args.duration)]
+            records, samples, steps = test.run(profile)
+            for step in steps:
+                report = summarize(records, step["start"], step["end"])
+                report.update(summarize_resources(samples, step["start"], step["end"]))
+                print(f"{step['sessions']} sessions for {step['end'] - step['start']:.0f}s:\n{_format_report(report)}")
+            overall = summarize(records)
+            overall.update(summarize_resources(samples))
+            print(f"Overall:\n{_format_report(overall)}")
+            output = {"steps": steps, "overall": overall, "resources": samples}
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(output, f, indent=2)
+        pipeline.models.stop()
+        auth.close()
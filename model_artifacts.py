@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import warnings
+from pathlib import Path
+
+
+BLIP_MODEL_ID = "Salesforce/blip-image-captioning-base"
+BLIP_PATTERNS = ["*.json", "*.txt", "*.safetensors"]
+EASYOCR_LANGUAGES = ["en"]
+
+# safetensors dtype tag -> torch dtype name
+_SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+class ArtifactError(Exception):
+    """A pinned artifact is missing or does not match its manifest"""
+
+
+def sha256_file(path, block_size=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class ArtifactStore:
+    """Pinned local copies of model files with a sha256 manifest per artifact.
+
+    Layout: <root>/<name>/manifest.json plus the files it lists. Full hashing of a
+    ~1 GB checkpoint takes a second or two, so after a successful check the
+    (size, mtime) of each file is stamped in .verified.json and later loads only
+    re-hash files whose stamp changed (MODEL_VERIFY=full forces a re-hash).
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or os.environ.get("MODEL_ARTIFACT_DIR", "models"))
+
+    def path(self, name):
+        return self.root / name
+
+    def has(self, name):
+        return (self.path(name) / "manifest.json").exists()
+
+    def manifest(self, name):
+        manifest_path = self.path(name) / "manifest.json"
+        if not manifest_path.exists():
+            raise ArtifactError(f"Artifact '{name}' is not pinned in {self.root}; run: python model_artifacts.py fetch")
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    def pin(self, name, source, revision=None):
+        """Write the manifest for every file currently in the artifact directory"""
+        directory = self.path(name)
+        files = {}
+        for file_path in sorted(directory.rglob("*")):
+            if not file_path.is_file() or file_path.name in ("manifest.json", ".verified.json"):
+                continue
+            if ".cache" in file_path.relative_to(directory).parts:
+                continue
+            files[file_path.relative_to(directory).as_posix()] = {
+                "size": file_path.stat().st_size,
+                "sha256": sha256_file(file_path),
+            }
+        manifest = {"name": name, "source": source, "revision": revision, "pinned_at": time.time(), "files": files}
+        _write_json(directory / "manifest.json", manifest)
+        _write_json(directory / ".verified.json", self._stamps(directory, files))
+        return manifest
+
+    @staticmethod
+    def _stamps(directory, files):
+        stamps = {}
+        for rel in files:
+            stat = (directory / rel).stat()
+            stamps[rel] = [stat.st_size, stat.st_mtime_ns]
+        return stamps
+
+    def verify(self, name, full=None):
+        """Check every manifest file; returns the artifact directory or raises ArtifactError"""
+        if full is None:
+            full = os.environ.get("MODEL_VERIFY", "fast") == "full"
+        directory = self.path(name)
+        files = self.manifest(name)["files"]
+        try:
+            with open(directory / ".verified.json") as f:
+                verified = json.load(f)
+        except (OSError, ValueError):
+            verified = {}
+
+        for rel, expected in files.items():
+            file_path = directory / rel
+            if not file_path.exists():
+                raise ArtifactError(f"{name}: missing {rel}")
+            stat = file_path.stat()
+            if stat.st_size != expected["size"]:
+                raise ArtifactError(f"{name}: {rel} is {stat.st_size} bytes, expected {expected['size']}")
+            if not full and verified.get(rel) == [stat.st_size, stat.st_mtime_ns]:
+                continue
+            if sha256_file(file_path) != expected["sha256"]:
+                raise ArtifactError(f"{name}: checksum mismatch for {rel}")
+
+        try:
+            _write_json(directory / ".verified.json", self._stamps(directory, files))
+        except OSError:
+            # Read-only artifact volume: verification still passed, we just re-hash next time
+            pass
+        return directory
+
+    def fetch_blip(self, model_id=BLIP_MODEL_ID, revision="main"):
+        """Download the BLIP processor and safetensors weights and pin the resolved commit"""
+        from huggingface_hub import HfApi, snapshot_download
+
+        commit = HfApi().model_info(model_id, revision=revision).sha
+        directory = self.path("blip")
+        directory.mkdir(parents=True, exist_ok=True)
+        snapshot_download(model_id, revision=commit, local_dir=str(directory), allow_patterns=BLIP_PATTERNS)
+        return self.pin("blip", model_id, commit)
+
+    def fetch_easyocr(self, languages=EASYOCR_LANGUAGES):
+        """Let EasyOCR download its detector/recognizer weights into the store, then pin them"""
+        import easyocr
+
+        directory = self.path("easyocr")
+        directory.mkdir(parents=True, exist_ok=True)
+        easyocr.Reader(list(languages), gpu=False, verbose=False,
+                       model_storage_directory=str(directory), download_enabled=True)
+        return self.pin("easyocr", f"easyocr:{easyocr.__version__}:{','.join(languages)}")
+
+
+def read_safetensors_header(path):
+    """(header dict, data start offset) of a .safetensors file"""
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    return header, 8 + header_size
+
+
+def load_safetensors_mmap(path):
+    """State dict whose tensors are views into a shared read-only mapping of the file.
+
+    Unlike safetensors.torch.load_file, nothing is copied into private memory, so
+    every process serving the same checkpoint shares the same page-cache pages.
+    The tensors must never be written to.
+    """
+    import torch
+
+    header, data_start = read_safetensors_header(path)
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    state = {}
+    with warnings.catch_warnings():
+        # torch warns that the buffer is not writable; that is the point
+        warnings.simplefilter("ignore", UserWarning)
+        for key, info in header.items():
+            dtype = getattr(torch, _SAFETENSORS_DTYPES[info["dtype"]])
+            start, end = info["data_offsets"]
+            if end == start:
+                state[key] = torch.empty(info["shape"], dtype=dtype)
+                continue
+            element_size = torch.empty((), dtype=dtype).element_size()
+            tensor = torch.frombuffer(mapping, dtype=dtype, count=(end - start) // element_size,
+                                      offset=data_start + start)
+            state[key] = tensor.view(info["shape"])
+    return state
+
+
+def _no_init_weights():
+    try:
+        from transformers.modeling_utils import no_init_weights
+        return no_init_weights()
+    except ImportError:
+        import contextlib
+        return contextlib.nullcontext()
+
+
+def load_blip(store=None):
+    """(processor, model) from the pinned local copy, with weights mapped from safetensors"""
+    from transformers import BlipConfig, BlipForConditionalGeneration, BlipProcessor
+
+    store = store or ArtifactStore()
+    directory = store.verify("blip")
+    processor = BlipProcessor.from_pretrained(str(directory), local_files_only=True)
+    weights = directory / "model.safetensors"
+    try:
+        config = BlipConfig.from_pretrained(str(directory), local_files_only=True)
+        with _no_init_weights():
+            model = BlipForConditionalGeneration(config)
+        # assign=True swaps the mapped tensors in as the parameters instead of copying into them
+        missing, unexpected = model.load_state_dict(load_safetensors_mmap(weights), strict=False, assign=True)
+        tied = getattr(model, "_tied_weights_keys", None) or []
+        if unexpected or len(missing) > len(tied):
+            raise ArtifactError(f"checkpoint does not match model ({len(missing)} missing, {len(unexpected)} unexpected)")
+        model.tie_weights()
+    except (ArtifactError, TypeError, KeyError, RuntimeError) as e:
+        # Older torch without assign=, or an unexpected checkpoint layout
+        print(f"Shared mmap load unavailable ({e}); using from_pretrained")
+        model = BlipForConditionalGeneration.from_pretrained(str(directory), local_files_only=True, use_safetensors=True)
+    model.eval()
+    return processor, model
+
+
+def load_easyocr(languages=EASYOCR_LANGUAGES, store=None):
+    """EasyOCR reader restricted to the pinned weights (never downloads)"""
+    import easyocr
+
+    store = store or ArtifactStore()
+    directory = store.verify("easyocr")
+    return easyocr.Reader(list(languages), gpu=False, verbose=False,
+                          model_storage_directory=str(directory), download_enabled=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fetch, pin and verify local model artifacts")
+    parser.add_argument("command", choices=["fetch", "verify", "list"])
+    parser.add_argument("--root", default=None, help="artifact directory (default: $MODEL_ARTIFACT_DIR or ./models)")
+    parser.add_argument("--revision", default="main", help="BLIP hub revision to pin")
+    parser.add_argument("--only", choices=["blip", "easyocr"], default=None)
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.root)
+    names = [args.only] if args.only else ["blip", "easyocr"]
+    for name in names:
+        if args.command == "fetch":
+            manifest = store.fetch_blip(revision=args.revision) if name == "blip" else store.fetch_easyocr()
+            print(f"Pinned {name} ({manifest['source']} @ {manifest['revision']}): {len(manifest['files'])} files")
+        elif args.command == "verify":
+            start = time.perf_counter()
+            store.verify(name, full=True)
+            print(f"{name}: OK ({time.perf_counter() - start:.1f}s)")
+        else:
+            if not store.has(name):
+                print(f"{name}: not pinned")
+                continue
+            manifest = store.manifest(name)
+            total_mb = sum(f["size"] for f in manifest["files"].values()) / (1024 * 1024)
+            print(f"{name}: {manifest['source']} @ {manifest['revision']}, {len(manifest['files'])} files, {total_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import collections
+import ctypes
+import gc
+import os
+import threading
+import time
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (psutil if installed, else /proc)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def release_memory():
+    """Collect garbage and ask the allocators to hand freed pages back to the OS"""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+    try:
+        # glibc keeps freed arenas around; malloc_trim returns them so RSS actually drops
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def from_pretrained_mmap(cls, model_id, **kwargs):
+    """from_pretrained preferring safetensors weights, which are memory-mapped instead of
+    unpickled so a reload after an idle unload mostly re-maps pages from the page cache"""
+    if os.environ.get("MODEL_USE_SAFETENSORS", "1") == "0":
+        return cls.from_pretrained(model_id, **kwargs)
+    try:
+        return cls.from_pretrained(model_id, use_safetensors=True, low_cpu_mem_usage=True, **kwargs)
+    except (OSError, ValueError, ImportError) as e:
+        # No .safetensors in the repo (or the safetensors package is missing)
+        print(f"Safetensors load failed for {model_id}, falling back: {e}")
+        return cls.from_pretrained(model_id, **kwargs)
+
+
+class ModelManager:
+    """Loads models on demand and unloads them when idle or when memory runs short.
+
+    memory_limit_mb is compared with the whole process RSS. When unloading every model
+    cannot bring RSS under it (e.g. the limit is below the RSS the process starts with),
+    the manager logs that once and stops evicting until RSS drops under the limit again,
+    instead of unloading and reloading on every check.
+    """
+
+    def __init__(self, idle_ttl=None, memory_limit_mb=None, check_interval=30):
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.environ.get("MODEL_IDLE_TTL", 1800))
+        limit = memory_limit_mb if memory_limit_mb is not None else os.environ.get("MODEL_MEMORY_LIMIT_MB")
+        self.memory_limit_mb = float(limit) if limit else None
+        self.check_interval = check_interval
+        self.baseline_rss_mb = current_rss_mb()
+        self._limit_unreachable = False
+        self._models = {}  # name -> {"loader", "value", "last_used", "lock", "loaded_rss_mb"}
+        self._idle_hooks = []  # callables run by the reaper, for caches that unload their own parts
+        self._lock = threading.Lock()
+        self.events = collections.deque(maxlen=200)
+        self._stopped = threading.Event()
+        if self.memory_limit_mb and self.baseline_rss_mb >= self.memory_limit_mb:
+            self._limit_unreachable = True
+            self._record("limit_unreachable", "*", limit_mb=self.memory_limit_mb,
+                         baseline_mb=round(self.baseline_rss_mb, 1))
+        self._thread = threading.Thread(target=self._run, name="model-reaper", daemon=True)
+        self._thread.start()
+
+    def register(self, name, loader):
+        """Register a zero-argument loader; nothing is loaded until get() is called"""
+        with self._lock:
+            self._models.setdefault(name, {
+                "loader": loader,
+                "value": None,
+                "last_used": 0.0,
+                "lock": threading.Lock(),
+                "loaded_rss_mb": 0.0,
+            })
+
+    def add_idle_hook(self, hook):
+        """Run hook() on every reaper pass, e.g. a pool's own idle unloading"""
+        self._idle_hooks.append(hook)
+
+    def _record(self, event, name, **details):
+        entry = {"event": event, "model": name, "time": time.time()}
+        entry.update(details)
+        self.events.append(entry)
+        summary = ", ".join(f"{k}={v}" for k, v in details.items())
+        print(f"[models] {event} {name} ({summary})")
+
+    def get(self, name):
+        """Return the loaded model, loading it first if needed"""
+        with self._lock:
+            slot = self._models[name]
+        slot["last_used"] = time.time()
+        if slot["value"] is not None:
+            return slot["value"]
+
+        with slot["lock"]:
+            if slot["value"] is None:
+                # Make room first if loading would push us over the ceiling; the model's size
+                # is what it added last time it loaded (unknown, so 0, on its first load)
+                self._enforce_memory_limit(exclude=name, incoming_mb=slot["loaded_rss_mb"])
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                slot["value"] = slot["loader"]()
+                rss_after = current_rss_mb()
+                slot["loaded_rss_mb"] = max(rss_after - rss_before, 0.0)
+                self._record(
+                    "load", name,
+                    seconds=round(time.perf_counter() - start, 2),
+                    rss_mb=round(rss_after, 1),
+                    added_mb=round(slot["loaded_rss_mb"], 1),
+                )
+            slot["last_used"] = time.time()
+            return slot["value"]
+
+    def unload(self, name, reason="manual"):
+        """Drop the manager's reference to a model and reclaim its memory"""
+        with self._lock:
+            slot = self._models.get(name)
+        if slot is None:
+            return 0.0
+        with slot["lock"]:
+            if slot["value"] is None:
+                return 0.0
+            rss_before = current_rss_mb()
+            # Requests already holding the model keep it alive until they finish
+            slot["value"] = None
+            release_memory()
+            reclaimed = max(rss_before - current_rss_mb(), 0.0)
+            self._record("unload", name, reason=reason, reclaimed_mb=round(reclaimed, 1))
+            return reclaimed
+
+    def status(self):
+        """Loaded state and idle time of every registered model"""
+        now = time.time()
+        with self._lock:
+            slots = list(self._models.items())
+        return {
+            name: {
+                "loaded": slot["value"] is not None,
+                "idle_seconds": round(now - slot["last_used"]) if slot["last_used"] else None,
+                "approx_mb": round(slot["loaded_rss_mb"], 1),
+            }
+            for name, slot in slots
+        }
+
+    def _loaded_by_idle(self, exclude=None):
+        with self._lock:
+            loaded = [(slot["last_used"], name) for name, slot in self._models.items()
+                      if slot["value"] is not None and name != exclude]
+        return [name for _, name in sorted(loaded)]
+
+    def _enforce_memory_limit(self, exclude=None, incoming_mb=0.0):
+        """Unload least recently used models until RSS plus incoming_mb is under the limit"""
+        if not self.memory_limit_mb:
+            return
+        rss = current_rss_mb()
+        if rss < self.memory_limit_mb:
+            self._limit_unreachable = False
+        if rss + incoming_mb < self.memory_limit_mb or self._limit_unreachable:
+            return
+        loaded = self._loaded_by_idle(exclude)
+        for name in loaded:
+            self.unload(name, reason="memory")
+            if current_rss_mb() + incoming_mb < self.memory_limit_mb:
+                return
+        if exclude is None:
+            # Nothing left to evict and still over the limit: unloading cannot help
+            self._limit_unreachable = True
+            self._record("limit_unreachable", "*", limit_mb=self.memory_limit_mb,
+                         rss_mb=round(current_rss_mb(), 1), baseline_mb=round(self.baseline_rss_mb, 1))
+
+    def _unload_idle(self):
+        if self.idle_ttl <= 0:
+            return
+        cutoff = time.time() - self.idle_ttl
+        for name in self._loaded_by_idle():
+            with self._lock:
+                last_used = self._models[name]["last_used"]
+            if last_used < cutoff:
+                self.unload(name, reason="idle")
+
+    def _run(self):
+        while not self._stopped.wait(self.check_interval):
+            try:
+                self._unload_idle()
+                for hook in self._idle_hooks:
+                    hook()
+                self._enforce_memory_limit()
+            except Exception as e:
+                print(f"Error in model reaper: {e}")
+
+    def stop(self):
+        self._stopped.set()
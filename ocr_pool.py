@@ -0,0 +1,167 @@
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+from model_lifecycle import current_rss_mb, release_memory
+
+
+# Languages that share one EasyOCR recognizer; each group also reads English
+OCR_SCRIPT_GROUPS = {
+    "latin": ("en",),
+    "cyrillic": ("ru", "en"),
+    "devanagari": ("hi", "en"),
+    "arabic": ("ar", "en"),
+    "chinese": ("ch_sim", "en"),
+    "japanese": ("ja", "en"),
+    "korean": ("ko", "en"),
+    "thai": ("th", "en"),
+}
+
+
+# Reader attributes that EasyOCR only sets when built with detector=True (getDetectorPath
+# sets the last three); detect() and readtext() need all of them
+DETECTOR_ATTRIBUTES = ("detector", "get_textbox", "get_detector", "detect_network")
+
+
+def configured_scripts():
+    """Script groups enabled via OCR_SCRIPTS (comma separated, default: latin only)"""
+    names = [name.strip() for name in os.environ.get("OCR_SCRIPTS", "latin").split(",") if name.strip()]
+    unknown = [name for name in names if name not in OCR_SCRIPT_GROUPS]
+    if unknown:
+        print(f"Ignoring unknown OCR_SCRIPTS entries: {', '.join(unknown)}")
+    return [name for name in names if name in OCR_SCRIPT_GROUPS] or ["latin"]
+
+
+def _easyocr_factory(languages, detector):
+    import easyocr
+    from model_artifacts import ArtifactStore
+
+    kwargs = {}
+    store = ArtifactStore()
+    if store.has("easyocr"):
+        kwargs = {"model_storage_directory": str(store.verify("easyocr")), "download_enabled": False}
+    return easyocr.Reader(list(languages), gpu=False, verbose=False, detector=detector, **kwargs)
+
+
+class OCRReaderPool:
+    """EasyOCR readers keyed by language set, loaded lazily and sharing one CRAFT detector.
+
+    Only the first reader loads the detector; later readers are created recognizer-only
+    and borrow it (DETECTOR_ATTRIBUTES). The pool keeps its own reference to those, so
+    evicting the reader that loaded the detector does not break the others. Recognizers
+    are evicted least-recently-used first once their summed resident size exceeds
+    memory_limit_mb (OCR_POOL_MEMORY_MB, default 1024), and unload_idle() drops readers
+    unused for idle_ttl seconds (MODEL_IDLE_TTL), releasing the detector with the last one.
+    """
+
+    def __init__(self, scripts=None, memory_limit_mb=None, factory=None, idle_ttl=None, clock=time.time):
+        self.scripts = list(scripts or configured_scripts())
+        limit = memory_limit_mb if memory_limit_mb is not None else os.environ.get("OCR_POOL_MEMORY_MB", 1024)
+        self.memory_limit_mb = float(limit)
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.environ.get("MODEL_IDLE_TTL", 1800))
+        self.clock = clock
+        self.factory = factory or _easyocr_factory
+        self._readers = collections.OrderedDict()  # languages -> (reader, approx_mb)
+        self._last_used = {}  # languages -> clock() of the last get()
+        self._detector = None
+        self._lock = threading.RLock()
+        self.evictions = 0
+
+    @staticmethod
+    def key(languages):
+        return tuple(sorted(set(languages)))
+
+    def get(self, languages=("en",)):
+        """Reader for the language set, loading (and evicting others) as needed"""
+        key = self.key(languages)
+        with self._lock:
+            self._last_used[key] = self.clock()
+            if key in self._readers:
+                self._readers.move_to_end(key)
+                return self._readers[key][0]
+            rss_before = current_rss_mb()
+            if self._detector is None:
+                reader = self.factory(key, True)
+                self._detector = {name: getattr(reader, name) for name in DETECTOR_ATTRIBUTES}
+            else:
+                reader = self.factory(key, False)
+                for name, value in self._detector.items():
+                    setattr(reader, name, value)
+            self._readers[key] = (reader, max(current_rss_mb() - rss_before, 0.0))
+            self._evict(keep=key)
+            return reader
+
+    def get_script(self, script):
+        return self.get(OCR_SCRIPT_GROUPS[script])
+
+    def _evict(self, keep):
+        evicted = False
+        while len(self._readers) > 1 and sum(mb for _, mb in self._readers.values()) > self.memory_limit_mb:
+            oldest = next(iter(self._readers))
+            if oldest == keep:
+                break
+            del self._readers[oldest]
+            self._last_used.pop(oldest, None)
+            self.evictions += 1
+            evicted = True
+            print(f"[ocr] evicted reader {','.join(oldest)}")
+        if evicted:
+            # The detector stays referenced by self._detector, so only recognizer memory is freed
+            release_memory()
+
+    def unload_idle(self):
+        """Drop readers unused for idle_ttl seconds, and the shared detector once none are left"""
+        if self.idle_ttl <= 0:
+            return []
+        cutoff = self.clock() - self.idle_ttl
+        with self._lock:
+            idle = [key for key in self._readers if self._last_used.get(key, 0) < cutoff]
+            for key in idle:
+                del self._readers[key]
+                self._last_used.pop(key, None)
+                print(f"[ocr] unloaded idle reader {','.join(key)}")
+            if not self._readers and self._detector is not None:
+                self._detector = None
+                print("[ocr] unloaded idle detector")
+                idle.append("detector")
+        if idle:
+            release_memory()
+        return idle
+
+    def loaded(self):
+        with self._lock:
+            return {",".join(key): round(mb, 1) for key, (_, mb) in self._readers.items()}
+
+    def detect_script(self, gray, max_crops=3):
+        """Pick the configured script whose recognizer reads a few sample crops most confidently.
+
+        Detection runs once with the shared detector; each candidate recognizer then only
+        sees the largest max_crops text boxes, which is far cheaper than a full OCR pass
+        per script. Falls back to the first configured script when no text is found.
+        """
+        if len(self.scripts) == 1:
+            return self.scripts[0]
+        detector_reader = self.get_script(self.scripts[0])
+        horizontal, _ = detector_reader.detect(gray)
+        boxes = horizontal[0] if horizontal else []
+        if not boxes:
+            return self.scripts[0]
+        # Largest boxes carry the most glyphs and the least noise
+        sample = sorted(boxes, key=lambda b: (b[1] - b[0]) * (b[3] - b[2]), reverse=True)[:max_crops]
+        scores = {}
+        for script in self.scripts:
+            results = self.get_script(script).recognize(
+                gray, horizontal_list=sample, free_list=[], detail=1, paragraph=False, batch_size=len(sample)
+            )
+            scores[script] = float(np.mean([confidence for _, _, confidence in results])) if results else 0.0
+        return max(scores, key=scores.get)
+
+    def reader_for(self, image):
+        """Reader for the script found in the image (single-script pools skip detection)"""
+        if len(self.scripts) == 1:
+            return self.get_script(self.scripts[0])
+        gray = np.asarray(image.convert("L"))
+        return self.get_script(self.detect_script(gray))
@@ -0,0 +1,126 @@
+import numpy as np
+
+from text_processing import OCR_SINGLE_CHARS, normalize_ocr_key
+
+
+MIN_CONFIDENCE = 0.25
+
+
+def _box_to_polygon(box):
+    """EasyOCR horizontal box [x_min, x_max, y_min, y_max] -> 4-point polygon"""
+    x_min, x_max, y_min, y_max = box
+    return [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+
+
+def _center(polygon):
+    points = np.asarray(polygon, dtype=np.float32)
+    return points[:, 0].mean(), points[:, 1].mean()
+
+
+def detect_regions(reader, image):
+    """Run the CRAFT detector once; returns (horizontal boxes, free-form polygons) clipped to the image"""
+    height, width = image.shape[:2]
+    horizontal, free = reader.detect(image)
+    horizontal = [
+        [max(0, int(x_min)), min(width, int(x_max)), max(0, int(y_min)), min(height, int(y_max))]
+        for x_min, x_max, y_min, y_max in (horizontal[0] if horizontal else [])
+    ]
+    horizontal = [box for box in horizontal if box[1] > box[0] and box[3] > box[2]]
+    free = [
+        [[min(max(0, x), width), min(max(0, y), height)] for x, y in polygon]
+        for polygon in (free[0] if free else [])
+    ]
+    return horizontal, free
+
+
+def recognize_variants(reader, variants, horizontal, free, batch_size=32):
+    """Recognize the detected regions on every variant in a single recognizer call.
+
+    The variants (same-sized grayscale arrays) are stacked vertically and the boxes
+    repeated with a y offset per variant, so all crops go through the recognizer as
+    one batched call. Returns {region_index: [(text, confidence), ...]}.
+    """
+    height = variants[0].shape[0]
+    stacked = np.ascontiguousarray(np.vstack(variants))
+    stacked_horizontal = []
+    stacked_free = []
+    for index in range(len(variants)):
+        offset = index * height
+        stacked_horizontal.extend(
+            [x_min, x_max, y_min + offset, y_max + offset] for x_min, x_max, y_min, y_max in horizontal
+        )
+        stacked_free.extend([[x, y + offset] for x, y in polygon] for polygon in free)
+
+    regions = [_box_to_polygon(box) for box in horizontal] + free
+    centers = np.array([_center(polygon) for polygon in regions], dtype=np.float32)
+
+    results = reader.recognize(
+        stacked,
+        horizontal_list=stacked_horizontal,
+        free_list=stacked_free,
+        detail=1,
+        paragraph=False,
+        batch_size=batch_size,
+    )
+
+    readings = {}
+    for bbox, text, confidence in results:
+        x, y = _center(bbox)
+        variant = min(int(y // height), len(variants) - 1)
+        # Map the crop back to the detected region it came from
+        distances = np.hypot(centers[:, 0] - x, centers[:, 1] - (y - variant * height))
+        readings.setdefault(int(distances.argmin()), []).append((text, confidence))
+    return regions, readings
+
+
+def vote(readings):
+    """Pick one reading per region: the normalized text with the highest summed confidence"""
+    winners = {}
+    for region, candidates in readings.items():
+        tallies = {}
+        for text, confidence in candidates:
+            cleaned = text.strip()
+            if confidence <= MIN_CONFIDENCE or not cleaned:
+                continue
+            # Filter out single characters unless they're common letters/numbers
+            if len(cleaned) == 1 and cleaned.lower() not in OCR_SINGLE_CHARS:
+                continue
+            key = normalize_ocr_key(cleaned)
+            if not key:
+                continue
+            tally = tallies.setdefault(key, {"score": 0.0, "text": cleaned, "confidence": confidence})
+            tally["score"] += confidence
+            if confidence > tally["confidence"]:
+                tally["text"], tally["confidence"] = cleaned, confidence
+        if tallies:
+            winners[region] = max(tallies.values(), key=lambda t: t["score"])
+    return winners
+
+
+def read_text_detect_once(reader, detect_image, variants, max_items=15):
+    """OCR items [(polygon, text, confidence)] in reading order, detecting text regions only once.
+
+    detect_image is the variant the detector runs on; variants must all be 2-D arrays of
+    the same shape. Raises ValueError when they are not, so callers can fall back.
+    """
+    if not variants or any(v.ndim != 2 or v.shape != variants[0].shape for v in variants):
+        raise ValueError("detect-once OCR needs same-sized grayscale variants")
+    horizontal, free = detect_regions(reader, detect_image)
+    if not horizontal and not free:
+        return []
+    regions, readings = recognize_variants(reader, variants, horizontal, free)
+    winners = vote(readings)
+
+    # Same text found in several regions (e.g. a repeated label) keeps its most confident reading
+    best = {}
+    for region, winner in winners.items():
+        key = normalize_ocr_key(winner["text"])
+        if key not in best or best[key][1]["confidence"] < winner["confidence"]:
+            best[key] = (region, winner)
+    top = sorted(best.values(), key=lambda item: item[1]["confidence"], reverse=True)[:max_items]
+
+    def reading_order(item):
+        x, y = _center(regions[item[0]])
+        return round(y / 20), x
+
+    return [(regions[region], w["text"], w["confidence"]) for region, w in sorted(top, key=reading_order)]
@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+
+# Beside this module rather than in whatever directory the process was started from
+DEFAULT_PROFILE_PATH = str(Path(__file__).resolve().parent / "password_hash_profile.json")
+DEFAULT_TARGET_MS = 100
+
+# Used when a profile cannot be calibrated (roughly OWASP minimums)
+FALLBACK_PARAMS = {
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "pbkdf2_sha256": {"iterations": 600000},
+}
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def scrypt_available():
+    """hashlib.scrypt needs OpenSSL 1.1+, so check before relying on it"""
+    try:
+        hashlib.scrypt(b"x", salt=b"y", n=2, r=1, p=1)
+        return True
+    except (AttributeError, ValueError):
+        return False
+
+
+def _derive(algorithm, params, password, salt):
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["iterations"], dklen=32)
+    raise ValueError(f"Unknown password hash algorithm: {algorithm}")
+
+
+def _time_derive(algorithm, params, rounds=3):
+    """Median seconds for one derivation with these parameters"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _derive(algorithm, params, "calibration-password", b"calibration-salt")
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate(target_ms=DEFAULT_TARGET_MS, algorithm=None):
+    """Pick cost parameters so one verification takes about target_ms on this machine"""
+    algorithm = algorithm or ("scrypt" if scrypt_available() else "pbkdf2_sha256")
+    target = target_ms / 1000.0
+
+    if algorithm == "scrypt":
+        # Memory-hard: double N (memory = 128 * N * r bytes) until we reach the target
+        params = {"n": 2 ** 12, "r": 8, "p": 1}
+        elapsed = _time_derive(algorithm, params)
+        while elapsed < target and params["n"] < 2 ** 20:
+            previous = (dict(params), elapsed)
+            params["n"] *= 2
+            elapsed = _time_derive(algorithm, params)
+            # Doubling can overshoot; keep whichever N lands closer to the target
+            if elapsed >= target and target - previous[1] < elapsed - target:
+                params, elapsed = previous
+                break
+    else:
+        # PBKDF2 cost is linear in iterations, so measure once and scale
+        probe = {"iterations": 100000}
+        elapsed = _time_derive(algorithm, probe)
+        params = {"iterations": max(100000, int(probe["iterations"] * target / max(elapsed, 1e-6)))}
+        elapsed = _time_derive(algorithm, params)
+
+    return {
+        "algorithm": algorithm,
+        "params": params,
+        "target_ms": target_ms,
+        "measured_ms": round(elapsed * 1000, 1),
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def profile_path(path=None):
+    """Hashing profile location: path, else $PASSWORD_HASH_PROFILE, else DEFAULT_PROFILE_PATH"""
+    return Path(path or os.environ.get("PASSWORD_HASH_PROFILE") or DEFAULT_PROFILE_PATH)
+
+
+def load_or_calibrate_profile(path=None, target_ms=None):
+    """Load the deployment's hashing profile, calibrating and saving it on first use"""
+    path = profile_path(path)
+    if path.exists():
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading password hash profile: {e}")
+
+    target_ms = target_ms or int(os.environ.get("PASSWORD_HASH_TARGET_MS", DEFAULT_TARGET_MS))
+    profile = calibrate(target_ms)
+    print(f"Calibrated password hashing ({profile['algorithm']}, {profile['measured_ms']} ms); saving to {path}")
+    try:
+        with open(path, 'w') as f:
+            json.dump(profile, f, indent=2)
+    except Exception as e:
+        print(f"Error saving password hash profile: {e}")
+    return profile
+
+
+class PasswordHasher:
+    """Salted scrypt/PBKDF2 password hashing with a bounded verification pool and cache.
+
+    verify_async() hands the KDF to the pool and returns a Future, so callers with
+    their own event loop or request queue are not held while it runs; verify() waits
+    for that Future. The pool bounds how many derivations (and scrypt buffers) run at
+    once: about max_workers / calibrated time logins per second.
+    """
+
+    def __init__(self, profile=None, max_workers=None, cache_size=1024, profile_path=None):
+        # Without a profile, profile_path (see profile_path()) is loaded, or calibrated and written
+        profile = profile or load_or_calibrate_profile(profile_path)
+        self.algorithm = profile["algorithm"]
+        self.params = dict(profile.get("params") or FALLBACK_PARAMS[self.algorithm])
+        max_workers = max_workers or int(os.environ.get("PASSWORD_HASH_WORKERS", 0)) or os.cpu_count() or 2
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-verify")
+        # Remembers successful (stored hash, password) checks, keyed by a keyed MAC, never plaintext
+        self._cache_key = secrets.token_bytes(32)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+
+    def hash(self, password):
+        """Return an encoded hash: algorithm$params$salt$digest"""
+        salt = secrets.token_bytes(16)
+        digest = _derive(self.algorithm, self.params, password, salt)
+        if self.algorithm == "scrypt":
+            cost = f"{self.params['n']}${self.params['r']}${self.params['p']}"
+        else:
+            cost = str(self.params["iterations"])
+        return f"{self.algorithm}${cost}${_b64(salt)}${_b64(digest)}"
+
+    @staticmethod
+    def is_legacy(stored_hash):
+        """Unsalted SHA-256 hex digests from the original AuthSystem"""
+        return "$" not in stored_hash and len(stored_hash) == 64
+
+    def needs_rehash(self, stored_hash):
+        """True if the hash is legacy or was made with different cost parameters"""
+        if self.is_legacy(stored_hash):
+            return True
+        parts = stored_hash.split("$")
+        if parts[0] != self.algorithm:
+            return True
+        if self.algorithm == "scrypt":
+            return [int(x) for x in parts[1:4]] != [self.params["n"], self.params["r"], self.params["p"]]
+        return int(parts[1]) != self.params["iterations"]
+
+    def _verify_now(self, password, stored_hash):
+        if self.is_legacy(stored_hash):
+            candidate = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(candidate, stored_hash)
+        parts = stored_hash.split("$")
+        algorithm = parts[0]
+        if algorithm == "scrypt":
+            params = {"n": int(parts[1]), "r": int(parts[2]), "p": int(parts[3])}
+            salt, expected = _unb64(parts[4]), _unb64(parts[5])
+        elif algorithm == "pbkdf2_sha256":
+            params = {"iterations": int(parts[1])}
+            salt, expected = _unb64(parts[2]), _unb64(parts[3])
+        else:
+            return False
+        return hmac.compare_digest(_derive(algorithm, params, password, salt), expected)
+
+    def _cache_token(self, password, stored_hash):
+        return hmac.new(self._cache_key, f"{stored_hash}\0{password}".encode(), hashlib.sha256).digest()
+
+    def _verify_and_cache(self, password, stored_hash, token):
+        try:
+            ok = self._verify_now(password, stored_hash)
+        except Exception as e:
+            print(f"Error verifying password: {e}")
+            return False
+        if ok:
+            with self._cache_lock:
+                self._cache[token] = True
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return ok
+
+    @staticmethod
+    def _done(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def verify_async(self, password, stored_hash):
+        """Future resolving to whether the password matches; the KDF runs on the pool.
+
+        Wrap it with asyncio.wrap_future() to await it from an event loop.
+        """
+        if not password or not stored_hash:
+            return self._done(False)
+        token = self._cache_token(password, stored_hash)
+        with self._cache_lock:
+            if token in self._cache:
+                self._cache.move_to_end(token)
+                return self._done(True)
+        return self._pool.submit(self._verify_and_cache, password, stored_hash, token)
+
+    def verify(self, password, stored_hash, timeout=30):
+        """Check a password against a stored hash, waiting for the pool's result"""
+        try:
+            return self.verify_async(password, stored_hash).result(timeout=timeout)
+        except Exception as e:
+            print(f"Error verifying password: {e}")
+            return False
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calibrate password hashing cost for this machine")
+    parser.add_argument("--target-ms", type=int, default=DEFAULT_TARGET_MS)
+    parser.add_argument("--algorithm", choices=["scrypt", "pbkdf2_sha256"])
+    parser.add_argument("--output", default=None, help=f"profile path (default: $PASSWORD_HASH_PROFILE or {DEFAULT_PROFILE_PATH})")
+    args = parser.parse_args()
+
+    result = calibrate(args.target_ms, args.algorithm)
+    with open(profile_path(args.output), 'w') as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
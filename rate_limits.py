@@ -0,0 +1,270 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+# Per-action token buckets: burst capacity, tokens refilled per minute, and the daily
+# compute budget in seconds of work charged to that action
+DEFAULT_LIMITS = {
+    "caption": {"capacity": 5, "per_minute": 6, "daily_seconds": 1800},
+    "ocr": {"capacity": 10, "per_minute": 12, "daily_seconds": 900},
+    "translate": {"capacity": 20, "per_minute": 30, "daily_seconds": 600},
+    "tts": {"capacity": 10, "per_minute": 12, "daily_seconds": 900},
+}
+
+ACTION_LABELS = {"caption": "Caption", "ocr": "OCR", "translate": "Translation", "tts": "Voice"}
+
+
+def configured_limits():
+    """DEFAULT_LIMITS with overrides from RATE_LIMITS, a JSON object such as
+    '{"caption": {"per_minute": 2}, "tts": {"daily_seconds": 300}}'"""
+    limits = {action: dict(values) for action, values in DEFAULT_LIMITS.items()}
+    raw = os.environ.get("RATE_LIMITS")
+    if raw:
+        try:
+            for action, values in json.loads(raw).items():
+                limits.setdefault(action, dict(DEFAULT_LIMITS["caption"])).update(values)
+        except (ValueError, AttributeError) as e:
+            print(f"Ignoring invalid RATE_LIMITS: {e}")
+    return limits
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a user is out of tokens or daily compute for an action"""
+
+    def __init__(self, action, retry_after, reason="rate"):
+        self.action = action
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+        label = ACTION_LABELS.get(action, action)
+        if reason == "quota":
+            message = f"Daily {label.lower()} quota used up - try again in {self.retry_after} seconds"
+        else:
+            message = f"{label} limit reached - try again in {self.retry_after} seconds"
+        super().__init__(message)
+
+
+def _day(now):
+    return datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+
+
+def _seconds_until_tomorrow(now):
+    moment = datetime.fromtimestamp(now)
+    tomorrow = (moment + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - moment).total_seconds()
+
+
+class RateLimiter:
+    """Token-bucket rate limits and daily compute quotas per user and action, in SQLite.
+
+    Every check is one short IMMEDIATE transaction, so Streamlit and API worker
+    processes sharing the database file enforce the same limits. Usernames listed in
+    RATE_LIMIT_ADMINS (default: admin) are counted but never limited, and may view usage.
+    """
+
+    def __init__(self, path="rate_limits.db", limits=None, admins=None, clock=time.time):
+        self.path = Path(path)
+        self.limits = limits or configured_limits()
+        if admins is None:
+            admins = [name.strip() for name in os.environ.get("RATE_LIMIT_ADMINS", "admin").split(",")]
+        self.admins = {name for name in admins if name}
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS buckets (
+                       username TEXT NOT NULL,
+                       action TEXT NOT NULL,
+                       tokens REAL NOT NULL,
+                       updated_at REAL NOT NULL,
+                       PRIMARY KEY (username, action)
+                   )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS usage (
+                       username TEXT NOT NULL,
+                       day TEXT NOT NULL,
+                       action TEXT NOT NULL,
+                       requests INTEGER NOT NULL DEFAULT 0,
+                       rejected INTEGER NOT NULL DEFAULT 0,
+                       seconds REAL NOT NULL DEFAULT 0,
+                       PRIMARY KEY (username, day, action)
+                   )"""
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _bump_usage(self, conn, username, day, action, requests=0, rejected=0, seconds=0.0):
+        conn.execute(
+            "INSERT INTO usage (username, day, action, requests, rejected, seconds) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (username, day, action) DO UPDATE SET requests = requests + excluded.requests, "
+            "rejected = rejected + excluded.rejected, seconds = seconds + excluded.seconds",
+            (username, day, action, requests, rejected, seconds),
+        )
+
+    def acquire(self, username, action, cost=1.0):
+        """Take cost tokens from the user's bucket for action, or raise RateLimitExceeded"""
+        self.acquire_all(username, [action], cost)
+
+    def acquire_all(self, username, actions, cost=1.0):
+        """Take cost tokens for every action in one transaction: either all are taken or none.
+
+        Each token counts as one request in the usage table, so a batch of N images
+        taken at cost N shows as N requests (or N rejected). Raises ValueError when cost exceeds an action's bucket capacity, since no amount
+        of waiting would let that request through.
+        """
+        limited = username not in self.admins
+        if limited:
+            for action in actions:
+                capacity = self.limits[action]["capacity"]
+                if cost > capacity:
+                    raise ValueError(f"At most {capacity:g} {ACTION_LABELS.get(action, action).lower()} "
+                                     f"requests can be made at once")
+        now = self.clock()
+        day = _day(now)
+        rejection = None
+        taken = []
+        with self._transaction() as conn:
+            for action in actions if limited else ():
+                rejection, tokens = self._check(conn, username, action, cost, now, day)
+                if rejection is not None:
+                    break
+                taken.append((action, tokens))
+            # Rejections are committed too, so the admin view shows who is being throttled
+            if rejection is not None:
+                self._bump_usage(conn, username, day, rejection.action, rejected=math.ceil(cost))
+            else:
+                for action, tokens in taken:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets (username, action, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                        (username, action, tokens - cost, now),
+                    )
+                for action in actions:
+                    self._bump_usage(conn, username, day, action, requests=math.ceil(cost))
+        if rejection is not None:
+            raise rejection
+
+    def _check(self, conn, username, action, cost, now, day):
+        """(RateLimitExceeded, None) for a quota or bucket miss, else (None, tokens available now)"""
+        limit = self.limits[action]
+        row = conn.execute(
+            "SELECT seconds FROM usage WHERE username = ? AND day = ? AND action = ?", (username, day, action)
+        ).fetchone()
+        if row is not None and row["seconds"] >= limit["daily_seconds"]:
+            return RateLimitExceeded(action, _seconds_until_tomorrow(now), "quota"), None
+
+        rate = limit["per_minute"] / 60.0
+        row = conn.execute(
+            "SELECT tokens, updated_at FROM buckets WHERE username = ? AND action = ?", (username, action)
+        ).fetchone()
+        tokens = limit["capacity"] if row is None else min(
+            limit["capacity"], row["tokens"] + max(0.0, now - row["updated_at"]) * rate
+        )
+        if tokens < cost:
+            return RateLimitExceeded(action, (cost - tokens) / rate), None
+        return None, tokens
+
+    def record(self, username, action, seconds):
+        """Charge seconds of compute to today's quota for action"""
+        with self._transaction() as conn:
+            self._bump_usage(conn, username, _day(self.clock()), action, seconds=seconds)
+
+    @contextmanager
+    def measure(self, username, action):
+        """Charge the wall time of the block to today's quota for action"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(username, action, time.perf_counter() - start)
+
+    @contextmanager
+    def limit(self, username, action):
+        """acquire() before the block and charge its wall time to the daily quota afterwards"""
+        self.acquire(username, action)
+        with self.measure(username, action):
+            yield
+
+    def today(self):
+        """Key of the current usage day (YYYY-MM-DD, local time)"""
+        return _day(self.clock())
+
+    def usage(self, day=None, username=None):
+        """Usage rows for one day (default today): username, action, requests, rejected, seconds"""
+        day = day or self.today()
+        query = "SELECT username, action, requests, rejected, seconds FROM usage WHERE day = ?"
+        params = [day]
+        if username is not None:
+            query += " AND username = ?"
+            params.append(username)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY seconds DESC, username, action", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def remaining(self, username):
+        """{action: (tokens now, compute seconds left today)} for one user"""
+        now = self.clock()
+        used = {row["action"]: row["seconds"] for row in self.usage(username=username)}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT action, tokens, updated_at FROM buckets WHERE username = ?", (username,)
+            ).fetchall()
+        buckets = {row["action"]: row for row in rows}
+        result = {}
+        for action, limit in self.limits.items():
+            row = buckets.get(action)
+            tokens = limit["capacity"] if row is None else min(
+                limit["capacity"], row["tokens"] + max(0.0, now - row["updated_at"]) * limit["per_minute"] / 60.0
+            )
+            result[action] = (tokens, max(0.0, limit["daily_seconds"] - used.get(action, 0.0)))
+        return result
+
+    def reset(self, username):
+        """Refill a user's buckets and clear today's usage"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM buckets WHERE username = ?", (username,))
+            conn.execute("DELETE FROM usage WHERE username = ? AND day = ?", (username, _day(self.clock())))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or reset per-user rate limit usage")
+    parser.add_argument("command", choices=["usage", "reset"])
+    parser.add_argument("--db", default="rate_limits.db")
+    parser.add_argument("--day", default=None, help="YYYY-MM-DD (default: today)")
+    parser.add_argument("--user", default=None)
+    args = parser.parse_args()
+    limiter = RateLimiter(args.db)
+    if args.command == "reset":
+        if not args.user:
+            parser.error("reset needs --user")
+        limiter.reset(args.user)
+        print(f"Reset limits for {args.user}")
+    else:
+        for row in limiter.usage(args.day, args.user):
+            print(f"{row['username']:<20} {row['action']:<10} {row['requests']:>6} requests "
+                  f"{row['rejected']:>5} rejected {row['seconds']:>9.1f}s")
+    limiter.close()
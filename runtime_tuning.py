@@ -0,0 +1,237 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+DEFAULT_PROFILE_PATH = "runtime_profile.json"
+
+
+def _cgroup_cpu_limit():
+    """CPU quota of the container in cores, or None when unlimited/unknown"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """Cores this process may actually use: affinity mask capped by the cgroup quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit:
+        # A 2.5-core quota can keep two threads busy without being throttled
+        cpus = min(cpus, max(1, math.floor(limit)))
+    return max(1, cpus)
+
+
+def default_profile(cpus=None, concurrency=None):
+    """Split the core budget evenly between concurrent inference slots"""
+    cpus = cpus or available_cpus()
+    concurrency = max(1, min(concurrency or (1 if cpus < 4 else 2), cpus))
+    threads = max(1, cpus // concurrency)
+    return {
+        "cpus": cpus,
+        "concurrency": concurrency,
+        "torch_threads": threads,
+        "interop_threads": 1,
+        # OpenCV preprocessing runs inside the same slot; its own pool would compete with torch
+        "opencv_threads": threads if concurrency == 1 else 1,
+    }
+
+
+def load_profile(path=None):
+    """Saved auto-tune profile if it matches this machine's core budget, else the default"""
+    path = Path(path or os.environ.get("RUNTIME_PROFILE", DEFAULT_PROFILE_PATH))
+    cpus = available_cpus()
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+        if profile.get("cpus") == cpus:
+            return profile
+        print(f"Runtime profile {path} was tuned for {profile.get('cpus')} CPUs, this host has {cpus}; using defaults")
+    except (OSError, ValueError):
+        pass
+    concurrency = os.environ.get("INFERENCE_CONCURRENCY")
+    return default_profile(cpus, int(concurrency) if concurrency else None)
+
+
+class RuntimeTuner:
+    """Applies a thread budget once per process and bounds concurrent inference to match it"""
+
+    def __init__(self, profile=None):
+        self.profile = profile or load_profile()
+        self._slots = threading.BoundedSemaphore(self.profile["concurrency"])
+        self.applied = False
+
+    def apply(self):
+        profile = self.profile
+        # Inherited by any worker processes (and read by OpenMP/MKL if torch is not imported yet)
+        os.environ.setdefault("OMP_NUM_THREADS", str(profile["torch_threads"]))
+        os.environ.setdefault("MKL_NUM_THREADS", str(profile["torch_threads"]))
+        try:
+            import torch
+            torch.set_num_threads(profile["torch_threads"])
+            try:
+                torch.set_num_interop_threads(profile["interop_threads"])
+            except RuntimeError:
+                # Can only be set before the first parallel op; keep whatever is active
+                pass
+        except ImportError:
+            pass
+        try:
+            import cv2
+            cv2.setNumThreads(profile["opencv_threads"])
+        except ImportError:
+            pass
+        self.applied = True
+        return self
+
+    @contextlib.contextmanager
+    def inference_slot(self):
+        """Hold one of the profile's concurrency slots for a BLIP/OCR run.
+
+        EasyOCR runs on torch, so capping concurrent slots is what keeps
+        simultaneous requests from multiplying torch_threads past the core count.
+        """
+        with self._slots:
+            yield
+
+
+def _default_workload():
+    """One caption + one OCR pass per image, using the same loaders as the app"""
+    import numpy as np
+    import torch
+    from model_artifacts import ArtifactStore, load_blip, load_easyocr
+
+    store = ArtifactStore()
+    if store.has("blip"):
+        processor, model = load_blip(store)
+    else:
+        from transformers import BlipForConditionalGeneration, BlipProcessor
+        model_id = "Salesforce/blip-image-captioning-base"
+        processor = BlipProcessor.from_pretrained(model_id)
+        model = BlipForConditionalGeneration.from_pretrained(model_id)
+    if store.has("easyocr"):
+        reader = load_easyocr(store=store)
+    else:
+        import easyocr
+        reader = easyocr.Reader(["en"], gpu=False, verbose=False)
+
+    def run(image):
+        inputs = processor(image, return_tensors="pt")
+        with torch.no_grad():
+            model.generate(**inputs, max_length=100, min_length=10, num_beams=8,
+                           length_penalty=0.8, early_stopping=True, no_repeat_ngram_size=3)
+        reader.readtext(np.array(image.convert("L")), detail=1, paragraph=False)
+
+    return run
+
+
+def _candidate_profiles(cpus):
+    seen = set()
+    for concurrency in (1, 2, 3, 4, 6, 8):
+        if concurrency > cpus:
+            break
+        for threads in sorted({cpus // concurrency, max(1, cpus // concurrency // 2)}):
+            if threads >= 1 and (concurrency, threads) not in seen:
+                seen.add((concurrency, threads))
+                profile = default_profile(cpus, concurrency)
+                profile["torch_threads"] = threads
+                if concurrency == 1:
+                    profile["opencv_threads"] = threads
+                yield profile
+
+
+def autotune(sample_dir="sample_images", limit=4, rounds=2, workload=None, path=None):
+    """Sweep concurrency x torch thread settings on the sample images and save the best profile.
+
+    Each candidate serves `rounds` passes over the images with `concurrency` parallel
+    requests; the winner has the highest throughput, ties broken by lower p50 latency.
+    """
+    from PIL import Image
+
+    images = [
+        Image.open(p).convert("RGB")
+        for p in sorted(Path(sample_dir).iterdir())
+        if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp")
+    ][:limit]
+    if not images:
+        raise ValueError(f"No sample images found in {sample_dir}")
+    run = workload or _default_workload()
+    cpus = available_cpus()
+
+    # Warm-up so lazy init and allocator growth are not charged to the first candidate
+    run(images[0])
+
+    results = []
+    for profile in _candidate_profiles(cpus):
+        tuner = RuntimeTuner(profile).apply()
+        latencies = []
+
+        def timed(image):
+            with tuner.inference_slot():
+                start = time.perf_counter()
+                run(image)
+                latencies.append(time.perf_counter() - start)
+
+        jobs = images * rounds
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=profile["concurrency"]) as pool:
+            list(pool.map(timed, jobs))
+        elapsed = time.perf_counter() - start
+        profile["throughput"] = round(len(jobs) / elapsed, 3)
+        profile["p50_seconds"] = round(statistics.median(latencies), 3)
+        results.append(profile)
+        print(f"concurrency={profile['concurrency']} torch_threads={profile['torch_threads']}: "
+              f"{profile['throughput']:.2f} img/s, p50 {profile['p50_seconds']:.2f}s")
+
+    best = max(results, key=lambda p: (p["throughput"], -p["p50_seconds"]))
+    best["tuned_at"] = time.time()
+    path = Path(path or os.environ.get("RUNTIME_PROFILE", DEFAULT_PROFILE_PATH))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(best, f, indent=2)
+    os.replace(tmp_path, path)
+    return best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or auto-tune the CPU thread budget")
+    parser.add_argument("command", choices=["show", "autotune"])
+    parser.add_argument("--samples", default="sample_images")
+    parser.add_argument("--limit", type=int, default=4, help="number of sample images to use")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--output", default=None, help=f"profile path (default: $RUNTIME_PROFILE or {DEFAULT_PROFILE_PATH})")
+    args = parser.parse_args()
+    if args.command == "show":
+        print(f"available cpus: {available_cpus()} (cgroup quota: {_cgroup_cpu_limit()})")
+        print(json.dumps(load_profile(args.output), indent=2))
+    else:
+        best, _ = autotune(args.samples, args.limit, args.rounds, path=args.output)
+        print(f"Saved profile: {json.dumps(best)}")
@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from model_artifacts import sha256_file
+from text_processing import clean_text_for_speech
+from thumbnails import list_images
+
+
+SAMPLE_DIR = "sample_images"
+INDEX_VERSION = 2
+
+# Voice languages offered by the UI (English accents are separate gTTS voices)
+LANGUAGES = ["en", "en-gb", "en-au", "en-in", "hi", "kn", "es", "fr", "de", "it"]
+
+# UI defaults; the default variant is also translated and spoken in every language
+DEFAULT_PREFERENCES = {"length": "medium", "style": "descriptive", "tone": "neutral", "emojis": True, "hashtags": False}
+LENGTHS = ("short", "medium", "long")
+STYLES = ("descriptive", "creative", "poetic", "humorous", "professional")
+
+
+def variant_key(preferences):
+    p = dict(DEFAULT_PREFERENCES, **(preferences or {}))
+    return f"{p['length']}|{p['style']}|{p['tone']}|{int(bool(p['emojis']))}|{int(bool(p['hashtags']))}"
+
+
+def variant_preferences():
+    """Precomputed variants: every length x style at the default tone, emojis and hashtags"""
+    return [dict(DEFAULT_PREFERENCES, length=length, style=style) for length, style in itertools.product(LENGTHS, STYLES)]
+
+
+def audio_key(text, lang, slow=False):
+    """Audio identity: language, speed plus the text actually spoken"""
+    spoken = clean_text_for_speech(text).strip()
+    return hashlib.sha1(f"{lang}\0{int(bool(slow))}\0{spoken}".encode()).hexdigest()[:16]
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class SampleIndex:
+    """Precomputed captions, OCR text, caption variants, translations and audio for the bundled samples.
+
+    Layout: <root>/index.json plus <root>/audio/<key>.<ext>. Loading hashes each sample
+    file and only serves entries whose sha256 still matches, so an edited sample falls
+    back to live inference until the index is rebuilt (SAMPLE_INDEX_DIR, default sample_index).
+    The index is committed with the samples, so deploys serve it without running the models;
+    rebuild and commit it after changing sample_images/. Audio is normal speed only.
+    """
+
+    def __init__(self, root=None, sample_dir=SAMPLE_DIR):
+        self.root = Path(root or os.environ.get("SAMPLE_INDEX_DIR", "sample_index"))
+        self.sample_dir = Path(sample_dir)
+        self.samples = {}
+        self.translations = {}
+        self.audio = {}
+        self.stale = []
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.root / "index.json", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if data.get("version") == INDEX_VERSION else {}
+
+    def load(self):
+        """Read the index and keep the entries whose sample file is unchanged"""
+        data = self._read()
+        samples = {}
+        stale = []
+        for name, entry in data.get("samples", {}).items():
+            path = self.sample_dir / name
+            if path.is_file() and sha256_file(path) == entry["sha256"]:
+                samples[name] = entry
+            else:
+                stale.append(name)
+        with self._lock:
+            self.samples = samples
+            self.translations = data.get("translations", {})
+            self.audio = data.get("audio", {})
+            self.stale = stale
+        return self
+
+    def entry(self, name):
+        with self._lock:
+            return self.samples.get(name)
+
+    def caption(self, name, preferences):
+        """(caption, text_content, base_captions, extracted_text) for a sample, or None when not indexed.
+
+        Preference combinations that were not precomputed are composed from the stored
+        base captions and OCR text, which needs no model.
+        """
+        entry = self.entry(name)
+        if entry is None:
+            return None
+        variant = entry["variants"].get(variant_key(preferences))
+        if variant is not None:
+            caption, text_content = variant
+        else:
+            from caption_pipeline import caption_for_preferences
+            caption, text_content = caption_for_preferences(entry["base_captions"], entry["extracted_text"], preferences)
+        return caption, text_content, entry["base_captions"], entry["extracted_text"]
+
+    def translation(self, text, lang):
+        with self._lock:
+            return self.translations.get(text, {}).get(lang)
+
+    def audio_path(self, text, lang, slow=False):
+        """Precomputed audio file for text in lang at the given speed, or None"""
+        with self._lock:
+            filename = self.audio.get(audio_key(text, lang, slow))
+        if filename is None:
+            return None
+        path = self.root / "audio" / filename
+        return str(path) if path.exists() else None
+
+    def owns(self, path):
+        """Whether a file belongs to the index (and must not be deleted after playback)"""
+        try:
+            return Path(path).resolve().is_relative_to((self.root / "audio").resolve())
+        except (OSError, ValueError):
+            return False
+
+    def build(self, pipeline, languages=LANGUAGES, force=False, audio=True):
+        """Index every sample; unchanged files keep their entries, missing translations/audio are filled in.
+
+        Returns {"added": [...], "kept": [...], "removed": [...]}.
+        """
+        from caption_pipeline import caption_for_preferences
+        from PIL import Image
+
+        data = {} if force else self._read()
+        old_samples = data.get("samples", {})
+        translations = data.get("translations", {})
+        audio_files = data.get("audio", {})
+        audio_dir = self.root / "audio"
+        audio_dir.mkdir(parents=True, exist_ok=True)
+
+        samples = {}
+        report = {"added": [], "kept": [], "removed": []}
+        for path in list_images(self.sample_dir):
+            digest = sha256_file(path)
+            if old_samples.get(path.name, {}).get("sha256") == digest:
+                samples[path.name] = old_samples[path.name]
+                report["kept"].append(path.name)
+                continue
+            print(f"Captioning {path.name}...")
+            with Image.open(path) as image:
+                result = pipeline.caption(image.convert("RGB"), DEFAULT_PREFERENCES, candidates=True)
+            base_captions, extracted_text = result["base_captions"], result["extracted_text"]
+            samples[path.name] = {
+                "sha256": digest,
+                "base_captions": base_captions,
+                "extracted_text": extracted_text,
+                "variants": {
+                    variant_key(p): list(caption_for_preferences(base_captions, extracted_text, p))
+                    for p in variant_preferences()
+                },
+            }
+            report["added"].append(path.name)
+        report["removed"] = sorted(set(old_samples) - set(samples))
+
+        # Translate the medium-length variant of every style; speak the default variant
+        spoken = set()
+        used_texts = set()
+        for entry in samples.values():
+            for style in STYLES:
+                text = entry["variants"][variant_key(dict(DEFAULT_PREFERENCES, style=style))][0]
+                used_texts.add(text)
+                for lang in languages:
+                    if lang.startswith("en") or lang in translations.get(text, {}):
+                        continue
+                    try:
+                        translations.setdefault(text, {})[lang] = pipeline.translate(text, lang)
+                    except Exception as e:
+                        print(f"Translation to {lang} failed: {e}")
+            if not audio:
+                continue
+            default_text = entry["variants"][variant_key(DEFAULT_PREFERENCES)][0]
+            for lang in languages:
+                text = default_text if lang.startswith("en") else translations.get(default_text, {}).get(lang)
+                if not text:
+                    continue
+                key = audio_key(text, lang)
+                spoken.add(key)
+                if key in audio_files and (audio_dir / audio_files[key]).exists():
+                    continue
+                try:
+                    generated = Path(pipeline.synthesize(text, lang))
+                except Exception as e:
+                    print(f"Speech in {lang} failed: {e}")
+                    continue
+                filename = f"{key}{generated.suffix}"
+                shutil.move(str(generated), audio_dir / filename)
+                audio_files[key] = filename
+
+        translations = {text: langs for text, langs in translations.items() if text in used_texts}
+        audio_files = {key: filename for key, filename in audio_files.items() if key in spoken}
+        for path in audio_dir.iterdir():
+            if path.name not in audio_files.values():
+                path.unlink()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_json(self.root / "index.json", {
+            "version": INDEX_VERSION,
+            "samples": samples,
+            "translations": translations,
+            "audio": audio_files,
+        })
+        self.load()
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute captions, OCR, translations and audio for sample_images")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--root", default=None, help="index directory (default: SAMPLE_INDEX_DIR or sample_index)")
+    parser.add_argument("--force", action="store_true", help="re-caption every sample, not just changed ones")
+    parser.add_argument("--languages", default=",".join(LANGUAGES))
+    parser.add_argument("--no-audio", action="store_true")
+    args = parser.parse_args()
+
+    index = SampleIndex(args.root)
+    if args.command == "verify":
+        index.load()
+        missing = [p.name for p in list_images(SAMPLE_DIR) if index.entry(p.name) is None]
+        print(f"{len(index.samples)} samples indexed, {len(missing)} stale or missing: {', '.join(missing) or 'none'}")
+        raise SystemExit(1 if missing else 0)
+
+    from caption_pipeline import CaptionPipeline
+    from image_dedup import PerceptualImageIndex
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Samples are captioned without an owner, so the near-duplicate index is never consulted;
+        # a throwaway one keeps the app's image_index.db untouched
+        pipeline = CaptionPipeline(image_index=PerceptualImageIndex(os.path.join(tmp, "image_index.db")))
+        report = index.build(pipeline, languages=args.languages.split(","), force=args.force, audio=not args.no_audio)
+        pipeline.models.stop()
+    print(f"{len(report['added'])} captioned, {len(report['kept'])} unchanged, {len(report['removed'])} removed; "
+          f"{len(index.audio)} audio files in {index.root}")
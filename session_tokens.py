@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+
+class SessionManager:
+    """Signed session tokens with a per-process cache of verified user profiles"""
+
+    def __init__(self, auth, secret=None, ttl=3600):
+        self.auth = auth
+        self.ttl = ttl
+        secret = secret or os.environ.get("SESSION_SECRET")
+        # Without a configured secret, tokens are only valid for the lifetime of this process
+        self._secret = secret.encode() if isinstance(secret, str) else (secret or secrets.token_bytes(32))
+        self._sessions = {}  # token -> {"username", "expires", "profile"}
+        self._revoked = {}  # token -> expires, so logged-out tokens cannot be re-verified
+        self._lock = threading.Lock()
+        auth.add_change_listener(self.invalidate)
+
+    def _sign(self, payload):
+        digest = hmac.new(self._secret, payload.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+    def _parse(self, token):
+        """Return (username, expires) for a correctly signed token, else None"""
+        try:
+            payload, signature = token.rsplit(".", 1)
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            encoded_user, expires, _nonce = payload.split(".")
+            username = base64.urlsafe_b64decode(encoded_user + "=" * (-len(encoded_user) % 4)).decode()
+            return username, int(expires)
+        except Exception:
+            return None
+
+    def issue(self, username):
+        """Create a token for an authenticated user and cache their profile"""
+        expires = int(time.time()) + self.ttl
+        encoded_user = base64.urlsafe_b64encode(username.encode()).decode().rstrip("=")
+        payload = f"{encoded_user}.{expires}.{secrets.token_urlsafe(8)}"
+        token = f"{payload}.{self._sign(payload)}"
+        profile = self.auth.get_user_info(username)
+        self.purge_expired()
+        with self._lock:
+            self._sessions[token] = {"username": username, "expires": expires, "profile": profile}
+        return token
+
+    def get_profile(self, token):
+        """Return the cached profile for a valid token, or None if it is invalid or expired"""
+        if not token:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is not None:
+                if entry["expires"] <= now:
+                    del self._sessions[token]
+                    return None
+                if entry["profile"] is not None:
+                    return entry["profile"]
+
+        # Unknown token (e.g. issued by another worker) or invalidated profile: verify and reload
+        if entry is None:
+            if token in self._revoked:
+                return None
+            parsed = self._parse(token)
+            if parsed is None or parsed[1] <= now:
+                return None
+            username, expires = parsed
+        else:
+            username, expires = entry["username"], entry["expires"]
+
+        profile = self.auth.get_user_info(username)
+        if profile is None:
+            return None
+        with self._lock:
+            if token in self._revoked:
+                return None
+            self._sessions[token] = {"username": username, "expires": expires, "profile": profile}
+        return profile
+
+    def username_for(self, token):
+        """Username a valid token belongs to"""
+        if self.get_profile(token) is None:
+            return None
+        with self._lock:
+            entry = self._sessions.get(token)
+            return entry["username"] if entry else None
+
+    def invalidate(self, username):
+        """Drop cached profiles for a user so the next check reloads them"""
+        with self._lock:
+            for entry in self._sessions.values():
+                if entry["username"] == username:
+                    entry["profile"] = None
+
+    def revoke(self, token):
+        """Forget a token (logout)"""
+        with self._lock:
+            entry = self._sessions.pop(token, None)
+            parsed = self._parse(token) if entry is None else (entry["username"], entry["expires"])
+            if parsed is not None:
+                self._revoked[token] = parsed[1]
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for token in [t for t, e in self._sessions.items() if e["expires"] <= now]:
+                del self._sessions[token]
+            for token in [t for t, expires in self._revoked.items() if expires <= now]:
+                del self._revoked[token]
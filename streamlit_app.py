@@ -1,6 +1,5 @@
 import streamlit as st
-from PIL import Image, ImageEnhance, ImageFilter
-from transformers import BlipProcessor, BlipForConditionalGeneration
+from PIL import Image, ImageFilter
 import torch
 import requests
 
@@ -12,19 +11,24 @@ try:
 except Exception:
     pass
 
-import random
-from gtts import gTTS
 import tempfile
-import base64
 from pathlib import Path
 import os
-import easyocr
-import numpy as np
-import cv2
 from datetime import datetime
-import re
 from auth_system import AuthSystem
-from deep_translator import GoogleTranslator
+from session_tokens import SessionManager
+from thumbnails import ThumbnailCache, list_images
+from tts_streaming import ChunkedSpeechSynthesizer, combine_chunks
+from history_store import CaptionHistoryStore
+from image_dedup import PerceptualImageIndex, content_hash
+from rate_limits import ACTION_LABELS, RateLimitExceeded, RateLimiter
+from sample_index import SampleIndex
+from runtime_tuning import RuntimeTuner
+from blip_acceleration import BATCH_BUCKETS, AcceleratedBlip
+from image_enhance import enhance_for_caption
+from video_captioning import VIDEO_TYPES, caption_video, format_stats as format_video_stats, to_srt, to_vtt
+from caption_pipeline import CaptionPipeline, caption_for_preferences, enhance_caption, extract_text_from_image as run_ocr
+from text_processing import clean_text_for_speech, compose_caption
 
 # Configure the page
 st.set_page_config(
@@ -34,20 +38,45 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+@st.cache_resource
+def get_auth_system():
+    """Create one AuthSystem per process so the user store and its read cache survive reruns"""
+    return AuthSystem()
+
+@st.cache_resource
+def get_session_manager():
+    """Signed session tokens with cached profiles, shared by every session in this process"""
+    return SessionManager(get_auth_system(), ttl=8 * 3600)
+
+@st.cache_resource
+def get_runtime_tuner():
+    """Thread budget for torch/OpenCV (RUNTIME_PROFILE or cgroup-aware defaults), applied once per process"""
+    return RuntimeTuner().apply()
+
+runtime_tuner = get_runtime_tuner()
+
+@st.cache_resource
+def get_caption_pipeline():
+    """Captioning, OCR and language engines shared by every session in this process"""
+    return CaptionPipeline(tuner=runtime_tuner, image_index=get_image_index())
+
 # Initialize authentication system
-auth = AuthSystem()
+auth = get_auth_system()
+sessions = get_session_manager()
 
 # Session state for authentication
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
 if 'username' not in st.session_state:
     st.session_state.username = None
+if 'session_token' not in st.session_state:
+    st.session_state.session_token = None
 if 'show_register' not in st.session_state:
     st.session_state.show_register = False
 
 # Session state for app
-if 'caption_history' not in st.session_state:
-    st.session_state.caption_history = []
+if 'history_cursors' not in st.session_state:
+    st.session_state.history_cursors = [None]
 if 'model' not in st.session_state:
     st.session_state.model = None
 if 'processor' not in st.session_state:
@@ -57,327 +86,147 @@ if 'selected_language_index' not in st.session_state:
 if 'selected_speed' not in st.session_state:
     st.session_state.selected_speed = False
 
-@st.cache_resource
+def get_model_manager():
+    """Process-wide model manager: loads on demand, unloads after MODEL_IDLE_TTL seconds
+    idle or when RSS approaches MODEL_MEMORY_LIMIT_MB"""
+    return get_caption_pipeline().models
+
 def load_model():
     """Load BLIP model - completely free and runs locally"""
     try:
-        # Use the base model which is lighter and faster for deployment
-        # The large model (1.9GB) often causes memory issues on free cloud tiers
-        model_id = "Salesforce/blip-image-captioning-base"
-        processor = BlipProcessor.from_pretrained(model_id)
-        model = BlipForConditionalGeneration.from_pretrained(model_id)
-        return processor, model
+        return get_caption_pipeline().load_model()
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None, None
 
-@st.cache_resource
-def load_ocr_reader():
-    """Load EasyOCR reader with optimized settings - completely free and runs locally"""
+def load_ocr_reader(image=None):
+    """Load EasyOCR reader with optimized settings - completely free and runs locally
+    
+    With several OCR_SCRIPTS configured and an image given, the reader for the script
+    detected in the image is returned.
+    """
     try:
-        # Load with multiple languages for better accuracy
-        reader = easyocr.Reader(['en'], gpu=False, verbose=False)
-        return reader
+        return get_caption_pipeline().load_ocr_reader(image)
     except Exception as e:
         st.warning(f"OCR initialization warning: {str(e)}")
         return None
 
-def get_sample_images():
-    """Get list of sample images from the sample_images folder"""
-    sample_dir = Path("sample_images")
-    if not sample_dir.exists():
-        return []
-    
-    valid_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
-    sample_images = []
-    
-    for file_path in sample_dir.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in valid_extensions:
-            sample_images.append(file_path)
-    
-    return sorted(sample_images)
+@st.cache_resource
+def get_history_store():
+    """Persistent per-user caption history shared by all sessions in this process"""
+    return CaptionHistoryStore()
 
-def preprocess_image_for_ocr(image):
-    """Advanced image preprocessing for better OCR accuracy with multiple strategies"""
-    try:
-        # Convert PIL to OpenCV format
-        img_array = np.array(image)
-        
-        # Convert to grayscale
-        if len(img_array.shape) == 3:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        else:
-            gray = img_array
-        
-        # Apply multiple preprocessing techniques for best results
-        processed_images = []
-        
-        # 1. Original grayscale with slight denoising
-        denoised_gray = cv2.fastNlMeansDenoising(gray, None, h=5, templateWindowSize=7, searchWindowSize=21)
-        processed_images.append(denoised_gray)
-        
-        # 2. Adaptive thresholding - excellent for varying lighting
-        adaptive_thresh = cv2.adaptiveThreshold(
-            denoised_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
-        processed_images.append(adaptive_thresh)
-        
-        # 3. OTSU thresholding - great for bimodal images
-        _, otsu_thresh = cv2.threshold(denoised_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        processed_images.append(otsu_thresh)
-        
-        # 4. Morphological operations for text clarity
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        morph = cv2.morphologyEx(otsu_thresh, cv2.MORPH_CLOSE, kernel)
-        processed_images.append(morph)
-        
-        # 5. CLAHE for contrast enhancement
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(denoised_gray)
-        processed_images.append(enhanced)
-        
-        # 6. Bilateral filter for edge-preserving smoothing
-        bilateral = cv2.bilateralFilter(gray, 9, 75, 75)
-        processed_images.append(bilateral)
-        
-        # 7. Sharpening for better text edges
-        kernel_sharpen = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-        sharpened = cv2.filter2D(enhanced, -1, kernel_sharpen)
-        processed_images.append(sharpened)
-        
-        return processed_images
-    except Exception as e:
-        # Return original if preprocessing fails
-        return [np.array(image)]
+@st.cache_resource
+def get_rate_limiter():
+    """Per-user request rates and daily compute quotas, shared with other processes through rate_limits.db"""
+    return RateLimiter()
 
-def extract_text_from_image(image):
-    """Enhanced text extraction with multiple preprocessing strategies and intelligent filtering - Completely FREE"""
+def allow_request(*actions):
+    """Take one request per action from the user's buckets (all or none); shows how long to wait and returns False when limited"""
     try:
-        reader = load_ocr_reader()
-        if reader is None:
-            return ""
-        
-        # Get multiple preprocessed versions
-        processed_images = preprocess_image_for_ocr(image)
-        
-        all_texts = []
-        confidence_scores = []
-        bboxes = []
-        
-        # Try OCR on each preprocessed version
-        for proc_img in processed_images:
-            try:
-                results = reader.readtext(proc_img, detail=1, paragraph=False)  # Get confidence scores
-                
-                for (bbox, text, confidence) in results:
-                    # Only keep high-confidence detections (>0.25 threshold for better recall)
-                    cleaned_text = text.strip()
-                    if confidence > 0.25 and len(cleaned_text) > 0:
-                        # Filter out single characters unless they're common letters/numbers
-                        if len(cleaned_text) == 1 and cleaned_text.lower() not in 'abcdefghijklmnopqrstuvwxyz0123456789':
-                            continue
-                        all_texts.append(cleaned_text)
-                        confidence_scores.append(confidence)
-                        bboxes.append(bbox)
-            except Exception as ocr_error:
-                continue
-        
-        if not all_texts:
-            return ""
-        
-        # Advanced deduplication: Remove duplicates while preserving highest confidence
-        seen = {}
-        for text, conf, bbox in zip(all_texts, confidence_scores, bboxes):
-            # Normalize text for comparison (case-insensitive, remove special chars)
-            normalized = re.sub(r'[^a-zA-Z0-9\s]', '', text.lower().strip())
-            if not normalized:
-                continue
-            
-            # Keep the version with highest confidence
-            if normalized not in seen or seen[normalized]['confidence'] < conf:
-                seen[normalized] = {
-                    'text': text,
-                    'confidence': conf,
-                    'bbox': bbox
-                }
-        
-        # Sort by confidence and spatial position (top-to-bottom, left-to-right)
-        unique_items = sorted(seen.values(), key=lambda x: x['confidence'], reverse=True)
-        
-        # Extract top results
-        unique_texts = [item['text'] for item in unique_items[:15]]  # Top 15 most confident
-        
-        # Combine texts intelligently
-        final_text = ' '.join(unique_texts)
-        
-        # Advanced text cleaning
-        final_text = re.sub(r'\s+', ' ', final_text)  # Remove extra spaces
-        final_text = re.sub(r'([.!?])([A-Z])', r'\1 \2', final_text)  # Add space after punctuation
-        final_text = final_text.strip()
-        
-        # Fix common OCR errors
-        final_text = final_text.replace('|', 'I').replace('0', 'O') if final_text.isupper() else final_text
-        
-        return final_text
-    except Exception as e:
-        return ""
+        get_rate_limiter().acquire_all(st.session_state.username, actions)
+    except RateLimitExceeded as e:
+        st.warning(f"⏳ {e}")
+        return False
+    return True
 
-def enhance_caption(base_caption, preferences):
-    """Enhance the base caption based on user preferences"""
-    caption = base_caption.strip()
-    
-    # Adjust length
-    if preferences['length'] == 'short':
-        # Keep it concise
-        words = caption.split()
-        caption = ' '.join(words[:8])
-    elif preferences['length'] == 'long':
-        # Add more descriptive elements
-        descriptors = [
-            "This image captures",
-            "Here we see",
-            "The photograph shows",
-            "This scene depicts",
-            "We observe"
-        ]
-        caption = f"{random.choice(descriptors)} {caption}"
-    
-    # Adjust style
-    if preferences['style'] == 'creative':
-        creative_starts = ["Behold,", "Witness,", "Imagine,", "Picture this:"]
-        caption = f"{random.choice(creative_starts)} {caption}"
-    elif preferences['style'] == 'poetic':
-        caption = f"In this moment, {caption.lower()}, creating a scene of pure beauty"
-    elif preferences['style'] == 'humorous':
-        humorous_additions = [
-            " - and yes, it's as cool as it looks!",
-            " - living its best life!",
-            " - absolutely vibing!",
-            " - main character energy!"
-        ]
-        caption = f"{caption}{random.choice(humorous_additions)}"
-    elif preferences['style'] == 'professional':
-        caption = f"Professional documentation: {caption}"
-    
-    # Adjust tone
-    if preferences['tone'] == 'enthusiastic':
-        caption = caption + "!"
-    elif preferences['tone'] == 'mysterious':
-        caption = caption + "..."
-    
-    # Add emojis if requested
-    if preferences['emojis']:
-        emoji_sets = {
-            'default': ['✨', '🌟', '💫', '⭐', '🎨', '📸', '🖼️'],
-            'nature': ['🌿', '🌸', '🌺', '🌻', '🍃', '🌲'],
-            'happy': ['😊', '😄', '🥰', '💖', '❤️'],
-            'cool': ['😎', '🔥', '💯', '👌', '✌️']
-        }
-        selected_emojis = random.sample(emoji_sets['default'], 2)
-        caption = f"{selected_emojis[0]} {caption} {selected_emojis[1]}"
-    
-    # Add hashtags if requested
-    if preferences['hashtags']:
-        words = caption.lower().split()
-        hashtags = ['#' + word.strip('.,!?:;') for word in words if len(word) > 4][:3]
-        if hashtags:
-            caption = f"{caption}\n\n{' '.join(hashtags)} #AI #ImageCaption"
-    
+def charge_compute(action):
+    """Context manager charging the wrapped work to the user's daily quota for action"""
+    return get_rate_limiter().measure(st.session_state.username, action)
+
+@st.cache_resource
+def get_image_index():
+    """Perceptual-hash index of captioned images, used to skip inference for near-duplicates"""
+    return PerceptualImageIndex()
+
+@st.cache_resource
+def get_thumbnail_cache():
+    """Shared thumbnail cache for the sample gallery"""
+    return ThumbnailCache()
+
+def get_sample_images():
+    """Get list of sample images from the sample_images folder (rescanned only when it changes)"""
+    return list_images("sample_images")
+
+@st.cache_resource
+def get_sample_index():
+    """Precomputed captions, translations and audio for the bundled samples (built by sample_index.py)"""
+    return SampleIndex().load()
+
+# Loaded (and hash-checked) once at startup so the first sample request is already instant
+get_sample_index()
+
+def extract_text_from_image(image, reader=None):
+    """OCR text of an image using the shared reader pool ("" when OCR is unavailable)"""
+    reader = reader or load_ocr_reader()
+    return run_ocr(image, reader, runtime_tuner.inference_slot)
+
+def remember_candidates(fingerprint, captions, extracted_text):
+    """Keep the current image's candidates so preference changes can re-pick without inference"""
+    st.session_state['caption_candidates'] = {
+        'fingerprint': fingerprint,
+        'captions': captions,
+        'extracted_text': extracted_text,
+        'caption': None,
+        'preferences': None
+    }
+
+def caption_from_candidates(preferences):
+    """Final caption from the cached candidate that best fits the preferences"""
+    entry = st.session_state['caption_candidates']
+    caption, text_content = caption_for_preferences(entry['captions'], entry['extracted_text'], preferences)
+    st.session_state['last_extracted_text'] = text_content
+    entry['caption'], entry['preferences'] = caption, dict(preferences or {})
     return caption
 
-def generate_caption_free(image, preferences=None):
-    """Generate caption using free BLIP model with enhanced OCR text detection and optimized processing"""
+def caption_from_sample_index(sample_name, image, preferences, candidates=False):
+    """Precomputed caption for a bundled sample, or None when it is not in the sample index"""
+    found = get_sample_index().caption(sample_name, preferences) if sample_name else None
+    if found is None:
+        return None
+    caption, text_content, base_captions, extracted_text = found
+    st.session_state['last_extracted_text'] = text_content
+    st.session_state['last_timings'] = {'time_to_first_caption': 0.0, 'total_seconds': 0.0, 'streamed_tokens': False}
+    if candidates and len(base_captions) > 1:
+        remember_candidates(get_image_index().fingerprint(image.convert("RGB")), base_captions, extracted_text)
+        entry = st.session_state['caption_candidates']
+        entry['caption'], entry['preferences'] = caption, dict(preferences or {})
+    return True, caption
+
+def generate_caption_free(image, preferences=None, on_progress=None, stream_tokens=False, candidates=False):
+    """Generate caption using free BLIP model with enhanced OCR text detection and optimized processing
+    
+    on_progress(text) is called with the base caption as soon as decoding finishes (and with
+    the partial caption per token when stream_tokens is set), before OCR text is merged in.
+    Timings are stored in st.session_state['last_timings']. With candidates, several base
+    captions come from one diverse decode and are cached for re-picking on preference changes.
+    """
+    st.session_state['last_timings'] = {'time_to_first_caption': None, 'total_seconds': None, 'streamed_tokens': bool(stream_tokens)}
     try:
-        # Load model if not already loaded
+        # Load model here so loading errors are reported before any work starts
         processor, model = load_model()
-        
         if processor is None or model is None:
             return False, "Failed to load the AI model. Please refresh the page and try again."
         
-        # Convert image to RGB if needed
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        
-        # Enhanced image preprocessing for better caption generation
-        enhanced_image = image
-        try:
-            # Multi-step enhancement for optimal quality
-            # 1. Brightness adjustment if image is too dark/bright
-            enhancer = ImageEnhance.Brightness(image)
-            enhanced_image = enhancer.enhance(1.05)
-            
-            # 2. Increase sharpness for better detail detection
-            enhancer = ImageEnhance.Sharpness(enhanced_image)
-            enhanced_image = enhancer.enhance(1.3)
-            
-            # 3. Slight contrast boost for better feature distinction
-            enhancer = ImageEnhance.Contrast(enhanced_image)
-            enhanced_image = enhancer.enhance(1.15)
-            
-            # 4. Color enhancement for more vibrant captions
-            enhancer = ImageEnhance.Color(enhanced_image)
-            enhanced_image = enhancer.enhance(1.1)
-        except Exception as enhance_error:
-            enhanced_image = image
-        
-        # Process image for caption with enhanced version
-        inputs = processor(enhanced_image, return_tensors="pt")
-        
-        # Generate base caption with optimized parameters for maximum quality
-        with torch.no_grad():  # Reduce memory usage
-            out = model.generate(
-                **inputs, 
-                max_length=100,  # Increased for more detailed captions
-                min_length=10,   # Ensure minimum detail
-                num_beams=8,     # Higher beam search for better quality
-                length_penalty=0.8,  # Slightly prefer longer captions
-                early_stopping=True,
-                no_repeat_ngram_size=3,  # Avoid repetition more strictly
-                num_return_sequences=1,
-                temperature=0.7  # Add some creativity
-            )
-        
-        base_caption = processor.decode(out[0], skip_special_tokens=True)
+        result = get_caption_pipeline().caption(
+            image,
+            preferences,
+            candidates=candidates,
+            on_progress=on_progress,
+            stream_tokens=stream_tokens,
+            ocr_wait=lambda: st.spinner("🔍 Scanning image for text with advanced OCR..."),
+            owner=st.session_state.username
+        )
+        st.session_state['last_timings'] = result['timings']
+        caption = result['caption']
         
-        # Enhanced capitalization and formatting
-        if base_caption:
-            base_caption = base_caption.strip()
-            # Capitalize first letter of each sentence
-            sentences = base_caption.split('. ')
-            base_caption = '. '.join([s[0].upper() + s[1:] if s else s for s in sentences])
+        if candidates and result['base_captions']:
+            remember_candidates(result['fingerprint'], result['base_captions'], result['extracted_text'])
+            st.session_state['caption_candidates']['caption'] = caption
+            st.session_state['caption_candidates']['preferences'] = dict(preferences or {})
         
-        # Extract text from image using enhanced OCR
-        extracted_text = ""
-        with st.spinner("🔍 Scanning image for text with advanced OCR..."):
-            extracted_text = extract_text_from_image(image)
-        
-        # Intelligently combine caption with extracted text if available
-        if extracted_text and len(extracted_text.strip()) > 1:
-            # Clean and format the text
-            text_content = extracted_text.strip()
-            
-            # Smart integration based on text length and content
-            if len(text_content) < 30:
-                # Short text - include directly
-                base_caption = f"{base_caption}. The text reads: \"{text_content}\""
-            elif len(text_content) < 80:
-                # Medium text - include with context
-                base_caption = f"{base_caption}. The visible text states: \"{text_content}\""
-            else:
-                # Long text - include preview with ellipsis
-                preview = text_content[:100].rsplit(' ', 1)[0]  # Cut at word boundary
-                base_caption = f"{base_caption}. The image contains text beginning with: \"{preview}...\""
-            
-            # Store extracted text separately for reference
-            st.session_state['last_extracted_text'] = text_content
-        else:
-            st.session_state['last_extracted_text'] = None
-        
-        # Enhance caption based on user preferences
-        if preferences:
-            caption = enhance_caption(base_caption, preferences)
-        else:
-            caption = base_caption
+        # Store extracted text separately for reference
+        st.session_state['last_extracted_text'] = result['text_content']
         
         # Final quality check - ensure caption is meaningful
         if not caption or len(caption.strip()) < 5:
@@ -393,9 +242,95 @@ def generate_caption_free(image, preferences=None):
         else:
             return False, f"Error generating caption: {error_msg}"
 
+def caption_video_file(video_path, threshold=0.35):
+    """Caption a clip's scene-change keyframes with batched BLIP inference and OCR"""
+    processor, model = load_model()
+    if processor is None or model is None:
+        raise RuntimeError("Failed to load the AI model. Please refresh the page and try again.")
+    blip = AcceleratedBlip(processor, model, mode="off", buckets=BATCH_BUCKETS)
+    size = processor.image_processor.size
+    
+    def caption_batch(images):
+        enhanced = [enhance_for_caption(im, (size["width"], size["height"])) for im in images]
+        with runtime_tuner.inference_slot():
+            return blip.generate(enhanced)
+    
+    reader = load_ocr_reader()
+    return caption_video(
+        video_path,
+        caption_batch,
+        ocr=lambda im: extract_text_from_image(im, reader),
+        threshold=threshold
+    )
+
+def render_video_captioning():
+    """Video upload, keyframe captioning and SRT/VTT download"""
+    uploaded_video = st.file_uploader(
+        "Upload a short video clip",
+        type=VIDEO_TYPES,
+        help="Only scene-change keyframes are captioned, so clips of a few minutes are fine"
+    )
+    if uploaded_video is None:
+        return
+    st.video(uploaded_video)
+    threshold = st.slider(
+        "Scene change sensitivity",
+        0.1, 0.8, 0.35, 0.05,
+        help="Lower values start a new caption on smaller visual changes"
+    )
+    if st.button("🎬 Caption Video", type="primary", use_container_width=True) and allow_request("caption"):
+        suffix = Path(uploaded_video.name).suffix or ".mp4"
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            tmp.write(uploaded_video.getvalue())
+            video_path = tmp.name
+        try:
+            with st.spinner("🎞️ Finding scene changes and captioning keyframes..."), charge_compute("caption"):
+                cues, stats = caption_video_file(video_path, threshold)
+            st.session_state['video_cues'] = cues
+            st.session_state['video_stats'] = stats
+        except Exception as e:
+            st.error(f"❌ Error captioning video: {str(e)}")
+        finally:
+            os.unlink(video_path)
+    
+    cues = st.session_state.get('video_cues')
+    if cues:
+        video_stats = st.session_state['video_stats']
+        st.success(f"✅ {format_video_stats(video_stats)}")
+        if video_stats.get('truncated_at') is not None:
+            st.warning(f"⚠️ Only the first {video_stats['keyframes']} scenes were captioned; "
+                       f"the track ends at {video_stats['truncated_at']:.1f}s of {video_stats['duration_seconds']:.1f}s.")
+        for cue in cues:
+            st.markdown(f"**{cue['start']:.1f}s – {cue['end']:.1f}s** {cue['text']}")
+        col_srt, col_vtt = st.columns(2)
+        with col_srt:
+            st.download_button("📄 Download SRT", to_srt(cues), file_name="captions.srt",
+                               mime="application/x-subrip", use_container_width=True)
+        with col_vtt:
+            st.download_button("📄 Download VTT", to_vtt(cues), file_name="captions.vtt",
+                               mime="text/vtt", use_container_width=True)
+
 def generate_caption_api(image, preferences=None, api_token=None):
     """Generate caption using Hugging Face Inference API (Cloud)"""
     try:
+        # This user's identical images skip the API call and OCR (near-duplicates only the API call)
+        image_index = get_image_index()
+        owner = st.session_state.username
+        fingerprint = image_index.fingerprint(image)
+        digest = content_hash(image.convert("RGB"))
+        known = image_index.lookup(fingerprint=fingerprint, owner=owner, digest=digest)
+        if known:
+            extracted_text = known['extracted_text']
+            if not known['exact']:
+                with st.spinner("🔍 Scanning image for text with advanced OCR..."):
+                    extracted_text = extract_text_from_image(image)
+                image_index.add(base_caption=known['base_caption'], extracted_text=extracted_text,
+                                fingerprint=fingerprint, owner=owner, digest=digest)
+            base_caption, text_content = compose_caption(known['base_caption'], extracted_text)
+            st.session_state['last_extracted_text'] = text_content
+            caption = enhance_caption(base_caption, preferences) if preferences else base_caption
+            return True, caption
+        
         # Convert image to bytes
         import io
         img_byte_arr = io.BytesIO()
@@ -423,30 +358,18 @@ def generate_caption_api(image, preferences=None, api_token=None):
         if isinstance(result, list) and len(result) > 0 and 'generated_text' in result[0]:
             base_caption = result[0]['generated_text']
             
-            # Enhanced capitalization and formatting
-            if base_caption:
-                base_caption = base_caption.strip()
-                sentences = base_caption.split('. ')
-                base_caption = '. '.join([s[0].upper() + s[1:] if s else s for s in sentences])
-            
             # Extract text from image using enhanced OCR (Local)
             extracted_text = ""
             with st.spinner("🔍 Scanning image for text with advanced OCR..."):
                 extracted_text = extract_text_from_image(image)
             
-            # Intelligently combine caption with extracted text if available
-            if extracted_text and len(extracted_text.strip()) > 1:
-                text_content = extracted_text.strip()
-                if len(text_content) < 30:
-                    base_caption = f"{base_caption}. The text reads: \"{text_content}\""
-                elif len(text_content) < 80:
-                    base_caption = f"{base_caption}. The visible text states: \"{text_content}\""
-                else:
-                    preview = text_content[:100].rsplit(' ', 1)[0]
-                    base_caption = f"{base_caption}. The image contains text beginning with: \"{preview}...\""
-                st.session_state['last_extracted_text'] = text_content
-            else:
-                st.session_state['last_extracted_text'] = None
+            if base_caption:
+                image_index.add(base_caption=base_caption, extracted_text=extracted_text, fingerprint=fingerprint,
+                                owner=owner, digest=digest)
+            
+            # Capitalize and intelligently combine caption with extracted text if available
+            base_caption, text_content = compose_caption(base_caption, extracted_text)
+            st.session_state['last_extracted_text'] = text_content
             
             # Enhance caption based on user preferences
             if preferences:
@@ -461,55 +384,41 @@ def generate_caption_api(image, preferences=None, api_token=None):
     except Exception as e:
         return False, f"Error generating caption via API: {str(e)}"
 
+def get_translation_router():
+    """Translation engines (Google online, MarianMT offline); local models stay warm once loaded"""
+    return get_caption_pipeline().translation_router
+
+def get_speech_router():
+    """Speech engines (gTTS online, espeak-ng/pyttsx3 offline) with per-language fallback"""
+    return get_caption_pipeline().speech_router
+
+def audio_mime(file_path):
+    """MIME type for generated audio (offline engines produce WAV)"""
+    return "audio/wav" if str(file_path).endswith(".wav") else "audio/mp3"
+
 def translate_text(text, target_lang):
-    """Translate text to target language using deep-translator"""
+    """Translate text to target language using the configured translation engines"""
     try:
-        # Skip translation for English variants since source is English
-        if target_lang.startswith('en'):
-            return text
-            
-        translator = GoogleTranslator(source='auto', target=target_lang)
-        translated_text = translator.translate(text)
-        return translated_text
+        # English variants come back unchanged since the source is English
+        return get_sample_index().translation(text, target_lang) or get_caption_pipeline().translate(text, target_lang)
     except Exception as e:
         st.warning(f"Translation failed: {str(e)}. Using original text.")
         return text
 
 def text_to_speech(text, lang='en', slow=False):
-    """Convert text to speech and return audio file path - Completely FREE using gTTS"""
+    """Convert text to speech and return audio file path - gTTS or a local offline engine"""
     try:
-        # Clean text (remove emojis and special characters but keep basic punctuation)
-        clean_text = ''
-        for char in text:
-            if char.isalnum() or char.isspace() or char in '.,!?-\'\"':
-                clean_text += char
-        
-        # Remove hashtags
-        words = clean_text.split()
-        clean_text = ' '.join([word for word in words if not word.startswith('#')])
-        
-        if not clean_text.strip():
+        if not clean_text_for_speech(text).strip():
             return False, "No valid text to convert to speech"
         
-        # Create temporary file with .mp3 extension
-        # Use timestamp to ensure ALWAYS fresh generation (no caching)
-        temp_dir = tempfile.gettempdir()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        temp_filename = f"tts_{lang}_{timestamp}.mp3"
-        temp_path = os.path.join(temp_dir, temp_filename)
+        # Sample captions come with precomputed audio
+        precomputed_path = get_sample_index().audio_path(text, lang, slow)
+        if precomputed_path:
+            return True, precomputed_path
         
-        # Clean up old audio files from this session to save space
-        try:
-            for old_file in Path(temp_dir).glob("tts_*.mp3"):
-                if old_file.stat().st_mtime < (datetime.now().timestamp() - 3600):  # Older than 1 hour
-                    old_file.unlink()
-        except:
-            pass
-        
-        # Generate speech using gTTS (Google Text-to-Speech - Free!)
-        # This will ALWAYS generate new audio with the selected language
-        tts = gTTS(text=clean_text.strip(), lang=lang, slow=slow)
-        tts.save(temp_path)
+        # Generate speech with the first available engine for this language
+        # (gTTS by default, local espeak-ng/pyttsx3 when offline or as fallback)
+        temp_path = get_caption_pipeline().synthesize(text, lang, slow)
         
         # Verify file was created
         if os.path.exists(temp_path):
@@ -519,25 +428,70 @@ def text_to_speech(text, lang='en', slow=False):
     except Exception as e:
         return False, f"Error generating speech in '{lang}': {str(e)}. Try a different language."
 
-def autoplay_audio(file_path):
-    """Create HTML audio player with autoplay"""
+@st.cache_resource(max_entries=16)
+def load_audio_bytes(file_path, mtime_ns):
+    """Read a generated audio file once; reruns reuse the same bytes (keyed by path and mtime)"""
+    with open(file_path, "rb") as f:
+        return f.read()
+
+def get_audio_bytes(file_path):
+    """Cached audio bytes for a file, or None if it no longer exists"""
     try:
-        with open(file_path, "rb") as f:
-            audio_bytes = f.read()
-        
-        audio_base64 = base64.b64encode(audio_bytes).decode()
-        # Add random ID to force browser to reload the audio element
-        rand_id = random.randint(100000, 999999)
+        return load_audio_bytes(file_path, os.stat(file_path).st_mtime_ns)
+    except OSError:
+        return None
+
+def chunk_audio_player(path, index):
+    """st.audio player for one streamed chunk; only the first starts on its own.
+    
+    The bytes go through Streamlit's media endpoint like every other player, so the
+    page carries a media URL per chunk rather than the audio itself.
+    """
+    data = get_audio_bytes(str(path))
+    if data is None:
+        return
+    if index > 0:
+        st.caption(f"Part {index + 1}")
+    st.audio(data, format=audio_mime(path), autoplay=index == 0)
+
+@st.cache_resource
+def get_speech_synthesizer():
+    """Chunked, parallel TTS with a per-chunk disk cache shared across sessions"""
+    return ChunkedSpeechSynthesizer(get_speech_router())
+
+def stream_text_to_speech(text, lang='en', slow=False, container=None):
+    """Synthesize sentence chunks concurrently and start playing the first one as soon as it is ready.
+    
+    Returns (success, combined_audio_path_or_error, metrics).
+    """
+    metrics = {}
+    try:
+        clean_text = clean_text_for_speech(text)
+        if not clean_text.strip():
+            return False, "No valid text to convert to speech", metrics
+        
+        container = container or st.container()
+        precomputed_path = get_sample_index().audio_path(text, lang, slow)
+        if precomputed_path:
+            metrics.update({'time_to_first_audio': 0.0, 'total_seconds': 0.0, 'chunks': 1, 'cache_hits': 1})
+            with container:
+                st.audio(get_audio_bytes(precomputed_path), format=audio_mime(precomputed_path), autoplay=True)
+            return True, precomputed_path, metrics
+        
+        chunk_paths = []
+        for index, chunk, path in get_speech_synthesizer().stream(clean_text.strip(), lang, slow, metrics):
+            chunk_paths.append(path)
+            with container:
+                if index == 0:
+                    st.caption(f"⏱️ First audio ready in {metrics['time_to_first_audio']:.2f}s")
+                chunk_audio_player(path, index)
         
-        audio_html = f"""
-            <audio id="audio_{rand_id}" autoplay="true" controls style="width: 100%; margin: 10px 0;">
-                <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-                Your browser does not support the audio element.
-            </audio>
-            """
-        return audio_html
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        combined_path = os.path.join(tempfile.gettempdir(), f"tts_{lang}_{timestamp}{chunk_paths[0].suffix}")
+        combine_chunks(chunk_paths, combined_path)
+        return True, combined_path, metrics
     except Exception as e:
-        return f"<p style='color: red;'>Error: {str(e)}</p>"
+        return False, f"Error generating speech in '{lang}': {str(e)}. Try a different language.", metrics
 
 def show_login_page():
     """Display beautiful login page"""
@@ -654,6 +608,7 @@ def show_login_page():
                         if success:
                             st.session_state.authenticated = True
                             st.session_state.username = username.strip().lower()
+                            st.session_state.session_token = sessions.issue(st.session_state.username)
                             st.success(f"✅ {message}")
                             st.balloons()
                             st.rerun()
@@ -771,7 +726,8 @@ def main():
     col_welcome, col_logout = st.columns([4, 1])
     
     with col_welcome:
-        user_info = auth.get_user_info(st.session_state.username)
+        # Constant-time cached lookup instead of hitting the user store on every rerun
+        user_info = sessions.get_profile(st.session_state.session_token)
         if user_info and user_info.get('last_login'):
             last_login = datetime.fromisoformat(user_info['last_login']).strftime('%b %d, %Y at %I:%M %p')
             st.markdown(f"""
@@ -795,9 +751,11 @@ def main():
     
     with col_logout:
         if st.button("🚪 Logout", use_container_width=True, type="secondary"):
+            sessions.revoke(st.session_state.session_token)
             st.session_state.authenticated = False
             st.session_state.username = None
-            st.session_state.caption_history = []
+            st.session_state.session_token = None
+            st.session_state.history_cursors = [None]
             st.success("👋 Logged out successfully!")
             st.rerun()
     
@@ -909,9 +867,9 @@ def main():
         # Image source selection
         image_source = st.radio(
             "Choose image source:",
-            ["📁 Upload from PC", "🖼️ Use Sample Image"],
+            ["📁 Upload from PC", "🖼️ Use Sample Image", "🎬 Caption a Video"],
             horizontal=True,
-            help="Upload your own image or select from sample images"
+            help="Upload your own image, select from sample images, or caption a short video clip"
         )
         
         image = None
@@ -927,6 +885,9 @@ def main():
                 image = Image.open(uploaded_file)
                 st.image(image, use_container_width=True, caption="Your uploaded image")
         
+        elif image_source == "🎬 Caption a Video":
+            render_video_captioning()
+        
         else:  # Use Sample Image
             sample_images = get_sample_images()
             
@@ -934,7 +895,8 @@ def main():
                 # Create a more visual selector
                 st.markdown("**Select a sample image:**")
                 
-                # Display sample images in a grid
+                # Display sample images in a grid (served from cached thumbnails)
+                thumbnail_cache = get_thumbnail_cache()
                 cols_per_row = 3
                 for i in range(0, len(sample_images), cols_per_row):
                     cols = st.columns(cols_per_row)
@@ -944,10 +906,9 @@ def main():
                             with col:
                                 sample_path = sample_images[idx]
                                 try:
-                                    sample_img = Image.open(sample_path)
-                                    st.image(sample_img, use_container_width=True)
+                                    st.image(thumbnail_cache.get(sample_path), use_container_width=True)
                                     if st.button(f"Select", key=f"sample_{idx}", use_container_width=True):
-                                        image = sample_img.copy()
+                                        # Only the selected sample is decoded at full size (after the rerun)
                                         st.session_state['selected_sample'] = sample_path.name
                                         st.rerun()
                                 except Exception as e:
@@ -1029,25 +990,91 @@ def main():
                         type="password",
                         help="Enter your HF Token for higher rate limits. Leave empty to use public access."
                     )
+                else:
+                    manager = get_model_manager()
+                    for name, info in manager.status().items():
+                        state = "loaded" if info["loaded"] else "unloaded"
+                        idle = f", idle {info['idle_seconds']}s" if info["idle_seconds"] is not None else ""
+                        st.caption(f"{name}: {state}{idle}")
+                    readers = get_caption_pipeline().ocr_pool.loaded()
+                    st.caption("OCR readers: " + (", ".join(f"{langs} (~{mb} MB)" for langs, mb in readers.items()) or "none"))
+                    for event in list(manager.events)[-3:]:
+                        if event["event"] == "load":
+                            detail = f"+{event['added_mb']} MB in {event['seconds']}s"
+                        elif event["event"] == "unload":
+                            detail = f"{event['reason']}, reclaimed {event['reclaimed_mb']} MB"
+                        else:
+                            detail = f"limit {event['limit_mb']:g} MB not reachable by unloading, eviction paused"
+                        st.caption(f"{event['event']} {event['model']}: {detail}")
+                    progressive = st.checkbox(
+                        "⚡ Progressive results",
+                        value=True,
+                        help="Show the caption as soon as it is decoded and add detected text when OCR finishes"
+                    )
+                    stream_tokens = st.checkbox(
+                        "Stream words while decoding",
+                        value=False,
+                        disabled=not progressive,
+                        help="Uses faster greedy decoding instead of beam search, so captions may be less polished"
+                    )
+                    multi_candidates = st.checkbox(
+                        "🎯 Multi-style candidates",
+                        value=True,
+                        disabled=stream_tokens,
+                        help="Decode several different captions at once; changing length, style or tone then picks among them without rerunning the model"
+                    )
             
-            if st.button("🚀 Generate Caption", type="primary", use_container_width=True):
-                with st.spinner("🤖 AI is analyzing your image..."):
-                    preferences = {
-                        'length': length.lower(),
-                        'style': style.lower(),
-                        'tone': tone.lower(),
-                        'emojis': include_emojis,
-                        'hashtags': include_hashtags
-                    }
-                    
-                    if gen_mode == "Cloud API (Recommended)":
+            preferences = {
+                'length': length.lower(),
+                'style': style.lower(),
+                'tone': tone.lower(),
+                'emojis': include_emojis,
+                'hashtags': include_hashtags
+            }
+            
+            # Bundled samples are served from the precomputed index without inference (or rate limiting)
+            sample_name = st.session_state.get('selected_sample') if image_source == "🖼️ Use Sample Image" else None
+            sample_indexed = sample_name is not None and get_sample_index().entry(sample_name) is not None
+            
+            if st.button("🚀 Generate Caption", type="primary", use_container_width=True) and (sample_indexed or allow_request("caption")):
+                caption_header = st.empty()
+                caption_slot = st.empty()
+                
+                def show_partial_caption(text):
+                    caption_header.markdown("### 📝 Generated Caption")
+                    caption_slot.markdown(
+                        f'<div class="caption-box"><p class="caption-text">{text}</p></div>',
+                        unsafe_allow_html=True
+                    )
+                
+                with st.spinner("🤖 AI is analyzing your image..."), charge_compute("caption"):
+                    precomputed = caption_from_sample_index(
+                        sample_name,
+                        image,
+                        preferences,
+                        candidates=gen_mode != "Cloud API (Recommended)" and multi_candidates
+                    ) if sample_indexed else None
+                    if precomputed is not None:
+                        success, caption = precomputed
+                    elif gen_mode == "Cloud API (Recommended)":
+                        st.session_state['last_timings'] = None
                         success, caption = generate_caption_api(image, preferences, api_token)
                     else:
-                        success, caption = generate_caption_free(image, preferences)
+                        success, caption = generate_caption_free(
+                            image,
+                            preferences,
+                            on_progress=show_partial_caption if progressive else None,
+                            stream_tokens=progressive and stream_tokens,
+                            candidates=multi_candidates and not (progressive and stream_tokens)
+                        )
                     
                     if success:
-                        st.markdown("### 📝 Generated Caption")
-                        st.markdown(f'<div class="caption-box"><p class="caption-text">{caption}</p></div>', unsafe_allow_html=True)
+                        # Replaces the progressive preview in place
+                        show_partial_caption(caption)
+                        timings = st.session_state.get('last_timings')
+                        if timings and timings.get('total_seconds') is not None:
+                            first_caption = timings['time_to_first_caption']
+                            st.caption(f"⏱️ First caption in {first_caption:.1f}s · complete in {timings['total_seconds']:.1f}s")
                         
                         # Store caption in session state and clear old audio
                         st.session_state['current_caption'] = caption
@@ -1059,16 +1086,15 @@ def main():
                         
                         st.markdown("---")
                         
-                        # Add to history
-                        st.session_state.caption_history.insert(0, {
-                            'image': image.copy(),
-                            'caption': caption,
-                            'preferences': preferences
-                        })
-                        
-                        # Keep only last 5
-                        if len(st.session_state.caption_history) > 5:
-                            st.session_state.caption_history.pop()
+                        # Add to history (written in the background, does not block this run)
+                        get_history_store().add(
+                            st.session_state.username,
+                            caption,
+                            preferences,
+                            image=image,
+                            extracted_text=st.session_state.get('last_extracted_text')
+                        )
+                        st.session_state.history_cursors = [None]
                         
                         # Download caption button
                         st.download_button(
@@ -1079,7 +1105,22 @@ def main():
                             use_container_width=True
                         )
                     else:
+                        caption_header.empty()
+                        caption_slot.empty()
                         st.error(f"❌ {caption}")
+            else:
+                # Preference changes re-pick among the cached candidates instead of regenerating
+                entry = st.session_state.get('caption_candidates')
+                if (entry and len(entry['captions']) > 1 and entry['preferences'] != preferences
+                        and entry['fingerprint'] == get_image_index().fingerprint(image.convert("RGB"))):
+                    caption = caption_from_candidates(preferences)
+                    st.session_state['current_caption'] = caption
+                    if 'current_audio_path' in st.session_state:
+                        del st.session_state['current_audio_path']
+                    st.session_state['show_audio'] = False
+                    st.markdown("### 📝 Generated Caption")
+                    st.markdown(f'<div class="caption-box"><p class="caption-text">{caption}</p></div>', unsafe_allow_html=True)
+                    st.caption(f"🎯 Picked from {len(entry['captions'])} cached candidates, no new inference")
         else:
             st.info("👆 Upload an image to get started")
     
@@ -1130,12 +1171,19 @@ def main():
                 key="voice_speed_checkbox"
             )
             st.session_state.selected_speed = voice_speed
+            stream_voice = st.checkbox(
+                "⚡ Stream Playback",
+                value=True,
+                help="Start playing the first sentence while the rest is still being generated",
+                key="voice_stream_checkbox"
+            )
         
         # Button row
         col_btn1, col_btn2 = st.columns(2)
         
         with col_btn1:
-            if st.button("🔊 Generate & Play Voice", use_container_width=True, type="primary", key="generate_voice_btn"):
+            generate_voice_clicked = st.button("🔊 Generate & Play Voice", use_container_width=True, type="primary", key="generate_voice_btn")
+            if generate_voice_clicked:
                 # Get language directly from selection to ensure freshness
                 if selected_lang_tuple:
                     lang_name = selected_lang_tuple[0]
@@ -1147,7 +1195,8 @@ def main():
                 # Clear previous audio to force regeneration with new language
                 if 'current_audio_path' in st.session_state:
                     old_path = st.session_state.get('current_audio_path', '')
-                    if old_path and os.path.exists(old_path):
+                    # Precomputed sample audio is shared, only generated files are removed
+                    if old_path and os.path.exists(old_path) and not get_sample_index().owns(old_path):
                         try:
                             os.remove(old_path)
                         except:
@@ -1156,71 +1205,150 @@ def main():
                 # Show language code for debugging
                 st.info(f"🔧 Using language code: **{lang_code}** for {lang_name}")
                 
-                with st.spinner(f"🎵 Generating voice in {lang_name}... Please wait"):
-                    # Translate text if needed
-                    text_to_speak = st.session_state['current_caption']
-                    if not lang_code.startswith('en'):
-                        with st.spinner(f"Translating to {lang_name}..."):
-                            text_to_speak = translate_text(text_to_speak, lang_code)
-                            st.info(f"📝 Translated text: {text_to_speak}")
+                voice_actions = ("tts",) if lang_code.startswith('en') else ("translate", "tts")
+                if allow_request(*voice_actions):
+                    with st.spinner(f"🎵 Generating voice in {lang_name}... Please wait"):
+                        # Translate text if needed
+                        text_to_speak = st.session_state['current_caption']
+                        if not lang_code.startswith('en'):
+                            with st.spinner(f"Translating to {lang_name}..."), charge_compute("translate"):
+                                text_to_speak = translate_text(text_to_speak, lang_code)
+                                st.info(f"📝 Translated text: {text_to_speak}")
 
-                    success_audio, audio_result = text_to_speech(
-                        text_to_speak, 
-                        lang=lang_code, 
-                        slow=voice_speed
-                    )
+                        with charge_compute("tts"):
+                            if stream_voice:
+                                success_audio, audio_result, tts_metrics = stream_text_to_speech(
+                                    text_to_speak,
+                                    lang=lang_code,
+                                    slow=voice_speed
+                                )
+                            else:
+                                success_audio, audio_result = text_to_speech(
+                                    text_to_speak, 
+                                    lang=lang_code, 
+                                    slow=voice_speed
+                                )
                     
-                    if success_audio:
-                        st.session_state['current_audio_path'] = audio_result
-                        st.session_state['current_audio_lang'] = lang_name
-                        st.session_state['current_audio_code'] = lang_code
-                        st.session_state['show_audio'] = True
-                        st.success(f"✅ Voice generated successfully in {lang_name}!")
-                        st.rerun()
-                    else:
-                        st.error(f"❌ {audio_result}")
-                        st.info("💡 Try simplifying the caption or changing the language settings.")
+                        if success_audio:
+                            st.session_state['current_audio_path'] = audio_result
+                            st.session_state['current_audio_lang'] = lang_name
+                            st.session_state['current_audio_code'] = lang_code
+                            st.session_state['show_audio'] = True
+                            st.success(f"✅ Voice generated successfully in {lang_name}!")
+                            if stream_voice:
+                                # Playback already started above; rerunning now would cut it off
+                                st.session_state['audio_autoplay'] = False
+                                st.session_state['tts_metrics'] = tts_metrics
+                                st.caption(
+                                    f"⏱️ Time to first audio: {tts_metrics['time_to_first_audio']:.2f}s | "
+                                    f"Total: {tts_metrics['total_seconds']:.2f}s | "
+                                    f"{tts_metrics['chunks']} chunks ({tts_metrics['cache_hits']} cached)"
+                                )
+                            else:
+                                st.session_state['audio_autoplay'] = True
+                                st.rerun()
+                        else:
+                            st.error(f"❌ {audio_result}")
+                            st.info("💡 Try simplifying the caption or changing the language settings.")
         
         with col_btn2:
-            # Show download button if audio exists
-            if 'current_audio_path' in st.session_state and os.path.exists(st.session_state.get('current_audio_path', '')):
-                with open(st.session_state['current_audio_path'], 'rb') as audio_file:
-                    audio_bytes = audio_file.read()
-                    st.download_button(
-                        label="💾 Download MP3",
-                        data=audio_bytes,
-                        file_name="caption_audio.mp3",
-                        mime="audio/mp3",
-                        use_container_width=True,
-                        key="download_audio_btn"
-                    )
+            # Show download button if audio exists (same cached bytes as the player)
+            audio_bytes = None
+            if 'current_audio_path' in st.session_state:
+                audio_bytes = get_audio_bytes(st.session_state['current_audio_path'])
+            if audio_bytes is not None:
+                st.download_button(
+                    label="💾 Download Audio",
+                    data=audio_bytes,
+                    file_name=f"caption_audio{Path(st.session_state['current_audio_path']).suffix}",
+                    mime=audio_mime(st.session_state['current_audio_path']),
+                    use_container_width=True,
+                    key="download_audio_btn"
+                )
         
-        # Display audio player if available
-        if st.session_state.get('show_audio', False) and 'current_audio_path' in st.session_state:
-            if os.path.exists(st.session_state['current_audio_path']):
+        # Display audio player if available (streamed audio is already playing in the chunk players)
+        if st.session_state.get('show_audio', False) and 'current_audio_path' in st.session_state and not generate_voice_clicked:
+            if audio_bytes is not None:
                 # Show current audio language with code
                 current_lang = st.session_state.get('current_audio_lang', 'Unknown')
                 current_code = st.session_state.get('current_audio_code', '')
                 lang_display = f"{current_lang} ({current_code})" if current_code else current_lang
                 st.markdown(f"#### 🎧 Audio Player - {lang_display}")
-                audio_html = autoplay_audio(st.session_state['current_audio_path'])
-                st.markdown(audio_html, unsafe_allow_html=True)
+                # st.audio registers the bytes with Streamlit's media endpoint once (by content hash),
+                # so later reruns only send the media URL instead of an inlined base64 payload
+                st.audio(audio_bytes, format=audio_mime(st.session_state['current_audio_path']), autoplay=st.session_state.get('audio_autoplay', True))
                 st.balloons()
                 st.info("💡 Tip: Click the download button above to save this audio file!")
     
-    # History Section
-    if st.session_state.caption_history:
+    # Today's usage of every account, for admins
+    limiter = get_rate_limiter()
+    if st.session_state.username in limiter.admins:
+        with st.expander("🛡️ Usage & Limits (admin)"):
+            usage_rows = limiter.usage()
+            if not usage_rows:
+                st.caption("No requests today.")
+            for row in usage_rows:
+                daily = limiter.limits[row['action']]['daily_seconds']
+                st.caption(
+                    f"**{row['username']}** · {ACTION_LABELS.get(row['action'], row['action'])}: "
+                    f"{row['requests']} requests, {row['rejected']} throttled, "
+                    f"{row['seconds']:.0f}s of {daily}s daily compute"
+                )
+            usage_users = sorted({row['username'] for row in usage_rows})
+            if usage_users:
+                col_user, col_reset = st.columns([3, 1])
+                with col_user:
+                    reset_user = st.selectbox("User", usage_users, key="limits_reset_user", label_visibility="collapsed")
+                with col_reset:
+                    if st.button("Reset limits", key="limits_reset_btn", use_container_width=True):
+                        limiter.reset(reset_user)
+                        st.rerun()
+
+    # History Section (persistent, paged from the history store)
+    history = get_history_store()
+    history_total = history.count(st.session_state.username)
+    if history_total:
         st.markdown("---")
-        st.markdown("### 📜 Recent Captions")
+        st.markdown(f"### 📜 Your Captions ({history_total})")
+        
+        history_query = st.text_input("🔎 Search your captions", key="history_search", placeholder="e.g. beach, sale, poster")
+        page_size = 3
+        if history_query:
+            history_items = history.search(st.session_state.username, history_query, limit=10)
+            next_cursor = None
+            if not history_items:
+                st.info("No captions match your search.")
+        else:
+            cursors = st.session_state.history_cursors
+            history_items, next_cursor = history.page(st.session_state.username, page_size, cursors[-1])
         
-        for idx, item in enumerate(st.session_state.caption_history[:3]):
-            with st.expander(f"Caption {idx + 1}", expanded=(idx == 0)):
+        for idx, item in enumerate(history_items):
+            created = datetime.fromtimestamp(item['created_at']).strftime('%b %d, %Y %I:%M %p')
+            with st.expander(f"{created} — {item['caption'][:60]}", expanded=(idx == 0)):
                 col_img, col_cap = st.columns([1, 2])
                 with col_img:
-                    st.image(item['image'], width=200)
+                    if item['thumbnail']:
+                        st.image(item['thumbnail'], width=200)
+                    elif item['image'] is not None:
+                        st.image(item['image'], width=200)
                 with col_cap:
                     st.markdown(f"**Caption:** {item['caption']}")
-                    st.caption(f"Style: {item['preferences']['style'].title()} | Tone: {item['preferences']['tone'].title()}")
+                    prefs = item['preferences']
+                    if prefs:
+                        st.caption(f"Style: {prefs.get('style', '').title()} | Tone: {prefs.get('tone', '').title()}")
+        
+        if not history_query:
+            col_newer, col_page, col_older = st.columns([1, 2, 1])
+            with col_newer:
+                if len(st.session_state.history_cursors) > 1 and st.button("← Newer", key="history_newer"):
+                    st.session_state.history_cursors.pop()
+                    st.rerun()
+            with col_page:
+                st.caption(f"Page {len(st.session_state.history_cursors)} of {(history_total + page_size - 1) // page_size}")
+            with col_older:
+                if next_cursor is not None and st.button("Older →", key="history_older"):
+                    st.session_state.history_cursors.append(next_cursor)
+                    st.rerun()
     
     # Footer with instructions
     st.markdown("---")
@@ -1261,7 +1389,12 @@ def main():
         """)
 
 if __name__ == "__main__":
-    # Check authentication status
+    # Check authentication status (an expired or revoked session token logs the user out)
+    if st.session_state.authenticated and sessions.get_profile(st.session_state.session_token) is None:
+        st.session_state.authenticated = False
+        st.session_state.username = None
+        st.session_state.session_token = None
+    
     if not st.session_state.authenticated:
         show_login_page()
     else:
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from image_enhance import MEAN_TOLERANCE, P99_TOLERANCE, check_equivalence, enhance_fused
+
+SAMPLES = sorted((Path(__file__).resolve().parent.parent / "sample_images").glob("*.png"))
+
+
+def synthetic_image(width=640, height=480):
+    """Colour gradients with hard-edged text and shapes, the kind of content sharpening changes most"""
+    ramp = np.linspace(0, 255, width)
+    pixels = np.stack([
+        np.tile(ramp, (height, 1)),
+        np.tile(ramp[::-1], (height, 1)),
+        np.full((height, width), 128.0),
+    ], axis=-1).astype(np.uint8)
+    image = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(image)
+    for i in range(12):
+        draw.text((20 + i * 40, 30 + i * 30), "Caption text", fill=(255, 255, 255) if i % 2 else (0, 0, 0))
+    draw.rectangle((300, 200, 500, 400), outline=(0, 0, 0), width=5)
+    return image
+
+
+def assert_within_budget(image):
+    ok, stats = check_equivalence(image)
+    assert stats["mean_abs"] <= MEAN_TOLERANCE, stats
+    assert stats["p99_abs"] <= P99_TOLERANCE, stats
+    assert ok
+
+
+def test_tolerances_are_the_measured_budgets():
+    assert (MEAN_TOLERANCE, P99_TOLERANCE) == (1.5, 8.0)
+
+
+def test_fused_matches_legacy_on_synthetic_image():
+    assert_within_budget(synthetic_image())
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=[p.stem for p in SAMPLES])
+def test_fused_matches_legacy_on_samples(path):
+    with Image.open(path) as image:
+        assert_within_budget(image)
+
+
+def test_fused_output_is_model_input_size():
+    result = enhance_fused(synthetic_image().convert("L"), size=(384, 384))
+    assert result.size == (384, 384)
+    assert result.mode == "RGB"
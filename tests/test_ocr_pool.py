@@ -0,0 +1,88 @@
+import numpy as np
+
+from ocr_pool import OCRReaderPool
+
+
+class FakeReader:
+    """Mimics easyocr.Reader: the detection helpers only exist when built with detector=True"""
+
+    def __init__(self, languages, detector):
+        self.languages = languages
+        if detector:
+            self.detect_network = "craft"
+            self.get_textbox = lambda net, image: [[[0, image.shape[1], 0, image.shape[0]]]]
+            self.get_detector = lambda path: object()
+            self.detector = self.get_detector("craft.pth")
+
+    def detect(self, image):
+        return self.get_textbox(self.detector, image), [[]]
+
+    def recognize(self, image, horizontal_list, free_list, detail=1, paragraph=False, batch_size=1):
+        return [(box, "+".join(self.languages), 0.9) for box in horizontal_list]
+
+    def readtext(self, image, detail=1, paragraph=False):
+        horizontal, free = self.detect(image)
+        return self.recognize(image, horizontal[0], free[0], detail, paragraph)
+
+
+def make_pool(**kwargs):
+    built = []
+
+    def factory(languages, detector):
+        built.append((languages, detector))
+        return FakeReader(languages, detector)
+
+    return OCRReaderPool(scripts=["latin", "cyrillic"], factory=factory, **kwargs), built
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_second_script_reader_borrows_the_detector():
+    pool, built = make_pool()
+    image = np.zeros((20, 40), dtype=np.uint8)
+    pool.get_script("latin")
+    reader = pool.get_script("cyrillic")
+
+    assert built == [(("en",), True), (("en", "ru"), False)]
+    assert reader.readtext(image)[0][1] == "en+ru"
+
+
+def test_readers_keep_working_after_the_detector_owner_is_evicted():
+    pool, _ = make_pool(memory_limit_mb=-1)
+    image = np.zeros((20, 40), dtype=np.uint8)
+    pool.get_script("latin")
+    pool.get_script("cyrillic")
+    assert list(pool.loaded()) == ["en,ru"]
+
+    assert pool.get_script("cyrillic").readtext(image)[0][1] == "en+ru"
+    # Reloading the evicted script builds a recognizer-only reader that still detects
+    assert pool.get_script("latin").readtext(image)[0][1] == "en"
+
+
+def test_idle_readers_and_detector_are_unloaded_after_the_ttl():
+    clock = FakeClock()
+    pool, built = make_pool(idle_ttl=60, clock=clock)
+    image = np.zeros((20, 40), dtype=np.uint8)
+    pool.get_script("latin")
+    clock.now += 30
+    pool.get_script("cyrillic")
+
+    clock.now += 40
+    assert pool.unload_idle() == [("en",)]
+    assert list(pool.loaded()) == ["en,ru"]
+    assert pool._detector is not None
+
+    clock.now += 30
+    pool.unload_idle()
+    assert pool.loaded() == {}
+    assert pool._detector is None
+
+    # The next reader loads the detector again
+    assert pool.get_script("cyrillic").readtext(image)[0][1] == "en+ru"
+    assert built[-1] == (("en", "ru"), True)
@@ -0,0 +1,112 @@
+import re
+import time
+
+import pytest
+
+from text_processing import clean_text_for_speech, compose_caption, normalize_ocr_key, tidy_ocr_text
+
+
+# The inline text handling the app used before text_processing, kept as the reference
+# the optimized functions are checked (and timed) against
+
+def legacy_clean_text_for_speech(text):
+    clean_text = ''
+    for char in text:
+        if char.isalnum() or char.isspace() or char in '.,!?-\'\"':
+            clean_text += char
+    words = clean_text.split()
+    return ' '.join([word for word in words if not word.startswith('#')])
+
+
+def legacy_compose(base_caption, extracted_text, ocr_items):
+    seen = {}
+    for text in ocr_items:
+        normalized = re.sub(r'[^a-zA-Z0-9\s]', '', text.lower().strip())
+        if normalized:
+            seen.setdefault(normalized, text)
+    final_text = ' '.join(seen.values())
+    final_text = re.sub(r'\s+', ' ', final_text)
+    final_text = re.sub(r'([.!?])([A-Z])', r'\1 \2', final_text).strip()
+    final_text = final_text.replace('|', 'I').replace('0', 'O') if final_text.isupper() else final_text
+
+    base_caption = base_caption.strip()
+    sentences = base_caption.split('. ')
+    base_caption = '. '.join([s[0].upper() + s[1:] if s else s for s in sentences])
+    text_content = extracted_text.strip()
+    if len(text_content) < 30:
+        base_caption = f"{base_caption}. The text reads: \"{text_content}\""
+    elif len(text_content) < 80:
+        base_caption = f"{base_caption}. The visible text states: \"{text_content}\""
+    else:
+        preview = text_content[:100].rsplit(' ', 1)[0]
+        base_caption = f"{base_caption}. The image contains text beginning with: \"{preview}...\""
+    return base_caption, final_text
+
+
+def fast_compose(base_caption, extracted_text, ocr_items):
+    seen = {}
+    for text in ocr_items:
+        normalized = normalize_ocr_key(text)
+        if normalized:
+            seen.setdefault(normalized, text)
+    final_text = tidy_ocr_text(" ".join(seen.values()))
+    return compose_caption(base_caption, extracted_text)[0], final_text
+
+
+OCR_ITEMS = [f"SALE{i}! Flood alerts save lives.Solar chargers cut diesel use #{i}" for i in range(40)]
+BASE = "a poster on a wall with text. a man standing next to it. the sign is red"
+
+
+@pytest.mark.parametrize("text", [
+    "A dog on a beach. It's sunny!",
+    "✨ Café prices: 3€ — \"cheap\" (really?) ✨\n\nnew line",
+    "tabs\tand  spaces,   kept-as-one",
+    "",
+])
+def test_clean_text_for_speech_matches_legacy(text):
+    assert clean_text_for_speech(text) == legacy_clean_text_for_speech(text)
+
+
+def test_clean_text_for_speech_drops_hashtags():
+    # The legacy filter stripped '#' before looking for hashtags, so their words were spoken
+    assert clean_text_for_speech("A poster ✨\n\n#poster #AI") == "A poster"
+
+
+@pytest.mark.parametrize("extracted,items", [
+    ("STOP", ["STOP", "stop!", "ST0P |N"]),
+    ("Flood alerts save lives", ["Flood alerts", "save lives.Now"]),
+    (" ".join(OCR_ITEMS), OCR_ITEMS),
+])
+def test_compose_matches_legacy(extracted, items):
+    assert fast_compose(BASE, extracted, items) == legacy_compose(BASE, extracted, items)
+
+
+def test_compose_skips_single_character_text():
+    assert compose_caption("a red sign", "x") == ("A red sign", None)
+
+
+def benchmark(rounds=2000):
+    """Compare the legacy inline text handling with text_processing on a long, OCR-heavy caption"""
+    extracted = " ".join(OCR_ITEMS)
+    caption = f"✨ {BASE}. The image contains text beginning with: \"{extracted}\" ✨\n\n#poster #flood #AI"
+
+    def timed(fn, *args):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn(*args)
+        return (time.perf_counter() - start) / rounds * 1e6
+
+    results = {}
+    legacy_us = timed(legacy_clean_text_for_speech, caption * 4)
+    fast_us = timed(clean_text_for_speech, caption * 4)
+    results["clean_text_for_speech"] = (legacy_us, fast_us)
+    legacy_us = timed(legacy_compose, BASE, extracted, OCR_ITEMS)
+    fast_us = timed(fast_compose, BASE, extracted, OCR_ITEMS)
+    results["ocr_merge_and_compose"] = (legacy_us, fast_us)
+    return results
+
+
+if __name__ == "__main__":
+    # PYTHONPATH=. python tests/test_text_processing.py
+    for name, (legacy_us, fast_us) in benchmark().items():
+        print(f"{name:24s} legacy {legacy_us:9.1f} us  fast {fast_us:9.1f} us  speedup {legacy_us / fast_us:5.1f}x")
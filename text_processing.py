@@ -0,0 +1,76 @@
+import re
+import string
+
+
+# Compiled once at import instead of on every caption
+_NON_SPEECH_CHARS = re.compile(r"[^\w\s.,!?\-'\"]|_")
+_HASHTAG = re.compile(r"(?<!\S)#\S*")
+_MISSING_SPACE_AFTER_PUNCT = re.compile(r"[.!?](?=[A-Z])")
+_OCR_KEY_STRIP = re.compile(r"[^a-zA-Z0-9\s]")
+
+# ASCII fast path for speech cleaning: delete everything except letters, digits, whitespace and .,!?-'"
+_SPEECH_KEEP_ASCII = set(string.ascii_letters + string.digits + string.whitespace + ".,!?-'\"")
+_SPEECH_DELETE_ASCII = str.maketrans("", "", "".join(chr(c) for c in range(128) if chr(c) not in _SPEECH_KEEP_ASCII))
+
+# Common OCR confusions in all-caps text
+_OCR_UPPERCASE_FIXES = str.maketrans({"|": "I", "0": "O"})
+
+OCR_SINGLE_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+
+
+def clean_text_for_speech(text):
+    """Drop hashtags, emojis and special characters but keep basic punctuation"""
+    text = _HASHTAG.sub(" ", text)
+    if text.isascii():
+        text = text.translate(_SPEECH_DELETE_ASCII)
+    else:
+        text = _NON_SPEECH_CHARS.sub("", text)
+    return " ".join(text.split())
+
+
+def normalize_ocr_key(text):
+    """Case- and punctuation-insensitive key used to deduplicate OCR detections"""
+    return _OCR_KEY_STRIP.sub("", text.lower().strip())
+
+
+def _space_after(match):
+    return match.group() + " "
+
+
+def tidy_ocr_text(text):
+    """Collapse whitespace, space out run-on sentences and fix common all-caps OCR errors"""
+    text = " ".join(text.split())
+    text = _MISSING_SPACE_AFTER_PUNCT.sub(_space_after, text).strip()
+    return text.translate(_OCR_UPPERCASE_FIXES) if text.isupper() else text
+
+
+def capitalize_sentences(caption):
+    """Strip and capitalize the first letter of each '. '-separated sentence"""
+    if not caption:
+        return caption
+    sentences = caption.strip().split(". ")
+    return ". ".join([s[:1].upper() + s[1:] for s in sentences])
+
+
+def compose_caption(base_caption, extracted_text):
+    """Merge a model caption with OCR text.
+
+    Returns (caption, text_content) where text_content is the cleaned OCR text,
+    or None when there was nothing worth including.
+    """
+    caption = capitalize_sentences(base_caption)
+    text_content = extracted_text.strip() if extracted_text else ""
+    if len(text_content) <= 1:
+        return caption, None
+
+    # Smart integration based on text length and content
+    if len(text_content) < 30:
+        caption = f"{caption}. The text reads: \"{text_content}\""
+    elif len(text_content) < 80:
+        caption = f"{caption}. The visible text states: \"{text_content}\""
+    else:
+        # Long text - include preview cut at a word boundary
+        preview = text_content[:100].rsplit(" ", 1)[0]
+        caption = f"{caption}. The image contains text beginning with: \"{preview}...\""
+    return caption, text_content
+
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+
+VALID_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+
+_listing_cache = {}
+_listing_lock = threading.Lock()
+
+
+def list_images(directory):
+    """Sorted image files in a directory, rescanned only when the directory itself changes"""
+    directory = Path(directory)
+    try:
+        # Adding, removing or renaming an entry bumps the directory mtime
+        dir_mtime = directory.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    key = str(directory.resolve())
+    with _listing_lock:
+        cached = _listing_cache.get(key)
+        if cached and cached[0] == dir_mtime:
+            return list(cached[1])
+
+    images = sorted(
+        p for p in directory.iterdir()
+        if p.is_file() and p.suffix.lower() in VALID_IMAGE_EXTENSIONS
+    )
+    with _listing_lock:
+        _listing_cache[key] = (dir_mtime, images)
+    return list(images)
+
+
+class ThumbnailCache:
+    """Generates small JPEG thumbnails once and serves them from memory or disk"""
+
+    def __init__(self, cache_dir=None, size=(320, 320), quality=80):
+        self.cache_dir = Path(cache_dir or Path(tempfile.gettempdir()) / "image_caption_thumbnails")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self.quality = quality
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        """Thumbnail identity: file path, byte size, mtime and thumbnail size"""
+        stat = path.stat()
+        raw = f"{path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{self.size[0]}x{self.size[1]}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _render(self, path):
+        with Image.open(path) as img:
+            # JPEG sources can decode straight at reduced scale
+            img.draft("RGB", self.size)
+            img.thumbnail(self.size)
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+            return buffer.getvalue()
+
+    def get(self, path):
+        """Return thumbnail JPEG bytes for an image file"""
+        path = Path(path)
+        key = self._key(path)
+        with self._lock:
+            data = self._memory.get(key)
+        if data is not None:
+            return data
+
+        thumb_path = self.cache_dir / f"{key}.jpg"
+        if thumb_path.exists():
+            data = thumb_path.read_bytes()
+        else:
+            data = self._render(path)
+            tmp_path = thumb_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(thumb_path)
+
+        with self._lock:
+            self._memory[key] = data
+        return data
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+# Split after ., ! or ? (optionally followed by a closing quote) when whitespace follows
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])["\']?\s+')
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:])\s+')
+
+
+def _split_long(piece, max_chars):
+    """Break a single over-long sentence at clause boundaries, then at word boundaries"""
+    parts = []
+    for clause in CLAUSE_BOUNDARY.split(piece):
+        while len(clause) > max_chars:
+            cut = clause.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            parts.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if clause:
+            parts.append(clause)
+    return parts
+
+
+def split_sentences(text, max_chars=200, first_chunk_chars=80):
+    """Split text into speakable chunks at sentence boundaries.
+
+    Short sentences are merged up to max_chars; the first chunk is kept small so
+    playback can start as early as possible.
+    """
+    pieces = []
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) > max_chars:
+            pieces.extend(_split_long(sentence, max_chars))
+        else:
+            pieces.append(sentence)
+
+    # A long opening sentence is cut at its first clause or word break within first_chunk_chars
+    if pieces and len(pieces[0]) > first_chunk_chars:
+        head = _split_long(pieces[0], first_chunk_chars)
+        pieces[:1] = head[:1] + ([" ".join(head[1:])] if len(head) > 1 else [])
+
+    chunks = []
+    for piece in pieces:
+        limit = first_chunk_chars if len(chunks) == 1 else max_chars
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= limit:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class ChunkedSpeechSynthesizer:
+    """Synthesizes text chunk by chunk in parallel, caching each chunk on disk"""
+
+    def __init__(self, router=None, cache_dir=None, max_workers=4, max_age_seconds=24 * 3600):
+        if router is None:
+            from language_engines import SpeechRouter
+            router = SpeechRouter()
+        self.router = router
+        self.cache_dir = Path(cache_dir or Path(tempfile.gettempdir()) / "image_caption_tts_chunks")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age_seconds = max_age_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-chunk")
+        self._cleanup_lock = threading.Lock()
+        self._last_cleanup = 0
+
+    def chunk_path(self, engine, chunk, lang, slow):
+        key = hashlib.sha1(f"{engine.name}|{lang}|{int(bool(slow))}|{chunk}".encode()).hexdigest()
+        return self.cache_dir / f"tts_chunk_{key}.{engine.audio_format}"
+
+    def _synthesize_one(self, engine, chunk, lang, slow):
+        """Return (path, cache_hit) for a single chunk"""
+        path = self.chunk_path(engine, chunk, lang, slow)
+        if path.exists() and path.stat().st_size > 0:
+            return path, True
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{path.suffix}")
+        engine.synthesize(chunk, lang, slow, str(tmp_path))
+        os.replace(tmp_path, path)
+        return path, False
+
+    def _cleanup(self):
+        """Drop cached chunks that have not been touched for a while (at most once a minute)"""
+        now = time.time()
+        with self._cleanup_lock:
+            if now - self._last_cleanup < 60:
+                return
+            self._last_cleanup = now
+        try:
+            for old_file in self.cache_dir.glob("tts_chunk_*"):
+                if old_file.stat().st_mtime < now - self.max_age_seconds:
+                    old_file.unlink()
+        except OSError:
+            pass
+
+    def _stream_with(self, engine, chunks, lang, slow, metrics, start):
+        futures = [self._pool.submit(self._synthesize_one, engine, chunk, lang, slow) for chunk in chunks]
+        cache_hits = 0
+        for index, (chunk, future) in enumerate(zip(chunks, futures)):
+            try:
+                path, hit = future.result()
+            except Exception:
+                for pending in futures[index + 1:]:
+                    pending.cancel()
+                raise
+            cache_hits += hit
+            if metrics is not None:
+                if index == 0:
+                    metrics["time_to_first_audio"] = time.perf_counter() - start
+                metrics["cache_hits"] = cache_hits
+            yield index, chunk, path
+
+    def stream(self, text, lang='en', slow=False, metrics=None):
+        """Yield (index, chunk_text, path) in playback order as soon as each chunk is ready.
+
+        All chunks of one request use the same engine so they can be joined into one file.
+        If a dict is passed as metrics it is filled with engine, time_to_first_audio,
+        total_seconds, chunks and cache_hits.
+        """
+        self._cleanup()
+        start = time.perf_counter()
+        chunks = split_sentences(text)
+        if metrics is not None:
+            metrics.update({"chunks": len(chunks), "cache_hits": 0, "time_to_first_audio": None})
+
+        errors = []
+        for engine in self.router.candidates(lang):
+            started = False
+            try:
+                for item in self._stream_with(engine, chunks, lang, slow, metrics, start):
+                    started = True
+                    yield item
+            except Exception as e:
+                self.router.mark_failed(engine, e)
+                if started:
+                    raise
+                # Nothing played yet, so fall back to the next engine
+                errors.append(f"{engine.name}: {e}")
+                continue
+            if metrics is not None:
+                metrics["engine"] = engine.name
+                metrics["total_seconds"] = time.perf_counter() - start
+            return
+        raise RuntimeError("; ".join(errors) or f"No speech engine available for '{lang}'")
+
+
+def combine_chunks(paths, out_path):
+    """Join audio chunks into one file (MP3 frames can be appended directly; WAV needs re-framing)"""
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    if str(out_path).endswith(".wav"):
+        from language_engines import concatenate_wav
+        concatenate_wav(paths, tmp_path)
+    else:
+        with open(tmp_path, "wb") as out:
+            for path in paths:
+                with open(path, "rb") as f:
+                    out.write(f.read())
+    os.replace(tmp_path, out_path)
+    return out_path
@@ -0,0 +1,355 @@
+import atexit
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+
+# Columns stored natively; any other user fields live in the JSON `extra` column
+CORE_FIELDS = ("password", "created_at", "last_login")
+
+
+class JsonUserStore:
+    """User store backed by a single JSON file (the original users.json format)"""
+
+    def __init__(self, path="users.json"):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error loading users: {e}")
+            return {}
+
+    def _write(self, users):
+        """Write atomically: dump to a temp file in the same directory, then rename over"""
+        tmp_path = None
+        try:
+            directory = self.path.parent if str(self.path.parent) else Path(".")
+            fd, tmp_path = tempfile.mkstemp(prefix=".users-", suffix=".json", dir=str(directory))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(users, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"Error saving users: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return False
+
+    def get(self, username):
+        """Return a copy of the user record or None"""
+        record = self._read().get(username)
+        return dict(record) if record is not None else None
+
+    def exists(self, username):
+        return username in self._read()
+
+    def count(self):
+        return len(self._read())
+
+    def add(self, username, record):
+        """Insert a new user; returns False if it already exists"""
+        with self._lock:
+            users = self._read()
+            if username in users:
+                return False
+            users[username] = dict(record)
+            return self._write(users)
+
+    def update(self, username, fields):
+        """Merge fields into an existing user record"""
+        with self._lock:
+            users = self._read()
+            if username not in users:
+                return False
+            users[username].update(fields)
+            return self._write(users)
+
+    def update_many(self, updates):
+        """Apply {username: fields} in a single read and a single rewrite"""
+        with self._lock:
+            users = self._read()
+            for username, fields in updates.items():
+                if username in users:
+                    users[username].update(fields)
+            return self._write(users)
+
+    def all_users(self):
+        return self._read()
+
+    def usernames(self):
+        return list(self._read().keys())
+
+    def close(self):
+        pass
+
+
+class SQLiteUserStore:
+    """User store backed by SQLite (WAL mode) with an in-memory read cache"""
+
+    def __init__(self, path="users.db"):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._data_version = None
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            # WAL lets readers in other processes proceed while a login is being written
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # username is the PRIMARY KEY, so every lookup is an index seek
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS users (
+                       username TEXT PRIMARY KEY,
+                       password TEXT NOT NULL,
+                       created_at TEXT,
+                       last_login TEXT,
+                       extra TEXT
+                   )"""
+            )
+            self._conn.commit()
+
+    def _row_to_record(self, row):
+        record = {
+            "password": row["password"],
+            "created_at": row["created_at"],
+            "last_login": row["last_login"],
+        }
+        if row["extra"]:
+            record.update(json.loads(row["extra"]))
+        return record
+
+    def _split_record(self, record):
+        extra = {k: v for k, v in record.items() if k not in CORE_FIELDS}
+        return (
+            record.get("password"),
+            record.get("created_at"),
+            record.get("last_login"),
+            json.dumps(extra) if extra else None,
+        )
+
+    def _check_external_writes(self):
+        """Drop the read cache if another connection (e.g. another worker process) committed"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def get(self, username):
+        """Return a copy of the user record or None"""
+        with self._lock:
+            self._check_external_writes()
+            if username in self._cache:
+                record = self._cache[username]
+                return dict(record) if record is not None else None
+            row = self._conn.execute(
+                "SELECT * FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            record = self._row_to_record(row) if row else None
+            self._cache[username] = record
+            return dict(record) if record is not None else None
+
+    def exists(self, username):
+        return self.get(username) is not None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def add(self, username, record):
+        """Insert a new user; returns False if it already exists"""
+        with self._lock:
+            try:
+                with self._conn:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO users (username, password, created_at, last_login, extra) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (username,) + self._split_record(record),
+                    )
+                self._cache.pop(username, None)
+                return cursor.rowcount == 1
+            except Exception as e:
+                print(f"Error saving user: {e}")
+                return False
+
+    def add_many(self, users):
+        """Bulk insert users, skipping usernames that already exist"""
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO users (username, password, created_at, last_login, extra) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(username,) + self._split_record(record) for username, record in users.items()],
+                )
+            self._cache.clear()
+
+    def update(self, username, fields):
+        """Merge fields into an existing user record"""
+        with self._lock:
+            current = self.get(username)
+            if current is None:
+                return False
+            current.update(fields)
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE users SET password = ?, created_at = ?, last_login = ?, extra = ? "
+                        "WHERE username = ?",
+                        self._split_record(current) + (username,),
+                    )
+                self._cache.pop(username, None)
+                return True
+            except Exception as e:
+                print(f"Error updating user: {e}")
+                return False
+
+    def update_many(self, updates):
+        """Apply {username: fields} in a single transaction"""
+        with self._lock:
+            rows = []
+            for username, fields in updates.items():
+                current = self.get(username)
+                if current is None:
+                    continue
+                current.update(fields)
+                rows.append(self._split_record(current) + (username,))
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE users SET password = ?, created_at = ?, last_login = ?, extra = ? "
+                        "WHERE username = ?",
+                        rows,
+                    )
+                for username in updates:
+                    self._cache.pop(username, None)
+                return True
+            except Exception as e:
+                print(f"Error updating users: {e}")
+                return False
+
+    def all_users(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM users").fetchall()
+            return {row["username"]: self._row_to_record(row) for row in rows}
+
+    def usernames(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT username FROM users ORDER BY username")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BatchedUpdateWriter:
+    """Buffers per-user metadata updates and flushes them to a store in coalesced batches"""
+
+    def __init__(self, store, flush_interval=0.5, max_batch=1000):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self.batches_written = 0
+        self.updates_written = 0
+        self._thread = threading.Thread(target=self._run, name="user-store-writer", daemon=True)
+        self._thread.start()
+        # Daemon threads are killed at exit, so make sure buffered updates land first
+        atexit.register(self.close)
+
+    def submit(self, username, fields):
+        """Queue an update; later fields for the same user overwrite earlier ones"""
+        with self._lock:
+            self._pending.setdefault(username, {}).update(fields)
+            backlog = len(self._pending)
+        if backlog >= self.max_batch:
+            self._wake.set()
+
+    def pending(self, username):
+        """Fields queued for a user but not yet written"""
+        with self._lock:
+            return dict(self._pending.get(username, {}))
+
+    def flush(self):
+        """Write everything queued so far in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            if not self.store.update_many(batch):
+                # Put the batch back underneath anything queued meanwhile and retry next cycle
+                with self._lock:
+                    for username, fields in batch.items():
+                        merged = dict(fields)
+                        merged.update(self._pending.get(username, {}))
+                        self._pending[username] = merged
+                return 0
+            self.batches_written += 1
+            self.updates_written += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing user updates: {e}")
+
+    def close(self):
+        """Stop the background writer and flush whatever is left"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+
+def migrate_json_to_sqlite(json_path, store):
+    """Copy users from a legacy users.json into a SQLite store and retire the JSON file"""
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return 0
+    users = JsonUserStore(json_path).all_users()
+    if users:
+        store.add_many(users)
+    # Keep the original around for rollback but stop it being migrated again
+    try:
+        json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+    except FileNotFoundError:
+        pass  # Another worker finished the migration first
+    return len(users)
+
+
+def create_user_store(backend=None, data_dir="."):
+    """Build the configured user store (USER_STORE_BACKEND=sqlite|json)"""
+    backend = (backend or os.environ.get("USER_STORE_BACKEND", "sqlite")).lower()
+    data_dir = Path(data_dir)
+    json_path = data_dir / "users.json"
+
+    if backend == "json":
+        return JsonUserStore(json_path)
+    if backend == "sqlite":
+        store = SQLiteUserStore(data_dir / "users.db")
+        migrated = migrate_json_to_sqlite(json_path, store)
+        if migrated:
+            print(f"Migrated {migrated} users from {json_path} to {store.path}")
+        return store
+    raise ValueError(f"Unknown user store backend: {backend}")
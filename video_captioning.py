@@ -0,0 +1,194 @@
+import argparse
+import time
+
+from PIL import Image
+
+
+VIDEO_TYPES = ['mp4', 'mov', 'avi', 'mkv', 'webm']
+
+
+def frame_histogram(frame_bgr, size=(160, 90)):
+    """Normalized 8x8x8 HSV histogram of a downscaled frame"""
+    import cv2
+    small = cv2.resize(frame_bgr, size, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1, 2], None, [8, 8, 8], [0, 180, 0, 256, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def select_keyframes(path, analysis_fps=4.0, threshold=0.35, min_scene_seconds=1.0,
+                     max_scene_seconds=10.0, max_keyframes=60, stats=None):
+    """Decode a video and return [(timestamp_seconds, PIL RGB frame)] at scene changes.
+
+    Only analysis_fps frames per second are retrieved and compared; the others are
+    grabbed (demuxed and decoded) but never converted. A frame becomes a keyframe
+    when its histogram's Bhattacharyya distance to the last keyframe exceeds
+    threshold, at least min_scene_seconds after it, or when max_scene_seconds pass
+    without a cut. After max_keyframes, the time of the next cut is recorded as
+    stats["truncated_at"] and the rest of the clip is not read; its length then
+    comes from the container's frame count.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    step = max(1, int(round(fps / analysis_fps)))
+
+    keyframes = []
+    last_hist = None
+    last_time = None
+    decoded = analyzed = 0
+    index = 0
+    truncated_at = None
+    try:
+        while True:
+            if not capture.grab():
+                break
+            decoded += 1
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                analyzed += 1
+                timestamp = index / fps
+                hist = frame_histogram(frame)
+                is_cut = (
+                    last_hist is None
+                    or (timestamp - last_time >= min_scene_seconds
+                        and cv2.compareHist(last_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > threshold)
+                    or timestamp - last_time >= max_scene_seconds
+                )
+                if is_cut and len(keyframes) >= max_keyframes:
+                    truncated_at = timestamp
+                    break
+                if is_cut:
+                    keyframes.append((timestamp, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))))
+                    last_hist, last_time = hist, timestamp
+            index += 1
+    finally:
+        capture.release()
+
+    # A clip read to the end counts its own frames; container counts can be estimates
+    total = max(frame_count, index) if truncated_at is not None else index
+    if stats is not None:
+        stats.update({
+            "fps": fps,
+            "duration_seconds": total / fps,
+            "frames_total": total,
+            "frames_decoded": decoded,
+            "frames_analyzed": analyzed,
+            "keyframes": len(keyframes),
+            "truncated_at": truncated_at,
+        })
+    return keyframes
+
+
+def caption_video(path, caption_batch, ocr=None, batch_size=4, **keyframe_options):
+    """Caption a clip's keyframes in batches and build timestamped cues.
+
+    caption_batch(list of PIL images) -> list of captions; ocr(PIL image) -> text or "".
+    Returns (cues, stats) where cues are dicts with start, end and text; consecutive
+    scenes with the same text are merged into one cue.
+    """
+    from text_processing import compose_caption
+
+    start = time.perf_counter()
+    stats = {}
+    keyframes = select_keyframes(path, stats=stats, **keyframe_options)
+
+    texts = []
+    for offset in range(0, len(keyframes), batch_size):
+        batch = [image for _, image in keyframes[offset:offset + batch_size]]
+        for image, base_caption in zip(batch, caption_batch(batch)):
+            extracted = ocr(image) if ocr else ""
+            texts.append(compose_caption(base_caption, extracted)[0])
+
+    cues = []
+    for i, ((timestamp, _), text) in enumerate(zip(keyframes, texts)):
+        # A truncated clip's last cue ends at the first cut that was not captioned
+        end = keyframes[i + 1][0] if i + 1 < len(keyframes) else (stats["truncated_at"] or stats["duration_seconds"])
+        if cues and cues[-1]["text"] == text:
+            cues[-1]["end"] = end
+        else:
+            cues.append({"start": timestamp, "end": end, "text": text})
+
+    stats["frames_inferred"] = len(keyframes)
+    stats["cues"] = len(cues)
+    stats["seconds"] = time.perf_counter() - start
+    return cues, stats
+
+
+def _timestamp(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def to_srt(cues):
+    blocks = [
+        f"{i}\n{_timestamp(cue['start'], ',')} --> {_timestamp(cue['end'], ',')}\n{cue['text']}\n"
+        for i, cue in enumerate(cues, 1)
+    ]
+    return "\n".join(blocks)
+
+
+def to_vtt(cues):
+    blocks = [f"{_timestamp(cue['start'], '.')} --> {_timestamp(cue['end'], '.')}\n{cue['text']}\n" for cue in cues]
+    return "WEBVTT\n\n" + "\n".join(blocks)
+
+
+def format_stats(stats):
+    """One-line summary of how much decoding and inference the keyframe selection saved"""
+    decoded = stats.get("frames_decoded", 0)
+    total = stats.get("frames_total", decoded)
+    inferred = stats.get("frames_inferred", 0)
+    saved = 100 * (1 - inferred / total) if total else 0
+    summary = (f"{decoded} frames decoded, {stats.get('frames_analyzed', 0)} analyzed, "
+               f"{inferred} captioned ({saved:.1f}% of inference skipped) in {stats.get('seconds', 0):.1f}s")
+    if stats.get("truncated_at") is not None:
+        summary += (f"; keyframe limit reached, captions stop at {stats['truncated_at']:.1f}s "
+                    f"of {stats.get('duration_seconds', 0):.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    from blip_acceleration import BATCH_BUCKETS, AcceleratedBlip
+    from image_enhance import enhance_for_caption
+    from model_artifacts import ArtifactStore, load_blip
+
+    parser = argparse.ArgumentParser(description="Caption a video clip into an SRT/VTT track")
+    parser.add_argument("video")
+    parser.add_argument("--format", choices=["srt", "vtt"], default="srt")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--threshold", type=float, default=0.35)
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    store = ArtifactStore()
+    if store.has("blip"):
+        processor, model = load_blip(store)
+    else:
+        from transformers import BlipForConditionalGeneration, BlipProcessor
+        model_id = "Salesforce/blip-image-captioning-base"
+        processor = BlipProcessor.from_pretrained(model_id)
+        model = BlipForConditionalGeneration.from_pretrained(model_id)
+    blip = AcceleratedBlip(processor, model, mode="off", buckets=BATCH_BUCKETS)
+    size = processor.image_processor.size
+    cues, stats = caption_video(
+        args.video,
+        lambda images: blip.generate([enhance_for_caption(im, (size["width"], size["height"])) for im in images]),
+        batch_size=args.batch_size,
+        threshold=args.threshold,
+    )
+    track = to_srt(cues) if args.format == "srt" else to_vtt(cues)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(track)
+    else:
+        print(track)
+    print(format_stats(stats))